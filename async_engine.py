@@ -0,0 +1,196 @@
+"""asyncio generation core with cancellable, deadline-bound turns.
+
+The blocking path (GameEngine.generate) sits in requests.post for up to
+REQUEST_TIMEOUT seconds and can only be stopped by killing its thread.
+AsyncGameEngine streams /api/generate with aiohttp instead: cancelling a
+turn closes the HTTP response, which also makes Ollama stop generating,
+and every turn runs under a deadline. Starting a new turn while one is in
+flight supersedes it: the stale turn is cancelled and abandoned (redo puts
+back the exchange it removed) before the new one is planned.
+
+Game rules stay in GameEngine; this module only replaces the transport.
+EngineLoop runs the event loop on a daemon thread so the Qt and terminal
+front-ends can submit turns from their own threads.
+
+aiohttp is the slowest import of the whole game, so it is only imported
+when the first session is created; EngineLoop loads it on a background
+thread at startup, while the player is still at the first prompt.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+
+from game_engine import CONNECTION_ERROR_MESSAGE, GameEngine, GenerationError, TurnPlan
+from scheduler import INTERACTIVE
+from streaming import STOP_SEQUENCES, GenerationStats, GenerateStreamReader
+from startup import preload
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+def create_session(config: dict, deadline: float) -> "aiohttp.ClientSession":
+    """A pooled aiohttp session for Ollama; must be created inside the event loop"""
+    import aiohttp
+
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=config["HTTP_POOL_SIZE"]),
+        # The turn deadline bounds the whole request; these only catch stalls
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=deadline),
+    )
+
+
+class AsyncGameEngine:
+    def __init__(self, engine: GameEngine, deadline: Optional[float] = None,
+                 session: Optional["aiohttp.ClientSession"] = None):
+        """session lets many engines share one connection pool; it is then not closed here"""
+        self.engine = engine
+        config = engine.config
+        self.deadline = deadline or config.get("GENERATION_DEADLINE", config["REQUEST_TIMEOUT"])
+        self.retries = config["HTTP_RETRIES"]
+        self._session = session
+        self._owns_session = session is None
+        self._current: Optional[asyncio.Task] = None
+
+    @property
+    def busy(self) -> bool:
+        return self._current is not None and not self._current.done()
+
+    async def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            self._session = create_session(self.engine.config, self.deadline)
+        return self._session
+
+    # ----- Generation -----
+    async def generate(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Stream one reply from Ollama; cancelling this coroutine aborts the request"""
+        import aiohttp
+
+        engine = self.engine
+        stream = engine.config["STREAM_RESPONSES"]
+        payload = engine.generation_payload(prompt, stream)
+        session = await self._get_session()
+        engine.state.last_generation_stats = None
+
+        try:
+            # Queue for a slot first; a turn cancelled while queued never reaches Ollama
+            async with engine.scheduler.slot(engine.session_id, INTERACTIVE):
+                started_at = time.monotonic()  # Timings leave out the queue wait
+                response = await self._post(session, payload)
+                try:
+                    response.raise_for_status()
+                    if stream:
+                        reader = GenerateStreamReader(on_token, STOP_SEQUENCES, started_at)
+                        async for line in response.content:
+                            if reader.feed_line(line):
+                                break
+                        reply, stats, _ = reader.finish()
+                    else:
+                        data = await response.json()
+                        reply = data.get("response", "").strip()
+                        stats = GenerationStats(total_time=time.monotonic() - started_at)
+                        stats.apply_final_chunk(data)
+                finally:
+                    # Closing (not releasing) drops the connection, so an
+                    # unfinished generation is aborted on the Ollama side too
+                    response.close()
+
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError as e:
+            # Includes aiohttp's socket read timeout, a ServerConnectionError subclass
+            engine.log_error("AI request timed out", e)
+            raise GenerationError("AI request timed out") from e
+        except aiohttp.ClientConnectionError as e:
+            engine.health.report_failure("Ollama", e)
+            engine.log_error("Cannot connect to Ollama server", e)
+            raise GenerationError(CONNECTION_ERROR_MESSAGE) from e
+        except Exception as e:
+            engine.log_error("Error getting AI response", e)
+            raise GenerationError(f"Error getting AI response: {e}") from e
+
+        return engine.record_generation(reply, stats)
+
+    async def _post(self, session: "aiohttp.ClientSession", payload: dict) -> "aiohttp.ClientResponse":
+        """POST with exponential backoff on connection failures only, like ServiceClient"""
+        import aiohttp
+
+        for attempt in range(self.retries + 1):
+            try:
+                return await session.post(self.engine.config["OLLAMA_URL"], json=payload)
+            except aiohttp.ClientConnectorError:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    # ----- Turns -----
+    async def play(self, plan_turn: Callable[[], TurnPlan],
+                   on_token: Optional[Callable[[str], None]] = None,
+                   deadline: Optional[float] = None) -> str:
+        """Supersede any turn in flight, then plan, generate and commit a new one.
+
+        Raises GenerationError on failure or when the deadline passes, and
+        CancelledError if this turn is itself superseded or cancelled.
+        """
+        while self.busy and self._current is not asyncio.current_task():
+            await self.cancel()
+        self._current = asyncio.current_task()
+
+        plan = plan_turn()
+        try:
+            reply = await asyncio.wait_for(self.generate(plan.prompt, on_token), deadline or self.deadline)
+        except asyncio.TimeoutError as e:
+            self.engine.abandon(plan)
+            self.engine.log_error("AI request passed its deadline", e)
+            raise GenerationError("AI request timed out") from e
+        except BaseException:
+            self.engine.abandon(plan)
+            raise
+        finally:
+            if self._current is asyncio.current_task():
+                self._current = None
+        return self.engine.commit(plan, reply)
+
+    async def opening_turn(self, on_token=None, deadline=None) -> str:
+        return await self.play(self.engine.plan_opening, on_token, deadline)
+
+    async def take_turn(self, player_input: str, on_token=None, deadline=None) -> str:
+        return await self.play(lambda: self.engine.plan_action(player_input), on_token, deadline)
+
+    async def redo(self, on_token=None, deadline=None) -> str:
+        return await self.play(self.engine.plan_redo, on_token, deadline)
+
+    async def cancel(self) -> None:
+        """Cancel the turn in flight (if any) and wait until it has been abandoned"""
+        task = self._current
+        if task is None or task is asyncio.current_task() or task.done():
+            return
+        task.cancel()
+        # wait() leaves the task's CancelledError to its own caller
+        await asyncio.wait({task})
+
+    async def close(self) -> None:
+        await self.cancel()
+        if self._session is not None and self._owns_session:
+            await self._session.close()
+            self._session = None
+
+
+class EngineLoop:
+    """An asyncio event loop on a daemon thread, for front-ends that are not async"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        preload("aiohttp")  # Ready by the first turn without delaying the first prompt
+
+    def submit(self, coroutine: Awaitable) -> Future:
+        """Run a coroutine on the loop; cancel() on the returned future cancels it"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
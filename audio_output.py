@@ -0,0 +1,189 @@
+"""Audio output: one callback-driven stream fed through a ring buffer.
+
+TTSPipeline used to write each chunk to a blocking stream in quarter-second
+slices, so every slice waited on the device and any delay in the playback
+thread became a gap. Samples from AllTalk were taken as raw int16 at
+whatever AUDIO_SAMPLE_RATE said, WAV header included, and the GUI's volume
+setting was never applied.
+
+AudioOutput opens one OutputStream for the life of the game. The device
+pulls samples from a ring buffer in its own callback, so consecutive chunks
+and utterances play back to back as long as the buffer is topped up, and
+silence is played when it runs dry. decode_wav() reads the real rate,
+sample width and channel count from the WAV header and mixes down to mono;
+to_output() resamples with np.interp, all in whole-array operations. Volume
+is applied in the callback, so a change is heard within one block.
+
+numpy and sounddevice are imported on first use (see startup.py).
+"""
+import io
+import struct
+import threading
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def decode_wav(data: bytes, default_rate: int) -> Tuple["np.ndarray", int]:
+    """Mono float32 samples in [-1, 1] and their sample rate.
+
+    Data without a RIFF header is taken as mono int16 at default_rate, which
+    is what older AllTalk versions send.
+    """
+    import numpy as np
+
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        usable = len(data) - len(data) % 2
+        return np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0, default_rate
+
+    stream = io.BytesIO(data)
+    stream.seek(12)
+    audio_format = channels = rate = bits = None
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            raise ValueError("WAV data has no data chunk")
+        chunk_id, size = struct.unpack("<4sI", header)
+        if chunk_id == b"fmt ":
+            fmt = stream.read(size + size % 2)[:size]  # Chunks are padded to an even size
+            audio_format, channels, rate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+            if audio_format == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                audio_format = struct.unpack("<H", fmt[24:26])[0]  # First two bytes of the sub-format GUID
+        elif chunk_id == b"data":
+            if audio_format is None:
+                raise ValueError("WAV data chunk comes before its fmt chunk")
+            payload = stream.read(size)  # Streamed WAVs may declare more than they carry
+            break
+        else:
+            stream.seek(size + size % 2, io.SEEK_CUR)
+
+    width = bits // 8
+    payload = payload[:len(payload) - len(payload) % (width * channels)]
+    if audio_format == WAVE_FORMAT_IEEE_FLOAT and width in (4, 8):
+        samples = np.frombuffer(payload, dtype=f"<f{width}").astype(np.float32)
+    elif audio_format == WAVE_FORMAT_PCM and width == 1:
+        samples = (np.frombuffer(payload, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif audio_format == WAVE_FORMAT_PCM and width == 3:
+        raw = np.frombuffer(payload, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8).astype(np.float32) / 8388608.0
+    elif audio_format == WAVE_FORMAT_PCM and width in (2, 4):
+        samples = np.frombuffer(payload, dtype=f"<i{width}").astype(np.float32) / float(2 ** (bits - 1))
+    else:
+        raise ValueError(f"Unsupported WAV format {audio_format} with {bits} bits per sample")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def to_output(samples: "np.ndarray", rate: int, output_rate: int) -> "np.ndarray":
+    """Resample mono float32 samples to output_rate"""
+    import numpy as np
+
+    if rate == output_rate or len(samples) < 2:
+        return np.asarray(samples, dtype=np.float32)
+    count = int(round(len(samples) * output_rate / rate))
+    positions = np.arange(count, dtype=np.float64) * (rate / output_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+class AudioOutput:
+    def __init__(self, sample_rate: int = 22050, buffer_seconds: float = 2.0, blocksize: int = 1024,
+                 volume: float = 1.0):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.volume = volume  # Gain applied as samples are played; 0.0 to 1.0
+        self.played = 0  # Samples handed to the device, silence excluded
+        self._capacity = int(sample_rate * buffer_seconds)
+        self._ring = None  # Allocated with the stream
+        self._read = 0  # Total samples read and written; positions are these modulo capacity
+        self._written = 0
+        self._cond = threading.Condition()
+        self._stream = None
+        self._closed = False
+
+    # ----- Feeding -----
+    def write(self, samples: "np.ndarray", cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """Queue float32 samples at sample_rate, blocking while the ring buffer is full.
+
+        Returns False if cancelled() became true (or the output was closed)
+        before everything was queued.
+        """
+        self._ensure_stream()
+        offset = 0
+        while offset < len(samples):
+            with self._cond:
+                while self._written - self._read >= self._capacity and not self._closed:
+                    if cancelled is not None and cancelled():
+                        return False
+                    self._cond.wait(0.05)
+                if self._closed or (cancelled is not None and cancelled()):
+                    return False
+                count = min(len(samples) - offset, self._capacity - (self._written - self._read))
+                start = self._written % self._capacity
+                first = min(count, self._capacity - start)
+                self._ring[start:start + first] = samples[offset:offset + first]
+                self._ring[:count - first] = samples[offset + first:offset + count]
+                self._written += count
+            offset += count
+        return True
+
+    def clear(self) -> None:
+        """Drop everything not yet played"""
+        with self._cond:
+            self._read = self._written
+            self._cond.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued has been played"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._read >= self._written or self._closed, timeout)
+
+    @property
+    def buffered_seconds(self) -> float:
+        return (self._written - self._read) / self.sample_rate
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    # ----- Device -----
+    def _ensure_stream(self) -> None:
+        if self._stream is not None:
+            return
+        import numpy as np
+        import sounddevice as sd
+
+        with self._cond:
+            if self._ring is None:
+                self._ring = np.zeros(self._capacity, dtype=np.float32)
+        self._stream = sd.OutputStream(
+            samplerate=self.sample_rate, channels=1, dtype="float32",
+            blocksize=self.blocksize, callback=self._callback
+        )
+        self._stream.start()
+
+    def _callback(self, outdata, frames, time_info, status) -> None:
+        """Runs on the audio thread: copy out what is buffered, silence for the rest"""
+        with self._cond:
+            available = self._written - self._read
+            count = min(frames, available)
+            start = self._read % self._capacity
+            first = min(count, self._capacity - start)
+            out = outdata[:, 0]
+            out[:first] = self._ring[start:start + first]
+            out[first:count] = self._ring[:count - first]
+            out[count:] = 0.0
+            self._read += count
+            self.played += count
+            self._cond.notify_all()
+        if self.volume != 1.0 and count:
+            out[:count] *= self.volume
@@ -0,0 +1,558 @@
+"""End-to-end benchmark: the terminal game against local stand-in servers.
+
+Starts a fake Ollama (/api/generate at a configurable token rate, streamed
+or not, plus /api/tags and /api/show) and a fake AllTalk (/api/tts-generate
+answering with synthetic 24 kHz int16 WAV audio) on 127.0.0.1, then plays
+main.AdventureGame through a scripted campaign without a terminal or an
+audio device. Nothing leaves the machine, so it runs offline in CI.
+
+Reported:
+    turn latency      p50/p95/p99/max of whole turns and of time to first token
+    prompt bytes      size of the prompts sent for turns, first and last turn
+    memory            RSS sampled every --memory-every turns, and its growth
+    save / load       auto-save times during play, loading the finished save
+    TTS               time to first audio and the silences between chunks
+
+Usage:
+    python benchmark.py                          # 1000 turns, summary on stdout
+    python benchmark.py --turns 200 --json out.json
+    python benchmark.py --baseline out.json      # exit 1 on a regression
+
+Everything is written to a temporary directory, which is removed afterwards.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+from typing import Dict, List
+
+import numpy as np
+from aiohttp import web
+
+import main
+from audio_output import AudioOutput
+from game_engine import GameEngine
+from story_memory import SUMMARY_PROMPT
+from structured_log import close_all
+from tts_pipeline import TTSPipeline
+
+SUMMARY_MARKER = SUMMARY_PROMPT.strip().splitlines()[-1]  # Tells summary requests from turns
+WAV_RATE = 24000  # AllTalk's XTTS rate; the pipeline resamples it to AUDIO_SAMPLE_RATE
+
+CAMPAIGN = [
+    "I look around the room carefully",
+    "I open the door to the north",
+    "I ask the innkeeper about the missing caravan",
+    "I draw my sword and step forward",
+    "I search the body for clues",
+    "I follow the tracks into the forest",
+    "I try to persuade the guard to let me pass",
+    "I climb the tower stairs",
+]
+
+# Metrics compared with --baseline; all of them are "lower is better"
+REGRESSION_METRICS = [
+    ("turn_latency", "p95"),
+    ("time_to_first_token", "p95"),
+    ("prompt_bytes", "max"),
+    ("memory", "growth_mb"),
+    ("save", "p95"),
+    ("load", "seconds"),
+    ("tts_gap", "p95"),
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def at(share):
+        return round(ordered[min(len(ordered) - 1, int(share * len(ordered)))], 6)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 6),
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": round(ordered[-1], 6),
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size; peak RSS where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+# ----- Stand-in servers -----
+class FakeServers:
+    """Fake Ollama and AllTalk on one event loop thread"""
+
+    def __init__(self, token_rate: float, reply_tokens: int, tts_latency: float,
+                 seconds_per_char: float, sample_rate: int, model: str):
+        self.token_rate = token_rate  # Tokens per second; 0 = as fast as possible
+        self.reply_tokens = reply_tokens
+        self.tts_latency = tts_latency
+        self.seconds_per_char = seconds_per_char  # Length of the synthetic speech
+        self.sample_rate = sample_rate
+        self.model = model
+        self.prompt_bytes: List[int] = []  # Turn prompts only, not summaries
+        self.summary_requests = 0
+        self.tts_requests = 0
+        self.tts_samples = 0
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._runners = []
+        self.ollama_port = self.alltalk_port = 0
+
+    def start(self) -> None:
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self.ollama_port = self._loop.run_until_complete(self._serve(self._ollama_app()))
+            self.alltalk_port = self._loop.run_until_complete(self._serve(self._alltalk_app()))
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-servers", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self) -> None:
+        async def cleanup():
+            for runner in self._runners:
+                await runner.cleanup()
+
+        asyncio.run_coroutine_threadsafe(cleanup(), self._loop).result(10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+
+    async def _serve(self, app: web.Application) -> int:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        self._runners.append(runner)
+        return runner.addresses[0][1]
+
+    # ----- Ollama -----
+    def _ollama_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", lambda request: web.Response(text="Ollama is running"))
+        app.router.add_post("/api/generate", self._generate)
+        app.router.add_get("/api/tags", self._tags)
+        app.router.add_post("/api/show", self._show)
+        return app
+
+    def _reply_tokens(self) -> List[str]:
+        words = ["The", "torchlight", "flickers", "across", "wet", "stone", "as", "something", "moves", "ahead"]
+        tokens = []
+        for i in range(self.reply_tokens):
+            word = words[i % len(words)]
+            tokens.append(f" {word}." if i % 12 == 11 else f" {word}")
+        return tokens
+
+    async def _pace(self, started: float, sent: int) -> None:
+        if self.token_rate > 0:
+            delay = started + sent / self.token_rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _generate(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        prompt = body.get("prompt", "")
+        stream = body.get("stream", True)
+        with self._lock:
+            if SUMMARY_MARKER in prompt:
+                self.summary_requests += 1
+            else:
+                self.prompt_bytes.append(len(prompt.encode("utf-8")))
+        tokens = self._reply_tokens()
+        started = time.monotonic()
+        final = {
+            "model": body.get("model", self.model), "done": True,
+            "prompt_eval_count": len(prompt) // 4, "prompt_eval_duration": 1_000_000,
+            "eval_count": len(tokens),
+        }
+
+        if not stream:
+            await self._pace(started, len(tokens))
+            final["eval_duration"] = max(1, int((time.monotonic() - started) * 1e9))
+            return web.json_response(dict(final, response="".join(tokens).strip()))
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for sent, token in enumerate(tokens, 1):
+            await self._pace(started, sent)
+            await response.write(json.dumps({"response": token, "done": False}).encode() + b"\n")
+        final["eval_duration"] = max(1, int((time.monotonic() - started) * 1e9))
+        await response.write(json.dumps(dict(final, response="")).encode() + b"\n")
+        await response.write_eof()
+        return response
+
+    async def _tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{
+            "name": self.model, "digest": "benchmark", "size": 4_700_000_000,
+            "details": {"family": "llama", "parameter_size": "8.0B", "quantization_level": "Q4_0"},
+        }]})
+
+    async def _show(self, request: web.Request) -> web.Response:
+        return web.json_response({"model_info": {"general.architecture": "llama", "llama.context_length": 8192}})
+
+    # ----- AllTalk -----
+    def _alltalk_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", lambda request: web.Response(text="AllTalk"))
+        app.router.add_post("/api/tts-generate", self._tts)
+        return app
+
+    async def _tts(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        text = str(form.get("text_input", ""))
+        await asyncio.sleep(self.tts_latency)
+        samples = max(1, int(len(text) * self.seconds_per_char * WAV_RATE))
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(WAV_RATE)
+            wav.writeframes(b"\x10\x00" * samples)
+        data = buffer.getvalue()
+        with self._lock:
+            self.tts_requests += 1
+            # What the pipeline will hand to the device once resampled
+            self.tts_samples += int(round(samples * self.sample_rate / WAV_RATE))
+        return web.Response(body=data, content_type="audio/wav")
+
+
+# ----- Headless audio -----
+class TimedOutput(AudioOutput):
+    """Stands in for the audio device: drains the ring buffer in (sped-up) real time
+    and records the stretches during which it played audio"""
+
+    def __init__(self, sample_rate: int, speedup: float, blocksize: int = 1024):
+        super().__init__(sample_rate, blocksize=blocksize)
+        self.speedup = speedup  # Plays this many times faster than real time
+        self.writes: List[list] = []  # [started, ended] of each stretch without silence
+        self._device = None
+
+    @property
+    def samples(self) -> int:
+        return self.played
+
+    def _ensure_stream(self) -> None:
+        if self._device is not None:
+            return
+        with self._cond:
+            if self._ring is None:
+                self._ring = np.zeros(self._capacity, dtype=np.float32)
+        self._device = threading.Thread(target=self._run, name="timed-output", daemon=True)
+        self._device.start()
+
+    def _run(self) -> None:
+        block = np.zeros((self.blocksize, 1), dtype=np.float32)
+        period = self.blocksize / self.sample_rate / self.speedup
+        playing = False
+        next_tick = time.monotonic()
+        while not self._closed:
+            started = time.monotonic()
+            before = self.played
+            self._callback(block, self.blocksize, None, None)
+            if self.played > before:
+                if playing:
+                    self.writes[-1][1] = started + period
+                else:
+                    self.writes.append([started, started + period])
+            playing = self.played - before == self.blocksize
+            next_tick += period
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+
+
+class BenchmarkTTSPipeline(TTSPipeline):
+    def __init__(self, *args, output: TimedOutput, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.output = output
+
+
+class MutedSpeech:
+    """Silent TTS for the campaign, so turn latency is measured without audio work"""
+
+    def feed(self, text, voice=None):
+        pass
+
+    def say(self, text, voice=None):
+        pass
+
+    def end_utterance(self, voice=None):
+        pass
+
+    def interrupt(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# ----- Benchmark -----
+class Benchmark:
+    def __init__(self, options: argparse.Namespace):
+        self.options = options
+        self.errors: List[str] = []
+
+    def run(self) -> dict:
+        options = self.options
+        workdir = tempfile.mkdtemp(prefix="dungeon-bench-")
+        previous_dir = os.getcwd()
+        previous_config = dict(main.CONFIG)
+        servers = FakeServers(
+            options.token_rate, options.reply_tokens, options.tts_latency,
+            options.seconds_per_char, main.CONFIG["AUDIO_SAMPLE_RATE"], main.CONFIG["DEFAULT_MODEL"],
+        )
+        servers.start()
+        os.chdir(workdir)
+        try:
+            main.CONFIG.update({
+                "OLLAMA_URL": f"http://127.0.0.1:{servers.ollama_port}/api/generate",
+                "OLLAMA_TAGS_URL": f"http://127.0.0.1:{servers.ollama_port}/api/tags",
+                "ALLTALK_API_URL": f"http://127.0.0.1:{servers.alltalk_port}/api/tts-generate",
+                "SAVE_FILE": "benchmark_save.txt",
+                "STREAM_RESPONSES": not options.no_stream,
+                "SHOW_GENERATION_STATS": False,
+                "STARTUP_BUDGET_MS": 0,
+            })
+            results = {"options": vars(options)}
+            results.update(self._campaign(servers))
+            results["load"] = self._load()
+            results["server"] = {
+                "summary_requests": servers.summary_requests,
+                "tts_requests": servers.tts_requests,
+            }
+            results["errors"] = self.errors
+            return results
+        finally:
+            os.chdir(previous_dir)
+            main.CONFIG.clear()
+            main.CONFIG.update(previous_config)
+            close_all()  # The logs are in workdir
+            servers.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _narrate(self, game: main.AdventureGame, turn) -> str:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return game.narrate(turn)
+
+    def _campaign(self, servers: FakeServers) -> dict:
+        options = self.options
+        game = main.AdventureGame()
+        game.tts.close()
+        game.tts = MutedSpeech()
+        game.log_tts_error = lambda message, e=None: self.errors.append(f"TTS: {message}")
+        latencies, first_tokens, saves, memory = [], [], [], []
+        try:
+            game.engine.new_adventure("Fantasy", "Ranger", "Bench")
+            if not self._narrate(game, game.async_engine.opening_turn):
+                raise RuntimeError("The opening turn failed; is the fake Ollama reachable?")
+            memory.append((0, rss_mb()))
+
+            for turn in range(1, options.turns + 1):
+                action = CAMPAIGN[turn % len(CAMPAIGN)]
+                started = time.perf_counter()
+                reply = self._narrate(game, lambda on_token: game.async_engine.take_turn(action, on_token))
+                latencies.append(time.perf_counter() - started)
+                if not reply:
+                    self.errors.append(f"Turn {turn} failed")
+                    continue
+                stats = game.state.last_generation_stats
+                if stats is not None and stats.time_to_first_token:
+                    first_tokens.append(stats.time_to_first_token)
+                if turn % options.save_every == 0:
+                    started = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        game.save_adventure()
+                    saves.append(time.perf_counter() - started)
+                if turn % options.memory_every == 0:
+                    memory.append((turn, rss_mb()))
+
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                game.save_adventure()
+            saves.append(time.perf_counter() - started)
+
+            tts = self._speech(game, servers)
+        finally:
+            game.shutdown()
+
+        prompt_bytes = servers.prompt_bytes[1:]  # Leave out the opening turn
+        return {
+            "turn_latency": percentiles(latencies),
+            "time_to_first_token": percentiles(first_tokens),
+            "prompt_bytes": dict(
+                percentiles(prompt_bytes),
+                first=prompt_bytes[0] if prompt_bytes else 0,
+                last=prompt_bytes[-1] if prompt_bytes else 0,
+            ),
+            "memory": {
+                "samples_mb": [(turn, round(mb, 1)) for turn, mb in memory],
+                # From the first sample after warm-up, so imports and caches filling up do not count
+                "growth_mb": round(memory[-1][1] - memory[min(1, len(memory) - 1)][1], 2),
+            },
+            "save": percentiles(saves),
+            **tts,
+        }
+
+    def _speech(self, game: main.AdventureGame, servers: FakeServers) -> dict:
+        """Play replies through the TTS pipeline into a timed output"""
+        options = self.options
+        output = TimedOutput(main.CONFIG["AUDIO_SAMPLE_RATE"], options.audio_speedup)
+        game.tts = BenchmarkTTSPipeline(
+            main.CONFIG["ALLTALK_API_URL"], main.CONFIG["AUDIO_SAMPLE_RATE"], main.CONFIG["TTS_PREFETCH_CHUNKS"],
+            on_error=game.log_tts_error, output=output,
+        )
+        first_audio, gaps = [], []
+        for reply_number in range(options.tts_replies):
+            action = CAMPAIGN[reply_number % len(CAMPAIGN)]
+            writes_before = len(output.writes)
+            requests_before = servers.tts_requests
+            started = time.monotonic()
+            if not self._narrate(game, lambda on_token: game.async_engine.take_turn(action, on_token)):
+                self.errors.append(f"TTS reply {reply_number} was not generated")
+                continue
+            if not self._wait_for_audio(output, servers, requests_before):
+                self.errors.append(f"TTS reply {reply_number} did not finish playing")
+                continue
+            writes = output.writes[writes_before:]
+            if writes:
+                first_audio.append(writes[0][0] - started)
+            gaps.extend(max(0.0, later[0] - earlier[1]) for earlier, later in zip(writes, writes[1:]))
+        game.tts.close()
+        return {
+            "tts_first_audio": percentiles(first_audio),
+            "tts_gap": dict(percentiles(gaps), total=round(sum(gaps), 6)),
+        }
+
+    def _wait_for_audio(self, output: TimedOutput, servers: FakeServers, requests_before: int,
+                        timeout: float = 60.0) -> bool:
+        """Wait until everything synthesized for a reply has been played and nothing new arrives"""
+        quiet = max(0.2, 5 * self.options.tts_latency)  # Longer than the pipeline takes to ask for the next chunk
+        deadline = time.monotonic() + timeout
+        last_change, last_seen = time.monotonic(), None
+        while time.monotonic() < deadline:
+            with servers._lock:
+                seen = (servers.tts_requests, servers.tts_samples, output.samples)
+            if seen != last_seen:
+                last_change, last_seen = time.monotonic(), seen
+            elif seen[0] > requests_before and seen[2] >= seen[1] and time.monotonic() - last_change >= quiet:
+                return True
+            time.sleep(0.005)
+        return False
+
+    def _load(self) -> dict:
+        """Load the finished save into a fresh engine, as starting the game again would"""
+        engine = GameEngine(main.CONFIG)
+        try:
+            started = time.perf_counter()
+            engine.load(main.CONFIG["SAVE_FILE"])
+            seconds = time.perf_counter() - started
+            return {
+                "seconds": round(seconds, 6),
+                "turns_loaded": len(engine.state.turns),
+                "save_bytes": os.path.getsize(main.CONFIG["SAVE_FILE"]),
+            }
+        finally:
+            engine.close()
+
+
+# ----- Reporting -----
+def print_summary(results: dict) -> None:
+    def ms(stats, key):
+        return f"{stats.get(key, 0) * 1000:8.2f}"
+
+    print(f"Turns: {results['turn_latency'].get('count', 0)}, errors: {len(results['errors'])}")
+    print(f"{'':24}{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label, key in (("Turn latency", "turn_latency"), ("Time to first token", "time_to_first_token"),
+                       ("Save", "save"), ("TTS time to first audio", "tts_first_audio"), ("TTS gap", "tts_gap")):
+        stats = results[key]
+        print(f"{label:24}{ms(stats, 'p50')} {ms(stats, 'p95')} {ms(stats, 'p99')} {ms(stats, 'max')}")
+    prompt = results["prompt_bytes"]
+    print(f"Prompt bytes: first {prompt.get('first', 0)}, last {prompt.get('last', 0)}, "
+          f"p95 {prompt.get('p95', 0)}, max {prompt.get('max', 0)}")
+    memory = results["memory"]
+    print(f"Memory: {memory['samples_mb'][0][1]} MB -> {memory['samples_mb'][-1][1]} MB "
+          f"(growth after warm-up {memory['growth_mb']} MB)")
+    load = results["load"]
+    print(f"Load: {load['seconds'] * 1000:.2f} ms for {load['turns_loaded']} turns ({load['save_bytes']} bytes)")
+    for error in results["errors"][:10]:
+        print(f"  error: {error}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float, slack: Dict[str, float]) -> List[str]:
+    """Metrics that got worse than baseline by more than tolerance (plus an absolute slack)"""
+    regressions = []
+    for section, key in REGRESSION_METRICS:
+        current = results.get(section, {}).get(key)
+        previous = baseline.get(section, {}).get(key)
+        if current is None or previous is None:
+            continue
+        limit = previous * (1 + tolerance) + slack.get(section, 0.0)
+        if current > limit:
+            regressions.append(f"{section}.{key}: {current} > {round(limit, 6)} (baseline {previous})")
+    return regressions
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the game end to end against local fake servers")
+    parser.add_argument("--turns", type=int, default=1000, help="Player turns in the campaign")
+    parser.add_argument("--token-rate", type=float, default=5000, help="Fake Ollama tokens per second (0 = unlimited)")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="Tokens per fake reply")
+    parser.add_argument("--no-stream", action="store_true", help="Ask for whole replies instead of streaming")
+    parser.add_argument("--save-every", type=int, default=5, help="Turns between auto-saves, like main.py")
+    parser.add_argument("--memory-every", type=int, default=100, help="Turns between memory samples")
+    parser.add_argument("--tts-replies", type=int, default=5, help="Replies spoken through the TTS pipeline")
+    parser.add_argument("--tts-latency", type=float, default=0.02, help="Fake AllTalk seconds per request")
+    parser.add_argument("--seconds-per-char", type=float, default=0.06, help="Length of the fake speech")
+    parser.add_argument("--audio-speedup", type=float, default=10.0, help="Play audio this many times faster")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results file to compare with; exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    options = parser.parse_args()
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)  # Read first: it may be the same file as --json
+    results = Benchmark(options).run()
+    print_summary(results)
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        # Small absolute margins keep timer noise on fast metrics from failing CI
+        slack = {"turn_latency": 0.005, "time_to_first_token": 0.005, "save": 0.005,
+                 "load": 0.005, "tts_gap": 0.005, "memory": 5.0, "prompt_bytes": 0}
+        regressions = compare(results, baseline, options.tolerance, slack)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+    if results["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,98 @@
+"""Token-budgeted prompt assembly shared by main.py and dungeonaigui.py.
+
+The prompt always starts with the Dungeon Master system prompt and the
+"### Adventure Setting ###" header. Whole turns are then packed newest-first
+until the model's num_ctx (minus room for the reply) is used up, so Ollama
+never has to truncate the prompt itself and nothing is cut mid-sentence.
+
+The window is sticky: the oldest included turn stays the same from one
+prompt to the next for as long as everything still fits, so the prompt
+prefix is byte-identical across turns and Ollama can reuse its KV cache
+instead of re-evaluating thousands of tokens. When the window overflows it
+jumps forward far enough to leave headroom for several more turns.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from turn_log import DUNGEON_MASTER, PLAYER, TurnLog
+
+# Rough characters-per-token ratio for Llama-family tokenizers on English
+# prose. Kept slightly low so the estimate errs on the side of more tokens.
+CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(length: int) -> int:
+    """Estimated token count for a piece of text of the given length"""
+    return int(length / CHARS_PER_TOKEN) + 1
+
+
+@dataclass
+class PromptContext:
+    """A prompt ready to send, plus what was left out of it"""
+    prompt: str
+    token_estimate: int
+    omitted_turns: int  # Oldest turns that did not fit in the window
+
+
+class ContextWindow:
+    def __init__(self, num_ctx: int = 4096, reserve_tokens: int = 512, refill_ratio: float = 0.75):
+        self.num_ctx = num_ctx
+        self.reserve_tokens = reserve_tokens  # Room left for the generated reply
+        self.refill_ratio = refill_ratio  # Share of the budget filled after the window jumps
+        self.anchor = 0  # Absolute index of the oldest turn in the last prompt
+
+    @property
+    def prompt_budget(self) -> int:
+        return max(0, self.num_ctx - self.reserve_tokens)
+
+    def build(self, system_prompt: str, turns: TurnLog,
+              player_input: Optional[str] = None, summary: str = "") -> PromptContext:
+        """Assemble the prompt for the next Dungeon Master reply.
+
+        summary (see StoryMemory.prompt_block) is pinned right after the
+        adventure setting header and stands in for turns that were left out.
+        """
+        pinned = len(system_prompt) + 2 + len(turns.header) + len(summary)
+        pinned += len(DUNGEON_MASTER) + 1
+        if player_input is not None:
+            pinned += len(PLAYER) + 3 + len(player_input)
+        used = estimate_tokens(pinned)
+
+        # Keep the previous starting turn while everything from it still fits
+        anchor = self.anchor - turns.dropped
+        if 0 <= anchor <= len(turns):
+            first_turn, total = self._pack(turns, used, self.prompt_budget, stop=anchor)
+            if first_turn > anchor:
+                # Overflowed: jump forward, leaving headroom for the next turns
+                first_turn, total = self._pack(turns, used, int(self.prompt_budget * self.refill_ratio))
+        else:
+            first_turn, total = self._pack(turns, used, self.prompt_budget)
+        used = total
+        self.anchor = turns.dropped + first_turn
+
+        body = turns.render_prompt(player_input, start=first_turn)
+        if summary:
+            body = turns.header + summary + body[len(turns.header):]
+        return PromptContext(
+            prompt=f"{system_prompt}\n\n{body}",
+            token_estimate=used,
+            omitted_turns=first_turn,
+        )
+
+    @staticmethod
+    def _pack(turns: TurnLog, used: int, budget: int, stop: int = 0):
+        """Walk back from the newest turn until the next one would not fit or stop is reached"""
+        first_turn = len(turns)
+        for turn in reversed(turns):
+            if first_turn <= stop:
+                break
+            cost = estimate_tokens(len(turn) + 1)
+            if used + cost > budget:
+                break
+            used += cost
+            first_turn -= 1
+        return first_turn, used
+
+    def reset(self) -> None:
+        """Forget the sticky starting turn, e.g. for a new or freshly loaded adventure"""
+        self.anchor = 0
@@ -1,36 +1,71 @@
+from startup import check_budget  # First, so the startup budget counts every import
+
 import sys
 import random
-import requests
-import sounddevice as sd
-import numpy as np
-import os
-import subprocess
 import datetime
 import time
 import json
-import traceback
+import re
+from functools import lru_cache
+from collections import deque
+from html import escape
 from pathlib import Path
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QTextEdit, QLineEdit, QPushButton, 
-                             QComboBox, QLabel, QGroupBox, QDialog, QListWidget,
+                             QComboBox, QLabel, QGroupBox, QDialog, QListWidget, QListWidgetItem,
                              QMessageBox, QSplitter, QProgressBar, QCheckBox,
                              QTabWidget, QScrollArea, QFrame, QSizePolicy, QFileDialog,
                              QSlider, QSpinBox, QDoubleSpinBox, QGraphicsDropShadowEffect,
                              QSystemTrayIcon, QMenu, QAction, QStyle)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QSettings, QRegExp, QPropertyAnimation, QEasingCurve
-from PyQt5.QtGui import QFont, QTextCursor, QPalette, QColor, QTextCharFormat, QSyntaxHighlighter, QRegExpValidator, QIcon, QPainter, QLinearGradient
+from PyQt5.QtCore import Qt, QObject, QThread, pyqtSignal, QTimer, QSettings, QPropertyAnimation, QEasingCurve
+from PyQt5.QtGui import QFont, QTextCursor, QPalette, QColor, QTextCharFormat, QTextDocumentFragment, QSyntaxHighlighter, QRegExpValidator, QIcon, QPainter, QLinearGradient
+
+from game_data import GENRE_DESCRIPTIONS, ROLE_STARTERS
+from game_engine import GameEngine, GenerationError
+from async_engine import AsyncGameEngine, EngineLoop
+from turn_log import DUNGEON_MASTER, PLAYER
+from save_index import SaveIndex
+from http_client import get_client
+from model_catalog import get_catalog
+from voice_library import DEFAULT_VOICE_DIRS, configure_library, get_library
+from tts_pipeline import DEFAULT_VOICE, TTSPipeline
+from tts_cache import TTSCache
 
 # Configuration - IMPROVED
 CONFIG = {
     "ALLTALK_API_URL": "http://localhost:7851/api/tts-generate",
+    "ALLTALK_VOICES_URL": "http://localhost:7851/api/voices",  # The voices AllTalk can use, when it is running
+    "VOICE_DIRS": DEFAULT_VOICE_DIRS,  # Folders indexed for voice files otherwise
+    "VOICE_INDEX_FILE": "voice_index.json",  # Voices and their details, from the last run
     "OLLAMA_URL": "http://localhost:11434/api/generate",
-    "LOG_FILE": "error_log.txt",
+    "LOG_FILE": "error_log.jsonl",
     "SAVE_DIR": "saves",
     "CONFIG_FILE": "config.ini",
     "AUTO_SAVE_INTERVAL": 300000,
-    "MAX_CONVERSATION_LENGTH": 10000,  # Prevent memory issues
+    "NUM_CTX": 4096,  # Model context window the prompt is packed into (or less, for models trained on shorter ones)
+    "MODEL_CACHE_FILE": "model_cache.json",  # Installed models and their details, from the last run
+    "SUMMARY_MAX_CHARS": 2000,  # Bound on the rolling summary of older turns
+    "SUMMARY_BATCH_TURNS": 6,  # Turns that must fall out of context before re-summarizing
     "REQUEST_TIMEOUT": 120,
-    "MAX_HISTORY_ITEMS": 100,  # Limit conversation history
+    "GENERATION_DEADLINE": 120,  # Seconds a whole reply may take before it is abandoned
+    "OLLAMA_TAGS_URL": "http://localhost:11434/api/tags",
+    "HTTP_POOL_SIZE": 10,  # Pooled connections shared by Ollama and AllTalk calls
+    "HTTP_RETRIES": 2,  # Retries (with backoff) for connection failures
+    "AUDIO_SAMPLE_RATE": 22050,  # Output device rate; AllTalk's audio is resampled to it
+    "AUDIO_BUFFER_SECONDS": 2.0,  # Audio queued ahead of the device, so chunks play back to back
+    "TTS_PREFETCH_CHUNKS": 2,  # Chunks synthesized ahead of the one playing
+    "TTS_CACHE_DIR": "tts_cache",  # Synthesized audio reused for repeated text
+    "TTS_CACHE_MAX_MB": 200,
+    "OLLAMA_KEEP_ALIVE": "30m",  # Keep the model loaded between turns
+    "HEALTH_TTL": 30,  # Seconds a server known to be up is trusted before it is probed again
+    "HEALTH_MAX_BACKOFF": 60,  # Longest wait between probes of a server that is down
+    "LOAD_DISPLAY_TURNS": 10,  # Turns shown after loading a save
+    "TRANSCRIPT_LIVE_ENTRIES": 200,  # Entries laid out in the story view; older ones come back on scroll-up
+    "TRANSCRIPT_PAGE_ENTRIES": 20,  # Older entries laid out per scroll to the top
+    "TRANSCRIPT_HISTORY": 5000,  # Entries kept for scroll-back and export
+    "STREAM_RESPONSES": True,  # Show the reply token by token as it is generated
+    "STATS_LOG_FILE": "generation_stats.jsonl",  # Per-reply timings, incl. prompt_eval_count for cache checks
+    "STARTUP_BUDGET_MS": 2500,  # Slower starts to the setup dialog are logged; see startup.py for a report
 }
 
 # Theme definitions - ADDED NEW THEMES
@@ -145,206 +180,305 @@ THEMES = {
     }
 }
 
-# Role-specific starting scenarios - EXPANDED
-ROLE_STARTERS = {
-    "Fantasy": {
-        "Peasant": "You're working in the fields of a small village when",
-        "Noble": "You're waking up from your bed in your mansion when",
-        "Mage": "You're studying ancient tomes in your tower when",
-        "Knight": "You're training in the castle courtyard when",
-        "Ranger": "You're tracking animals in the deep forest when",
-        "Thief": "You're casing a noble's house from an alley in a city when",
-        "Bard": "You're performing in a crowded tavern when",
-        "Cleric": "You're tending to the sick in the temple when",
-        "Assassin": "You're preparing to attack your target in the shadows when",
-        "Paladin": "You're praying at the altar of your deity when",
-        "Alchemist": "You're carefully measuring reagents in your alchemy lab when",
-        "Druid": "You're communing with nature in the sacred grove when",
-        "Warlock": "You're negotiating with your otherworldly patron when",
-        "Monk": "You're meditating in the monastery courtyard when",
-        "Sorcerer": "You're struggling to control your innate magical powers when",
-        "Beastmaster": "You're training your animal companions in the forest clearing when",
-        "Enchanter": "You're imbuing magical properties into a mundane object when",
-        "Blacksmith": "You're forging a new weapon at your anvil when",
-        "Merchant": "You're haggling with customers at the marketplace when",
-        "Gladiator": "You're preparing for combat in the arena when",
-        "Wizard": "You're researching new spells in your arcane library when"
-    },
-    "Sci-Fi": {
-        "Space Marine": "You're conducting patrol on a derelict space station when",
-        "Scientist": "You're analyzing alien samples in your lab when",
-        "Android": "You're performing system diagnostics on your ship when",
-        "Pilot": "You're navigating through an asteroid field when",
-        "Engineer": "You're repairing the FTL drive when",
-        "Alien Diplomat": "You're negotiating with an alien delegation when",
-        "Bounty Hunter": "You're tracking a target through a spaceport when",
-        "Starship Captain": "You're commanding the bridge during warp travel when",
-        "Space Pirate": "You're plotting your next raid from your starship's bridge when",
-        "Navigator": "You're charting a course through uncharted space when",
-        "Robot Technician": "You're repairing a malfunctioning android when",
-        "Cybernetic Soldier": "You're calibrating your combat implants when",
-        "Explorer": "You're scanning a newly discovered planet when",
-        "Astrobiologist": "You're studying alien life forms in your lab when",
-        "Quantum Hacker": "You're breaching a corporate firewall when",
-        "Galactic Trader": "You're negotiating a deal for rare resources when",
-        "AI Specialist": "You're debugging a sentient AI's personality matrix when",
-        "Terraformer": "You're monitoring atmospheric changes on a new colony world when",
-        "Cyberneticist": "You're installing neural enhancements in a patient when"
-    },
-    "Cyberpunk": {
-        "Hacker": "You're infiltrating a corporate network when",
-        "Street Samurai": "You're patrolling the neon-lit streets when",
-        "Corporate Agent": "You're closing a deal in a high-rise office when",
-        "Techie": "You're modifying cyberware in your workshop when",
-        "Rebel Leader": "You're planning a raid on a corporate facility when",
-        "Cyborg": "You're calibrating your cybernetic enhancements when",
-        "Drone Operator": "You're controlling surveillance drones from your command center when",
-        "Synth Dealer": "You're negotiating a deal for illegal cybernetics when",
-        "Information Courier": "You're delivering sensitive data through dangerous streets when",
-        "Augmentation Engineer": "You're installing cyberware in a back-alley clinic when",
-        "Black Market Dealer": "You're arranging contraband in your hidden shop when",
-        "Scumbag": "You're looking for an easy mark in the slums when",
-        "Police": "You're patrolling the neon-drenched streets when"
-    },
-    "Post-Apocalyptic": {
-        "Survivor": "You're scavenging in the ruins of an old city when",
-        "Scavenger": "You're searching a pre-collapse bunker when",
-        "Raider": "You're ambushing a convoy in the wasteland when",
-        "Medic": "You're treating radiation sickness in your clinic when",
-        "Cult Leader": "You're preaching to your followers at a ritual when",
-        "Mutant": "You're hiding your mutations in a settlement when",
-        "Trader": "You're bartering supplies at a wasteland outpost when",
-        "Berserker": "You're sharpening your weapons for the next raid when",
-        "Soldier": "You're guarding a settlement from raiders when"
-    },
-    "1880": {
-        "Thief": "You're lurking in the shadows of the city alleyways when",
-        "Beggar": "You're sitting on the cold street corner with your cup when",
-        "Detective": "You're examining a clue at the crime scene when",
-        "Rich Man": "You're enjoying a cigar in your luxurious study when",
-        "Factory Worker": "You're toiling away in the noisy factory when",
-        "Child": "You're playing with a hoop in the street when",
-        "Orphan": "You're searching for scraps in the trash bins when",
-        "Murderer": "You're cleaning blood from your hands in a dark alley when",
-        "Butcher": "You're sharpening your knives behind the counter when",
-        "Baker": "You're kneading dough in the early morning hours when",
-        "Banker": "You're counting stacks of money in your office when",
-        "Policeman": "You're walking your beat on the foggy streets when"
-    },
-    "WW1": {
-        "Soldier (French)": "You're huddled in the muddy trenches of the Western Front when",
-        "Soldier (English)": "You're writing a letter home by candlelight when",
-        "Soldier (Russian)": "You're shivering in the frozen Eastern Front when",
-        "Soldier (Italian)": "You're climbing the steep Alpine slopes when",
-        "Soldier (USA)": "You're arriving fresh to the European theater when",
-        "Soldier (Japanese)": "You're guarding a Pacific outpost when",
-        "Soldier (German)": "You're preparing for a night raid when",
-        "Soldier (Austrian)": "You're defending the crumbling empire's borders when",
-        "Soldier (Bulgarian)": "You're holding the line in the Balkans when",
-        "Civilian": "You're queuing for rationed bread when",
-        "Resistance Fighter": "You're transmitting coded messages in an attic when"
-    },
-    "WW2": {
-        "Soldier (American)": "You're storming the beaches of Normandy under heavy German fire when",
-        "Soldier (British)": "You're preparing for the D-Day invasion aboard a troop ship when",
-        "Soldier (Russian)": "You're defending Stalingrad house by house against the German advance when",
-        "Soldier (German)": "You're manning a machine gun nest on the Atlantic Wall when",
-        "Soldier (Italian)": "You're retreating through the Italian countryside after the Allied invasion when",
-        "Soldier (French)": "You're joining the French Resistance after the fall of Paris when",
-        "Soldier (Japanese)": "You're defending a Pacific island against American marines when",
-        "Soldier (Canadian)": "You're fighting through the rubble of a French town during the liberation when",
-        "Soldier (Australian)": "You're battling Japanese forces in the jungles of New Guinea when",
-        "Resistance Fighter": "You're sabotaging German supply lines under cover of darkness when",
-        "Spy": "You're transmitting coded messages from occupied territory when",
-        "Pilot (RAF)": "You're scrambling to intercept German bombers during the Battle of Britain when",
-        "Pilot (Luftwaffe)": "You're flying a bombing mission over England when",
-        "Tank Commander": "You're leading a Sherman tank through the Ardennes forest when",
-        "Sniper": "You're concealed in a ruined building, watching for enemy movement when",
-        "Medic": "You're treating wounded soldiers under fire on the front lines when",
-        "Naval Officer": "You're commanding a destroyer in the North Atlantic convoy when",
-        "Paratrooper": "You're jumping into enemy territory behind German lines when",
-        "Commando": "You're conducting a covert raid on a German occupied facility when"
-    },
-    "1925 New York": {
-        "Mafia Boss": "You're counting your illicit earnings in a backroom speakeasy when",
-        "Drunk": "You're stumbling out of a jazz club at dawn when",
-        "Police Officer": "You're taking bribes from a known bootlegger when",
-        "Detective": "You're examining a gangland murder scene when",
-        "Factory Worker": "You're assembling Model Ts on the production line when",
-        "Bootlegger": "You're transporting a shipment of illegal hooch when"
-    },
-    "Roman Empire": {
-        "Slave": "You're carrying heavy stones under the hot sun when",
-        "Gladiator": "You're sharpening your sword before entering the arena when",
-        "Beggar": "You're pleading for coins near the Forum when",
-        "Senator": "You're plotting political maneuvers in the Curia when",
-        "Imperator": "You're reviewing legions from your palace balcony when",
-        "Soldier": "You're marching on the frontier when",
-        "Noble": "You're hosting a decadent feast in your villa when",
-        "Trader": "You're haggling over spices in the market when",
-        "Peasant": "You're tending your meager crops when",
-        "Priest": "You're sacrificing a goat at the temple when",
-        "Barbarian": "You're sharpening your axe beyond the limes when",
-        "Philosopher": "You're contemplating the nature of existence when",
-        "Mathematician": "You're calculating the circumference of the Earth when",
-        "Semi-God": "You're channeling divine powers on Mount Olympus when"
-    },
-    "French Revolution": {
-        "Peasant": "You're marching toward the Bastille with a pitchfork when",
-        "King": "You're dining lavishly while Paris starves when",
-        "Noble": "You're hiding your family jewels from revolutionaries when",
-        "Beggar": "You're rummaging through aristocratic trash bins when",
-        "Soldier": "You're guarding the Tuileries Palace when",
-        "General": "You're planning troop deployments against rebels when",
-        "Resistance": "You're printing revolutionary pamphlets in secret when",
-        "Politician": "You're giving a fiery speech at the National Assembly when"
-    }
-}
-
-# Genre descriptions - EXPANDED
-GENRE_DESCRIPTIONS = {
-    "Fantasy": "You are in a world of magic and medieval fantasy, where dragons soar through the skies and ancient ruins hold forgotten treasures.",
-    "Sci-Fi": "You are in the distant future, with advanced technology, space travel, and alien civilizations among the stars.",
-    "Cyberpunk": "You are in a dystopian future dominated by megacorporations, where cybernetic enhancements are common and the line between human and machine is blurred.",
-    "Post-Apocalyptic": "You are in a world after a catastrophic event, where civilization has collapsed and survivors scavenge among the ruins of the old world.",
-    "1880": "You are in the late 19th century during the Industrial Revolution, a time of steam power, early electricity, and social upheaval.",
-    "WW1": "You are in the trenches and battlefields of World War I, a brutal conflict that introduced modern warfare to the world.",
-    "WW2": "You are in the global conflict of World War II, fighting across Europe, the Pacific, and beyond with modern weaponry and tactics.",
-    "1925 New York": "You are in the Roaring Twenties in New York City, a time of jazz, prohibition, organized crime, and economic prosperity.",
-    "Roman Empire": "You are in ancient Rome at the height of its power, with gladiators, legions, and political intrigue in the eternal city.",
-    "French Revolution": "You are in France during the revolution, a time of upheaval where the monarchy was overthrown and the reign of terror began."
-}
-
-
-# IMPROVED DM system prompt with better guidance
-DM_SYSTEM_PROMPT = """
-You are a masterful Dungeon Master in an unrestricted adventure. Your role is to narrate the consequences of player actions naturally. Follow these rules:
-
-1. ACTION-CONSEQUENCE SYSTEM:
-   - Describe ONLY the consequences of the player's action
-   - Never perform actions on behalf of the player
-   - Consequences must logically follow from the action
-   - Narrate consequences naturally within the story flow
-
-2. RESPONSE STYLE:
-   - Describe what happens in the world as a result of the player's action
-   - Keep responses concise but immersive (2-4 paragraphs)
-   - Show, don't tell - demonstrate through description
-   - Use sensory details to enhance immersion
+# ----- Stylesheets -----
+@lru_cache(maxsize=None)
+def theme_stylesheet(theme_name):
+    """Application stylesheet for a theme, built once per theme.
+    
+    Widgets carry no sheets of their own: buttons pick their rules by the
+    `variant` property, labels and inputs by `role`, and the setup and load
+    dialogs by `themed`. Switching themes is one setStyleSheet on the
+    application and one re-polish.
+    """
+    theme = THEMES.get(theme_name, THEMES["Classic Dark"])
+    primary = QColor(theme["primary"])
+    selection = f"rgba({primary.red()}, {primary.green()}, {primary.blue()}, 0.3)"
+    return f"""
+        QMainWindow {{
+            background: {theme["background"]};
+        }}
+        QLabel[role="heading"] {{
+            color: white;
+            font-size: 28px;
+            font-weight: bold;
+            font-family: 'Segoe UI', Arial, sans-serif;
+        }}
+        QLabel[role="subtitle"] {{
+            color: {theme["accent"]};
+            font-size: 14px;
+            font-style: italic;
+        }}
+        QTextEdit[role="transcript"] {{
+            background: {theme["text_area"]};
+            color: {theme["text"]};
+            border: 2px solid rgba(255,255,255,0.1);
+            border-radius: 15px;
+            padding: 20px;
+            font-family: 'Segoe UI', Arial, sans-serif;
+            font-size: 12pt;
+            selection-background-color: {selection};
+        }}
+        QLabel[role="status"] {{
+            background: rgba(255,255,255,0.1);
+            color: {theme["accent"]};
+            padding: 8px 15px;
+            border-radius: 10px;
+            border: 1px solid rgba(255,255,255,0.2);
+            font-size: 11px;
+            font-weight: bold;
+        }}
+        QLineEdit[role="command"] {{
+            background: rgba(255,255,255,0.1);
+            color: {theme["text"]};
+            border: 2px solid rgba(255,255,255,0.3);
+            border-radius: 12px;
+            padding: 15px;
+            font-size: 13px;
+            font-family: 'Segoe UI', Arial, sans-serif;
+            min-height: 25px;
+        }}
+        QLineEdit[role="command"]:focus {{
+            border: 2px solid {theme["primary"]};
+            background: rgba(255,255,255,0.15);
+        }}
+        QLineEdit[role="command"]:disabled {{
+            background: rgba(255,255,255,0.05);
+            color: #888888;
+        }}
+        QPushButton[variant="primary"] {{
+            background: {theme["button_primary"]};
+            color: white;
+            border: none;
+            border-radius: 12px;
+            padding: 12px 24px;
+            font-weight: bold;
+            font-size: 13px;
+            min-height: 20px;
+        }}
+        QPushButton[variant="primary"]:disabled {{
+            background: #555555;
+            color: #888888;
+        }}
+        QPushButton[variant="secondary"] {{
+            background: {theme["button_secondary"]};
+            color: white;
+            border: none;
+            border-radius: 12px;
+            padding: 10px 20px;
+            font-weight: bold;
+            font-size: 12px;
+            min-height: 18px;
+        }}
+        QPushButton[variant="danger"] {{
+            background: {theme["button_danger"]};
+            color: white;
+            border: none;
+            border-radius: 12px;
+            padding: 10px 20px;
+            font-weight: bold;
+            font-size: 12px;
+            min-height: 18px;
+        }}
+        QGroupBox {{
+            background: {theme["group_box"]};
+            border: 1px solid rgba(255,255,255,0.2);
+            border-radius: 15px;
+            margin-top: 10px;
+            padding-top: 15px;
+            font-weight: bold;
+            color: {theme["text"]};
+        }}
+        QGroupBox::title {{
+            subcontrol-origin: margin;
+            left: 15px;
+            padding: 0 8px 0 8px;
+            color: {theme["accent"]};
+            font-weight: bold;
+            font-size: 13px;
+        }}
+        QProgressBar {{
+            border: 2px solid rgba(255,255,255,0.3);
+            border-radius: 10px;
+            text-align: center;
+            color: {theme["text"]};
+            font-weight: bold;
+            background: rgba(0,0,0,0.3);
+            height: 20px;
+        }}
+        QProgressBar::chunk {{
+            background: {theme["button_primary"]};
+            border-radius: 8px;
+        }}
+        QDialog[themed="true"] {{
+            background: {theme["background"]};
+            color: {theme["text"]};
+            font-family: 'Segoe UI', Arial, sans-serif;
+        }}
+        QDialog[themed="true"] QLabel {{
+            color: {theme["text"]};
+            font-size: 12px;
+        }}
+        QDialog[themed="true"] QLabel#title {{
+            color: white;
+            font-size: 24px;
+            font-weight: bold;
+            qproperty-alignment: AlignCenter;
+        }}
+        QDialog[themed="true"] QLabel#subtitle {{
+            color: {theme["accent"]};
+            font-size: 14px;
+            qproperty-alignment: AlignCenter;
+        }}
+        QDialog[themed="true"] QLabel[role="description"] {{
+            background: rgba(255,255,255,0.08);
+            color: {theme["text"]};
+            padding: 15px;
+            border-radius: 10px;
+            border: 1px solid rgba(255,255,255,0.1);
+            font-size: 12px;
+        }}
+        QDialog[themed="true"] QLabel[role="value"] {{
+            color: {theme["accent"]};
+            font-weight: bold;
+        }}
+        QDialog[themed="true"] QComboBox {{
+            background: rgba(255,255,255,0.1);
+            border: 2px solid rgba(255,255,255,0.3);
+            border-radius: 8px;
+            padding: 10px;
+            color: {theme["text"]};
+            font-size: 12px;
+            min-height: 20px;
+        }}
+        QDialog[themed="true"] QComboBox:focus {{
+            border: 2px solid {theme["primary"]};
+        }}
+        QDialog[themed="true"] QComboBox QAbstractItemView {{
+            background: #2d3748;
+            border: 1px solid #4a5568;
+            color: {theme["text"]};
+            selection-background-color: {theme["primary"]};
+        }}
+        QDialog[themed="true"] QLineEdit {{
+            background: rgba(255,255,255,0.1);
+            border: 2px solid rgba(255,255,255,0.3);
+            border-radius: 8px;
+            padding: 12px;
+            color: {theme["text"]};
+            font-size: 13px;
+            min-height: 25px;
+        }}
+        QDialog[themed="true"] QLineEdit:focus {{
+            border: 2px solid {theme["primary"]};
+        }}
+        QDialog[themed="true"] QTextEdit {{
+            background: rgba(255,255,255,0.1);
+            border: 2px solid rgba(255,255,255,0.3);
+            border-radius: 8px;
+            padding: 8px;
+            color: {theme["text"]};
+            font-size: 12px;
+        }}
+        QDialog[themed="true"] QSpinBox {{
+            background: rgba(255,255,255,0.1);
+            border: 2px solid rgba(255,255,255,0.3);
+            border-radius: 8px;
+            padding: 8px;
+            color: {theme["text"]};
+            min-height: 20px;
+        }}
+        QDialog[themed="true"] QCheckBox {{
+            color: {theme["text"]};
+            spacing: 8px;
+        }}
+        QDialog[themed="true"] QCheckBox::indicator {{
+            width: 16px;
+            height: 16px;
+            border: 2px solid rgba(255,255,255,0.5);
+            border-radius: 4px;
+            background: rgba(255,255,255,0.1);
+        }}
+        QDialog[themed="true"] QCheckBox::indicator:checked {{
+            background: {theme["primary"]};
+            border: 2px solid {theme["primary"]};
+        }}
+        QDialog[themed="true"] QSlider::groove:horizontal {{
+            border: 1px solid rgba(255,255,255,0.3);
+            height: 6px;
+            background: rgba(255,255,255,0.1);
+            border-radius: 3px;
+        }}
+        QDialog[themed="true"] QSlider::handle:horizontal {{
+            background: {theme["button_primary"]};
+            border: 2px solid rgba(255,255,255,0.8);
+            width: 18px;
+            margin: -7px 0;
+            border-radius: 9px;
+        }}
+        QDialog[themed="true"] QTabWidget::pane {{
+            border: 1px solid rgba(255,255,255,0.2);
+            border-radius: 15px;
+            background: rgba(255,255,255,0.05);
+            margin-top: 10px;
+        }}
+        QDialog[themed="true"] QTabBar::tab {{
+            background: rgba(255,255,255,0.1);
+            color: #cccccc;
+            padding: 12px 20px;
+            margin: 2px;
+            border-top-left-radius: 8px;
+            border-top-right-radius: 8px;
+        }}
+        QDialog[themed="true"] QTabBar::tab:selected {{
+            background: {selection};
+            color: white;
+            border-bottom: 2px solid {theme["primary"]};
+        }}
+        QDialog[themed="true"] QTabBar::tab:hover {{
+            background: rgba(255,255,255,0.2);
+        }}
+        QDialog[themed="true"] QListWidget {{
+            background: rgba(0,0,0,0.25);
+            border: 1px solid rgba(255,255,255,0.2);
+            border-radius: 8px;
+            color: {theme["text"]};
+            font-size: 12px;
+        }}
+        QDialog[themed="true"] QListWidget::item {{
+            padding: 8px;
+            border-bottom: 1px solid rgba(255,255,255,0.08);
+        }}
+        QDialog[themed="true"] QListWidget::item:selected {{
+            background: {theme["primary"]};
+            color: white;
+        }}
+        QMessageBox {{
+            background: #2d2d2d;
+            color: {theme["text"]};
+        }}
+        QMessageBox QLabel {{
+            color: {theme["text"]};
+        }}
+        QMessageBox QPushButton {{
+            background: #404040;
+            color: {theme["text"]};
+            border: 1px solid #555;
+            padding: 5px 15px;
+            border-radius: 4px;
+        }}
+        QMessageBox QPushButton:hover {{
+            background: #505050;
+        }}
+    """
 
-3. WORLD EVOLUTION:
-   - NPCs remember player choices and react accordingly
-   - Environments change based on actions
-   - Maintain consistency with established world facts
 
-4. PLAYER AGENCY:
-   - The player can attempt anything
-   - Show realistic results, good or bad
-   - Let the world react dynamically
-   
+def apply_stylesheet(theme_name):
+    """Style the whole application with a theme; a no-op if it already is"""
+    app = QApplication.instance()
+    sheet = theme_stylesheet(theme_name)
+    if app.styleSheet() != sheet:
+        app.setStyleSheet(sheet)
 
-Always stay in character as the Dungeon Master. Continue the adventure naturally.
-"""
 
 class VoiceScanner(QThread):
     voices_ready = pyqtSignal(list)
@@ -353,49 +487,10 @@ class VoiceScanner(QThread):
         super().__init__(parent)
         
     def run(self):
-        """Scan for available voices with better error handling"""
-        voices = []
-        
-        # Common AllTalk voice directories to check
-        voice_directories = [
-            Path.home() / "alltalk_tts" / "voices",
-            Path.cwd() / "voices",
-            Path("/opt/alltalk_tts/voices"),
-            Path("C:/Program Files/alltalk_tts/voices"),
-            Path("./alltalk_tts/voices"),  # NEW: Added current directory
-        ]
-        
-        # Common voice file extensions
-        voice_extensions = ['.wav', '.mp3', '.ogg', '.flac']
-        
-        # Default voices that are commonly available
-        default_voices = [
-            "FemaleBritishAccent_WhyLucyWhy_Voice_2.wav",
-            "MaleBritishAccent.wav",
-            "FemaleAmericanAccent.wav",
-            "MaleAmericanAccent.wav",
-            "narrator.wav"
-        ]
-        
-        # First, add default voices
-        for voice in default_voices:
-            voices.append(voice)
-        
-        # Scan directories for additional voices with better error handling
-        for directory in voice_directories:
-            if directory.exists():
-                try:
-                    for file_path in directory.iterdir():
-                        if file_path.is_file() and file_path.suffix.lower() in voice_extensions:
-                            voices.append(file_path.name)
-                except (PermissionError, OSError) as e:
-                    print(f"Permission error scanning {directory}: {e}")
-                except Exception as e:
-                    print(f"Error scanning directory {directory}: {e}")
-        
-        # Remove duplicates and sort
-        voices = sorted(list(set(voices)))
-        self.voices_ready.emit(voices)
+        """Bring the voice library up to date; emits VoiceInfo entries"""
+        library = get_library()
+        library.refresh()
+        self.voices_ready.emit(library.cached())
 
 # NEW: Model Scanner Thread
 class ModelScanner(QThread):
@@ -406,54 +501,19 @@ class ModelScanner(QThread):
         super().__init__(parent)
         
     def run(self):
-        """Scan for available Ollama models with better error handling"""
-        try:
-            # Try using Ollama REST API first (more reliable)
-            try:
-                response = requests.get("http://localhost:11434/api/tags", timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    models = [model["name"] for model in data.get("models", [])]
-                    self.models_ready.emit(models)
-                    return
-            except requests.exceptions.RequestException:
-                pass  # Fall back to CLI
-            
-            # Fallback to CLI method
-            result = subprocess.run(
-                ["ollama", "list"], 
-                capture_output=True, 
-                text=True, 
-                timeout=15,  # Increased timeout
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            
-            if result.returncode == 0:
-                lines = result.stdout.strip().splitlines()
-                models = []
-                for line in lines[1:]:  # Skip header
-                    parts = line.split()
-                    if parts:
-                        model_name = parts[0]
-                        if ':' in model_name:
-                            models.append(model_name)
-                
-                self.models_ready.emit(models)
-            else:
-                self.error_occurred.emit("Ollama not found or not running")
-                
-        except subprocess.TimeoutExpired:
-            self.error_occurred.emit("Ollama command timed out")
-        except FileNotFoundError:
-            self.error_occurred.emit("Ollama not installed")
-        except Exception as e:
-            self.error_occurred.emit(f"Error scanning models: {str(e)}")
+        """Refresh the model catalog from Ollama; emits ModelInfo entries"""
+        catalog = get_catalog()
+        if catalog.refresh():
+            self.models_ready.emit(catalog.cached())
+        elif catalog.cached():
+            self.models_ready.emit(catalog.cached())  # Ollama is down; keep what it said last time
+        else:
+            self.error_occurred.emit("Ollama not found or not running")
 
 class ModernButton(QPushButton):
-    def __init__(self, text, parent=None, theme=None):
+    def __init__(self, text, parent=None):
         super().__init__(text, parent)
         self.setCursor(Qt.PointingHandCursor)
-        self.theme = theme or THEMES["Classic Dark"]
         
         # Add shadow effect
         shadow = QGraphicsDropShadowEffect()
@@ -463,344 +523,137 @@ class ModernButton(QPushButton):
         self.setGraphicsEffect(shadow)
         
     def setVariant(self, variant="primary"):
-        # IMPROVED: Better button styling with transitions
-        if variant == "primary":
-            self.setStyleSheet(f"""
-                QPushButton {{
-                    background: {self.theme["button_primary"]};
-                    color: white;
-                    border: none;
-                    border-radius: 12px;
-                    padding: 12px 24px;
-                    font-weight: bold;
-                    font-size: 13px;
-                    min-height: 20px;
-                    transition: all 0.2s ease;
-                }}
-                QPushButton:hover {{
-                    background: {self.theme["button_primary"].replace('stop:0', 'stop:0').replace('stop:1', 'stop:1')};
-                    opacity: 0.9;
-                    transform: translateY(-1px);
-                }}
-                QPushButton:pressed {{
-                    background: {self.theme["button_primary"].replace('stop:0', 'stop:0').replace('stop:1', 'stop:1')};
-                    opacity: 0.8;
-                    transform: translateY(1px);
-                }}
-                QPushButton:disabled {{
-                    background: #555555;
-                    color: #888888;
-                }}
-            """)
-        elif variant == "secondary":
-            self.setStyleSheet(f"""
-                QPushButton {{
-                    background: {self.theme["button_secondary"]};
-                    color: white;
-                    border: none;
-                    border-radius: 12px;
-                    padding: 10px 20px;
-                    font-weight: bold;
-                    font-size: 12px;
-                    min-height: 18px;
-                    transition: all 0.2s ease;
-                }}
-                QPushButton:hover {{
-                    background: {self.theme["button_secondary"].replace('stop:0', 'stop:0').replace('stop:1', 'stop:1')};
-                    opacity: 0.9;
-                    transform: translateY(-1px);
-                }}
-                QPushButton:pressed {{
-                    background: {self.theme["button_secondary"].replace('stop:0', 'stop:0').replace('stop:1', 'stop:1')};
-                    opacity: 0.8;
-                    transform: translateY(1px);
-                }}
-            """)
-        elif variant == "danger":
-            self.setStyleSheet(f"""
-                QPushButton {{
-                    background: {self.theme["button_danger"]};
-                    color: white;
-                    border: none;
-                    border-radius: 12px;
-                    padding: 10px 20px;
-                    font-weight: bold;
-                    font-size: 12px;
-                    min-height: 18px;
-                    transition: all 0.2s ease;
-                }}
-                QPushButton:hover {{
-                    background: {self.theme["button_danger"].replace('stop:0', 'stop:0').replace('stop:1', 'stop:1')};
-                    opacity: 0.9;
-                    transform: translateY(-1px);
-                }}
-                QPushButton:pressed {{
-                    background: {self.theme["button_danger"].replace('stop:0', 'stop:0').replace('stop:1', 'stop:1')};
-                    opacity: 0.8;
-                    transform: translateY(1px);
-                }}
-            """)
+        """primary, secondary or danger; the colors come from the application stylesheet"""
+        self.setProperty("variant", variant)
+        self.style().unpolish(self)
+        self.style().polish(self)
 
 class ModernGroupBox(QGroupBox):
-    def __init__(self, title, parent=None, theme=None):
+    def __init__(self, title, parent=None):
         super().__init__(title, parent)
-        self.theme = theme or THEMES["Classic Dark"]
-        self.apply_theme()
         
         shadow = QGraphicsDropShadowEffect()
         shadow.setBlurRadius(20)
         shadow.setColor(QColor(0, 0, 0, 60))
         shadow.setOffset(0, 6)
         self.setGraphicsEffect(shadow)
-    
-    def apply_theme(self):
-        self.setStyleSheet(f"""
-            QGroupBox {{
-                background: {self.theme["group_box"]};
-                border: 1px solid rgba(255,255,255,0.2);
-                border-radius: 15px;
-                margin-top: 10px;
-                padding-top: 15px;
-                font-weight: bold;
-                color: {self.theme["text"]};
-            }}
-            QGroupBox::title {{
-                subcontrol-origin: margin;
-                left: 15px;
-                padding: 0 8px 0 8px;
-                color: {self.theme["accent"]};
-                font-weight: bold;
-                font-size: 13px;
-            }}
-        """)
 
-class ModernProgressBar(QProgressBar):
-    def __init__(self, parent=None, theme=None):
-        super().__init__(parent)
-        self.theme = theme or THEMES["Classic Dark"]
-        self.apply_theme()
-    
-    def apply_theme(self):
-        self.setStyleSheet(f"""
-            QProgressBar {{
-                border: 2px solid rgba(255,255,255,0.3);
-                border-radius: 10px;
-                text-align: center;
-                color: {self.theme["text"]};
-                font-weight: bold;
-                background: rgba(0,0,0,0.3);
-                height: 20px;
-            }}
-            QProgressBar::chunk {{
-                background: {self.theme["button_primary"]};
-                border-radius: 8px;
-            }}
-        """)
+# Transcript entry kinds besides the two speakers, and the block state each is highlighted by
+NOTICE = "notice"
+SYSTEM = "system"  # Notices about the engine itself, e.g. turns dropped from the AI's context
+BLOCK_STATES = {PLAYER: 1, DUNGEON_MASTER: 2, NOTICE: 3, SYSTEM: 4}
+COMMAND_PATTERN = re.compile(r"/[a-zA-Z]+")
+
+
+@lru_cache(maxsize=1024)
+def command_spans(text):
+    """(start, length) of each /command in a notice, in the UTF-16 units Qt counts in"""
+    spans = []
+    for match in COMMAND_PATTERN.finditer(text):
+        start = len(text[:match.start()].encode("utf-16-le")) // 2
+        spans.append((start, match.end() - match.start()))
+    return tuple(spans)
+
 
 class SyntaxHighlighter(QSyntaxHighlighter):
+    """Colors transcript blocks by the kind of entry they belong to.
+
+    TranscriptView stores each entry's kind in its blocks' user state as it
+    inserts them, so highlighting a block is a dictionary lookup; only notices
+    are scanned, for /commands, and their spans are cached by text. Formats
+    are built once here rather than per block.
+    """
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.highlighting_rules = []
         
         # Player text format
         player_format = QTextCharFormat()
         player_format.setForeground(QColor("#4FC3F7"))
         player_format.setFontWeight(QFont.Bold)
-        self.highlighting_rules.append((QRegExp("You:.*"), player_format))
         
         # DM text format
         dm_format = QTextCharFormat()
         dm_format.setForeground(QColor("#81C784"))
-        self.highlighting_rules.append((QRegExp("Dungeon Master:.*"), dm_format))
         
         # System text format
         system_format = QTextCharFormat()
         system_format.setForeground(QColor("#FFB74D"))
         system_format.setFontItalic(True)
-        self.highlighting_rules.append((QRegExp("---.*---"), system_format))
+        
+        self.block_formats = {
+            BLOCK_STATES[PLAYER]: player_format,
+            BLOCK_STATES[DUNGEON_MASTER]: dm_format,
+            BLOCK_STATES[SYSTEM]: system_format,
+        }
         
         # Command text format
-        command_format = QTextCharFormat()
-        command_format.setForeground(QColor("#BA68C8"))
-        command_format.setFontWeight(QFont.Bold)
-        self.highlighting_rules.append((QRegExp("/[a-zA-Z]+.*"), command_format))
+        self.command_format = QTextCharFormat()
+        self.command_format.setForeground(QColor("#BA68C8"))
+        self.command_format.setFontWeight(QFont.Bold)
 
     def highlightBlock(self, text):
-        for pattern, format in self.highlighting_rules:
-            expression = QRegExp(pattern)
-            index = expression.indexIn(text)
-            while index >= 0:
-                length = expression.matchedLength()
-                self.setFormat(index, length, format)
-                index = expression.indexIn(text, index + length)
+        state = self.currentBlockState()
+        block_format = self.block_formats.get(state)
+        if block_format is not None:
+            self.setFormat(0, len(text.encode("utf-16-le")) // 2, block_format)
+        elif state == BLOCK_STATES[NOTICE]:
+            for start, length in command_spans(text):
+                self.setFormat(start, length, self.command_format)
 
-# NEW: Improved AI Worker with better error handling and memory management
-class AIWorker(QThread):
+# NEW: Runs one AsyncGameEngine turn on the engine loop; results come back as Qt signals
+class AIWorker(QObject):
     response_ready = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     progress_update = pyqtSignal(int)
+    token_ready = pyqtSignal(str)  # NEW: streamed text as it is generated
 
-    def __init__(self, prompt, model, temperature=0.7, max_tokens=512, parent=None):
+    def __init__(self, engine_loop, turn, max_tokens=512, parent=None):
         super().__init__(parent)
-        self.prompt = prompt
-        self.model = model
-        self.temperature = temperature
+        self.engine_loop = engine_loop
+        self.turn = turn  # AsyncGameEngine turn method, called with on_token
         self.max_tokens = max_tokens
-        self.is_running = True
+        self.tokens_received = 0
+        self.future = None
 
-    def run(self):
-        try:
-            self.progress_update.emit(10)
-            response = self.get_ai_response(self.prompt, self.model)
-            self.progress_update.emit(100)
-            if response:
-                self.response_ready.emit(response)
-            else:
-                self.error_occurred.emit("Failed to get response from AI.")
-        except Exception as e:
-            self.error_occurred.emit(f"Error in AI processing: {str(e)}")
-
-    def get_ai_response(self, prompt, model):
-        try:
-            response = requests.post(
-                CONFIG["OLLAMA_URL"],
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": self.temperature,
-                        "stop": ["\n\n", "Player:", "Dungeon Master:"],
-                        "min_p": 0.05,
-                        "top_k": 40,
-                        "top_p": 0.9,
-                        "num_predict": self.max_tokens
-                    }
-                },
-                timeout=CONFIG["REQUEST_TIMEOUT"]
-            )
-            response.raise_for_status()
-            return response.json().get("response", "").strip()
-        except requests.exceptions.Timeout:
-            raise Exception("AI request timed out")
-        except requests.exceptions.ConnectionError:
-            raise Exception("Cannot connect to Ollama server. Make sure Ollama is running on localhost:11434")
-        except Exception as e:
-            self.log_error("Error in get_ai_response", e)
-            return ""
+    def start(self):
+        self.progress_update.emit(10)
+        self.future = self.engine_loop.submit(self.turn(on_token=self.on_token))
+        self.future.add_done_callback(self.on_finished)
 
-    def log_error(self, error_message, exception=None):
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        try:
-            with open(CONFIG["LOG_FILE"], "a", encoding="utf-8") as log_file:
-                log_file.write(f"\n\n--- ERROR [{timestamp}] ---\n")
-                log_file.write(f"Message: {error_message}\n")
-                
-                if exception:
-                    log_file.write(f"Exception Type: {type(exception).__name__}\n")
-                    log_file.write(f"Exception Details: {str(exception)}\n")
-                    log_file.write("Traceback:\n")
-                    traceback.print_exc(file=log_file)
-                    
-                log_file.write("--- END ERROR ---\n")
-        except Exception as e:
-            print(f"Failed to write to error log: {e}")
+    def isRunning(self):
+        return self.future is not None and not self.future.done()
 
-# NEW: Improved TTS Worker with better chunking and error handling
-class TTSWorker(QThread):
-    finished = pyqtSignal()
-    error_occurred = pyqtSignal(str)
+    def cancel(self):
+        """Abort the generation; the engine restores the story before the next turn starts"""
+        if self.future is not None:
+            self.future.cancel()
 
-    def __init__(self, text, voice, enabled=True, parent=None):
-        super().__init__(parent)
-        self.text = text
-        self.voice = voice
-        self.enabled = enabled
-
-    def run(self):
-        if not self.enabled:
-            self.finished.emit()
+    def on_finished(self, future):
+        # Called on the engine loop thread; the signals are queued to the UI thread
+        if future.cancelled():
             return
-            
         try:
-            self.speak(self.text, self.voice)
-            self.finished.emit()
+            response = future.result()
+        except GenerationError as e:
+            self.error_occurred.emit(str(e))
+            return
         except Exception as e:
-            self.error_occurred.emit(f"Error in TTS: {str(e)}")
+            self.error_occurred.emit(f"Error in AI processing: {str(e)}")
+            return
+        self.progress_update.emit(100)
+        self.response_ready.emit(response)
 
-    def speak(self, text, voice="FemaleBritishAccent_WhyLucyWhy_Voice_2.wav"):
-        try:
-            if not text.strip():
-                return
-                
-            # IMPROVED: Better text chunking for long responses
-            sentences = text.split('. ')
-            chunks = []
-            current_chunk = ""
-            
-            for sentence in sentences:
-                if len(current_chunk + sentence) < 150:  # Smaller chunks for better performance
-                    current_chunk += sentence + ". "
-                else:
-                    if current_chunk:
-                        chunks.append(current_chunk)
-                    current_chunk = sentence + ". "
-            if current_chunk:
-                chunks.append(current_chunk)
-                
-            for i, chunk in enumerate(chunks):
-                if not chunk.strip():
-                    continue
-                    
-                payload = {
-                    "text_input": chunk,
-                    "character_voice_gen": voice,
-                    "narrator_enabled": "true",
-                    "narrator_voice_gen": "narrator.wav",
-                    "text_filtering": "none",
-                    "output_file_name": f"output_{i}",
-                    "autoplay": "true",
-                    "autoplay_volume": "0.8"
-                }
-                
-                r = requests.post(CONFIG["ALLTALK_API_URL"], data=payload, timeout=30)
-                r.raise_for_status()
-                
-                content_type = r.headers.get("Content-Type", "")
-                
-                if content_type.startswith("audio/"):
-                    audio = np.frombuffer(r.content, dtype=np.int16)
-                    try:
-                        devices = sd.query_devices()
-                        sd.play(audio, samplerate=22050)
-                        sd.wait()
-                    except Exception as audio_error:
-                        self.error_occurred.emit(f"Audio playback error: {audio_error}")
-                        
-                elif content_type.startswith("application/json"):
-                    try:
-                        error_data = r.json()
-                        error_msg = error_data.get("error", "Unknown error from AllTalk API")
-                        self.error_occurred.emit(f"AllTalk API error: {error_msg}")
-                    except:
-                        self.error_occurred.emit("AllTalk API returned JSON but couldn't parse it")
-                        
-                else:
-                    self.error_occurred.emit(f"Unexpected response from AllTalk API. Content-Type: {content_type}")
-                    
-        except requests.exceptions.Timeout:
-            self.error_occurred.emit("AllTalk API timeout. Text-to-speech disabled.")
-        except requests.exceptions.ConnectionError:
-            self.error_occurred.emit("Cannot connect to AllTalk server. Text-to-speech disabled.")
-        except Exception as e:
-            self.error_occurred.emit(f"Unexpected error in speak function: {str(e)}")
+    def on_token(self, token):
+        self.tokens_received += 1
+        self.token_ready.emit(token)
+        # num_predict caps the reply length, so it doubles as the progress scale
+        self.progress_update.emit(min(99, 10 + int(90 * self.tokens_received / max(1, self.max_tokens))))
 
 class ModernSetupDialog(QDialog):
     def __init__(self, settings, parent=None):
         super().__init__(parent)
         self.settings = settings
         self.current_theme_name = self.settings.value("theme", "Classic Dark")
-        self.current_theme = THEMES.get(self.current_theme_name, THEMES["Classic Dark"])
         self.setWindowTitle("🎮 Adventure Setup - Choose Your Destiny")
         self.setModal(True)
         self.setMinimumWidth(800)
@@ -818,17 +671,23 @@ class ModernSetupDialog(QDialog):
         self.init_ui()
         self.load_settings()
         
-        # Start scanning
+        # Start scanning; voices and models cached from the last run are shown right away
+        if get_library().cached():
+            self.on_voices_ready(get_library().cached())
         self.voice_scanner.start()
-        self.model_scanner.start()
+        catalog = get_catalog()
+        if catalog.cached():
+            self.on_models_ready(catalog.cached())
+        if catalog.stale or not catalog.cached():
+            self.model_scanner.start()
         
     def init_ui(self):
         layout = QVBoxLayout()
         layout.setSpacing(20)
         layout.setContentsMargins(30, 30, 30, 30)
         
-        # Apply theme
-        self.apply_theme_stylesheet()
+        # Styled by the application stylesheet
+        self.setProperty("themed", True)
         
         # Header
         header_label = QLabel("🚀 Adventure Setup")
@@ -841,14 +700,6 @@ class ModernSetupDialog(QDialog):
         layout.addSpacing(20)
         
         tab_widget = QTabWidget()
-        tab_widget.setStyleSheet("""
-            QTabWidget::pane {
-                border: 1px solid rgba(255,255,255,0.2);
-                border-radius: 15px;
-                background: rgba(255,255,255,0.05);
-                margin-top: 10px;
-            }
-        """)
         
         # Basic Settings Tab
         basic_tab = QWidget()
@@ -857,7 +708,7 @@ class ModernSetupDialog(QDialog):
         basic_layout.setContentsMargins(25, 25, 25, 25)
         
         # Theme selection
-        theme_group = ModernGroupBox("🎨 Theme Selection", theme=self.current_theme)
+        theme_group = ModernGroupBox("🎨 Theme Selection")
         theme_layout = QVBoxLayout()
         self.theme_combo = QComboBox()
         self.theme_combo.addItems(THEMES.keys())
@@ -869,7 +720,7 @@ class ModernSetupDialog(QDialog):
         basic_layout.addWidget(theme_group)
         
         # Model selection
-        model_group = ModernGroupBox("🤖 AI Model Configuration", theme=self.current_theme)
+        model_group = ModernGroupBox("🤖 AI Model Configuration")
         model_layout = QVBoxLayout()
         self.model_combo = QComboBox()
         self.model_combo.setEditable(True)
@@ -878,10 +729,10 @@ class ModernSetupDialog(QDialog):
         model_layout.addWidget(self.model_combo)
         
         model_button_layout = QHBoxLayout()
-        self.refresh_models_button = ModernButton("🔄 Refresh Models", theme=self.current_theme)
+        self.refresh_models_button = ModernButton("🔄 Refresh Models")
         self.refresh_models_button.setVariant("secondary")
         self.refresh_models_button.clicked.connect(self.refresh_models)
-        self.test_model_button = ModernButton("🧪 Test Connection", theme=self.current_theme)
+        self.test_model_button = ModernButton("🧪 Test Connection")
         self.test_model_button.setVariant("secondary")
         self.test_model_button.clicked.connect(self.test_model_connection)
         
@@ -895,7 +746,7 @@ class ModernSetupDialog(QDialog):
         # Genre and Role selection
         genre_role_layout = QHBoxLayout()
         
-        genre_group = ModernGroupBox("🌍 Adventure Genre", theme=self.current_theme)
+        genre_group = ModernGroupBox("🌍 Adventure Genre")
         genre_layout = QVBoxLayout()
         self.genre_combo = QComboBox()
         self.genre_combo.addItems(ROLE_STARTERS.keys())
@@ -905,22 +756,14 @@ class ModernSetupDialog(QDialog):
         
         self.genre_desc = QLabel()
         self.genre_desc.setWordWrap(True)
-        self.genre_desc.setStyleSheet(f"""
-            background: rgba(255,255,255,0.08); 
-            color: {self.current_theme["text"]}; 
-            padding: 15px; 
-            border-radius: 10px; 
-            border: 1px solid rgba(255,255,255,0.1);
-            font-size: 12px;
-            line-height: 1.4;
-        """)
+        self.genre_desc.setProperty("role", "description")
         self.genre_desc.setMinimumHeight(80)
         self.genre_desc.setMaximumHeight(100)
         genre_layout.addWidget(self.genre_desc)
         genre_group.setLayout(genre_layout)
         genre_role_layout.addWidget(genre_group)
         
-        role_group = ModernGroupBox("👤 Character Role", theme=self.current_theme)
+        role_group = ModernGroupBox("👤 Character Role")
         role_layout = QVBoxLayout()
         self.role_combo = QComboBox()
         role_layout.addWidget(QLabel("Select Role:"))
@@ -928,15 +771,7 @@ class ModernSetupDialog(QDialog):
         
         self.role_desc = QLabel()
         self.role_desc.setWordWrap(True)
-        self.role_desc.setStyleSheet(f"""
-            background: rgba(255,255,255,0.08); 
-            color: {self.current_theme["text"]}; 
-            padding: 15px; 
-            border-radius: 10px; 
-            border: 1px solid rgba(255,255,255,0.1);
-            font-size: 12px;
-            line-height: 1.4;
-        """)
+        self.role_desc.setProperty("role", "description")
         self.role_desc.setMinimumHeight(80)
         self.role_desc.setMaximumHeight(100)
         role_layout.addWidget(self.role_desc)
@@ -946,7 +781,7 @@ class ModernSetupDialog(QDialog):
         basic_layout.addLayout(genre_role_layout)
         
         # Character details
-        char_group = ModernGroupBox("📝 Character Details", theme=self.current_theme)
+        char_group = ModernGroupBox("📝 Character Details")
         char_layout = QVBoxLayout()
         self.name_edit = QLineEdit()
         self.name_edit.setPlaceholderText("Enter your character's name...")
@@ -973,7 +808,7 @@ class ModernSetupDialog(QDialog):
         advanced_layout.setContentsMargins(25, 25, 25, 25)
         
         # TTS Settings
-        tts_group = ModernGroupBox("🔊 Voice Settings", theme=self.current_theme)
+        tts_group = ModernGroupBox("🔊 Voice Settings")
         tts_layout = QVBoxLayout()
         self.tts_enabled = QCheckBox("Enable Text-to-Speech")
         self.tts_enabled.setChecked(True)
@@ -983,7 +818,7 @@ class ModernSetupDialog(QDialog):
         voice_layout.addWidget(QLabel("Voice Style:"))
         self.voice_combo = QComboBox()
         self.voice_combo.addItem("🔍 Scanning for voices...")
-        self.refresh_voices_button = ModernButton("🔄 Refresh Voices", theme=self.current_theme)
+        self.refresh_voices_button = ModernButton("🔄 Refresh Voices")
         self.refresh_voices_button.setVariant("secondary")
         self.refresh_voices_button.clicked.connect(self.refresh_voices)
         voice_layout.addWidget(self.voice_combo)
@@ -997,7 +832,7 @@ class ModernSetupDialog(QDialog):
         self.volume_slider.setRange(0, 100)
         self.volume_slider.setValue(80)
         self.volume_label = QLabel("80%")
-        self.volume_label.setStyleSheet(f"color: {self.current_theme['accent']}; font-weight: bold;")
+        self.volume_label.setProperty("role", "value")
         self.volume_slider.valueChanged.connect(
             lambda v: self.volume_label.setText(f"{v}%")
         )
@@ -1009,13 +844,13 @@ class ModernSetupDialog(QDialog):
         advanced_layout.addWidget(tts_group)
         
         # AI Settings
-        ai_group = ModernGroupBox("⚡ AI Behavior", theme=self.current_theme)
+        ai_group = ModernGroupBox("⚡ AI Behavior")
         ai_layout = QVBoxLayout()
         
         temp_layout = QHBoxLayout()
         temp_layout.addWidget(QLabel("Creativity Level:"))
         self.temp_label = QLabel("0.7")
-        self.temp_label.setStyleSheet(f"color: {self.current_theme['accent']}; font-weight: bold;")
+        self.temp_label.setProperty("role", "value")
         self.temp_slider = QSlider(Qt.Horizontal)
         self.temp_slider.setRange(0, 100)
         self.temp_slider.setValue(70)
@@ -1048,10 +883,10 @@ class ModernSetupDialog(QDialog):
         
         # Buttons
         button_layout = QHBoxLayout()
-        self.cancel_button = ModernButton("❌ Cancel", theme=self.current_theme)
+        self.cancel_button = ModernButton("❌ Cancel")
         self.cancel_button.setVariant("danger")
         self.cancel_button.clicked.connect(self.reject)
-        self.ok_button = ModernButton("🚀 Start Adventure!", theme=self.current_theme)
+        self.ok_button = ModernButton("🚀 Start Adventure!")
         self.ok_button.setVariant("primary")
         self.ok_button.clicked.connect(self.accept)
         self.ok_button.setDefault(True)
@@ -1069,166 +904,10 @@ class ModernSetupDialog(QDialog):
         # Add animations
         self.setup_animations()
     
-    def apply_theme_stylesheet(self):
-        self.setStyleSheet(f"""
-            QDialog {{
-                background: {self.current_theme["background"]};
-                color: {self.current_theme["text"]};
-                font-family: 'Segoe UI', Arial, sans-serif;
-            }}
-            QLabel {{
-                color: {self.current_theme["text"]};
-                font-size: 12px;
-            }}
-            QLabel#title {{
-                color: white;
-                font-size: 24px;
-                font-weight: bold;
-                qproperty-alignment: AlignCenter;
-            }}
-            QLabel#subtitle {{
-                color: {self.current_theme["accent"]};
-                font-size: 14px;
-                qproperty-alignment: AlignCenter;
-            }}
-            QComboBox {{
-                background: rgba(255,255,255,0.1);
-                border: 2px solid rgba(255,255,255,0.3);
-                border-radius: 8px;
-                padding: 10px;
-                color: {self.current_theme["text"]};
-                font-size: 12px;
-                min-height: 20px;
-            }}
-            QComboBox:focus {{
-                border: 2px solid {self.current_theme["primary"]};
-            }}
-            QComboBox QAbstractItemView {{
-                background: #2d3748;
-                border: 1px solid #4a5568;
-                color: {self.current_theme["text"]};
-                selection-background-color: {self.current_theme["primary"]};
-            }}
-            QLineEdit {{
-                background: rgba(255,255,255,0.1);
-                border: 2px solid rgba(255,255,255,0.3);
-                border-radius: 8px;
-                padding: 12px;
-                color: {self.current_theme["text"]};
-                font-size: 13px;
-                min-height: 25px;
-            }}
-            QLineEdit:focus {{
-                border: 2px solid {self.current_theme["primary"]};
-            }}
-            QTextEdit {{
-                background: rgba(255,255,255,0.1);
-                border: 2px solid rgba(255,255,255,0.3);
-                border-radius: 8px;
-                padding: 8px;
-                color: {self.current_theme["text"]};
-                font-size: 12px;
-            }}
-            QSpinBox {{
-                background: rgba(255,255,255,0.1);
-                border: 2px solid rgba(255,255,255,0.3);
-                border-radius: 8px;
-                padding: 8px;
-                color: {self.current_theme["text"]};
-                min-height: 20px;
-            }}
-            QCheckBox {{
-                color: {self.current_theme["text"]};
-                spacing: 8px;
-            }}
-            QCheckBox::indicator {{
-                width: 16px;
-                height: 16px;
-                border: 2px solid rgba(255,255,255,0.5);
-                border-radius: 4px;
-                background: rgba(255,255,255,0.1);
-            }}
-            QCheckBox::indicator:checked {{
-                background: {self.current_theme["primary"]};
-                border: 2px solid {self.current_theme["primary"]};
-            }}
-            QSlider::groove:horizontal {{
-                border: 1px solid rgba(255,255,255,0.3);
-                height: 6px;
-                background: rgba(255,255,255,0.1);
-                border-radius: 3px;
-            }}
-            QSlider::handle:horizontal {{
-                background: {self.current_theme["button_primary"]};
-                border: 2px solid rgba(255,255,255,0.8);
-                width: 18px;
-                margin: -7px 0;
-                border-radius: 9px;
-            }}
-            QTabWidget::pane {{
-                border: 1px solid rgba(255,255,255,0.2);
-                border-radius: 10px;
-                background: rgba(255,255,255,0.05);
-            }}
-            QTabBar::tab {{
-                background: rgba(255,255,255,0.1);
-                color: #cccccc;
-                padding: 12px 20px;
-                margin: 2px;
-                border-top-left-radius: 8px;
-                border-top-right-radius: 8px;
-            }}
-            QTabBar::tab:selected {{
-                background: rgba({QColor(self.current_theme["primary"]).red()}, {QColor(self.current_theme["primary"]).green()}, {QColor(self.current_theme["primary"]).blue()}, 0.3);
-                color: white;
-                border-bottom: 2px solid {self.current_theme["primary"]};
-            }}
-            QTabBar::tab:hover {{
-                background: rgba(255,255,255,0.2);
-            }}
-        """)
-    
     def theme_changed(self, theme_name):
+        """Preview a theme; the main window restores its own if the dialog is cancelled"""
         self.current_theme_name = theme_name
-        self.current_theme = THEMES.get(theme_name, THEMES["Classic Dark"])
-        self.apply_theme_stylesheet()
-        
-        # Update all themed widgets
-        for widget in self.findChildren(ModernGroupBox):
-            widget.theme = self.current_theme
-            widget.apply_theme()
-        
-        for widget in self.findChildren(ModernButton):
-            widget.theme = self.current_theme
-            # Re-apply variant to update colors
-            if "primary" in widget.styleSheet():
-                widget.setVariant("primary")
-            elif "secondary" in widget.styleSheet():
-                widget.setVariant("secondary")
-            elif "danger" in widget.styleSheet():
-                widget.setVariant("danger")
-        
-        # Update description labels
-        self.genre_desc.setStyleSheet(f"""
-            background: rgba(255,255,255,0.08); 
-            color: {self.current_theme["text"]}; 
-            padding: 15px; 
-            border-radius: 10px; 
-            border: 1px solid rgba(255,255,255,0.1);
-            font-size: 12px;
-            line-height: 1.4;
-        """)
-        self.role_desc.setStyleSheet(f"""
-            background: rgba(255,255,255,0.08); 
-            color: {self.current_theme["text"]}; 
-            padding: 15px; 
-            border-radius: 10px; 
-            border: 1px solid rgba(255,255,255,0.1);
-            font-size: 12px;
-            line-height: 1.4;
-        """)
-        self.temp_label.setStyleSheet(f"color: {self.current_theme['accent']}; font-weight: bold;")
-        self.volume_label.setStyleSheet(f"color: {self.current_theme['accent']}; font-weight: bold;")
+        apply_stylesheet(theme_name)
     
     def setup_animations(self):
         # Simple fade-in animation for the dialog
@@ -1240,28 +919,37 @@ class ModernSetupDialog(QDialog):
         self.animation.start()
     
     def on_voices_ready(self, voices):
-        """Update voice combo box with scanned voices"""
+        """Update voice combo box with scanned voices, keeping the one selected"""
+        current = self.voice_combo.currentData() or self.saved_voice
         self.voice_combo.clear()
         if voices:
             for voice in voices:
                 # Add emoji based on voice type
                 emoji = "🎭"
-                if "female" in voice.lower():
+                if "female" in voice.name.lower():
                     emoji = "👩"
-                elif "male" in voice.lower():
+                elif "male" in voice.name.lower():
                     emoji = "👨"
-                elif "narrator" in voice.lower():
+                elif "narrator" in voice.name.lower():
                     emoji = "📖"
-                self.voice_combo.addItem(f"{emoji} {voice}")
+                self.voice_combo.addItem(f"{emoji} {voice.name}", voice.name)
+                self.voice_combo.setItemData(self.voice_combo.count() - 1, voice.describe(), Qt.ToolTipRole)
+            index = self.voice_combo.findData(current)
+            if index >= 0:
+                self.voice_combo.setCurrentIndex(index)
         else:
             self.voice_combo.addItem("❌ No voices found")
     
     def on_models_ready(self, models):
-        """Update model combo box with scanned models"""
+        """Update model combo box with scanned models, keeping the one selected"""
+        current = self.model_combo.currentText()
         self.model_combo.clear()
         if models:
             for model in models:
-                self.model_combo.addItem(model)
+                self.model_combo.addItem(model.name)
+                self.model_combo.setItemData(self.model_combo.count() - 1, model.describe(), Qt.ToolTipRole)
+            if current and current != "🔍 Scanning for models...":
+                self.model_combo.setCurrentText(current)
         else:
             self.model_combo.addItem("llama3:instruct")
             self.model_combo.addItem("mistral:instruct")
@@ -1276,8 +964,6 @@ class ModernSetupDialog(QDialog):
     
     def refresh_voices(self):
         """Refresh available voices"""
-        self.voice_combo.clear()
-        self.voice_combo.addItem("🔍 Scanning for voices...")
         self.voice_scanner.start()
     
     def refresh_models(self):
@@ -1295,14 +981,15 @@ class ModernSetupDialog(QDialog):
         
         try:
             test_prompt = "Respond with just 'OK' if you can read this."
-            response = requests.post(
+            client = get_client()
+            response = client.post(
+                "test",
                 CONFIG["OLLAMA_URL"],
-                json={
+                json=client.ollama_payload({
                     "model": model,
                     "prompt": test_prompt,
                     "stream": False
-                },
-                timeout=30
+                })
             )
             
             if response.status_code == 200:
@@ -1345,22 +1032,12 @@ class ModernSetupDialog(QDialog):
         backstory = self.settings.value("character_backstory", "")
         self.backstory_edit.setPlainText(backstory)
         
-        # Fix for voice setting type conversion
-        voice_value = self.settings.value("voice", 0)
-        try:
-            if isinstance(voice_value, str):
-                voice_index = int(voice_value)
-            else:
-                voice_index = int(voice_value) if voice_value is not None else 0
-        except (ValueError, TypeError):
-            voice_index = 0
-        
-        # Voice index will be set after voices are loaded
+        # Selected once the voices are listed
+        self.saved_voice = str(self.settings.value("voice", DEFAULT_VOICE))
     
     def get_selections(self):
-        # Extract voice filename from the combo box display text
-        voice_text = self.voice_combo.currentText()
-        voice_file = voice_text.split(" ", 1)[-1] if " " in voice_text else voice_text
+        # Voices are listed with their file name as item data
+        voice_file = self.voice_combo.currentData() or self.saved_voice
         
         return {
             "model": self.model_combo.currentText(),
@@ -1376,36 +1053,338 @@ class ModernSetupDialog(QDialog):
             "theme": self.theme_combo.currentText()
         }
 
+class TranscriptView(QTextEdit):
+    """The story so far, with only the newest entries laid out.
+
+    Every entry (a player action, a Dungeon Master reply or a notice) is kept
+    as data; the document holds at most max_live of them, so appending and
+    scrolling cost the same after a thousand turns as after ten. Scrolling to
+    the top lays out the previous page of entries again. Each entry's block
+    count is tracked so the oldest can be removed without re-reading the
+    document, and streamed tokens are inserted at the end of the last block.
+    """
+    SPEAKER_HTML = {
+        PLAYER: "<font color='#4FC3F7'><b>🎭 You:</b>&nbsp;{}</font>",
+        DUNGEON_MASTER: "<font color='#81C784'><b>🎮 Dungeon Master:</b>&nbsp;{}</font>",
+    }
+    MARGINS = {PLAYER: 4, DUNGEON_MASTER: 16}  # Space below each kind of entry; notices get 8
+
+    def __init__(self, max_live=200, page=20, history=5000, parent=None):
+        super().__init__(parent)
+        self.max_live = max_live
+        self.page = page  # Entries laid out again per scroll to the top
+        self.history = history  # Entries kept at all; older ones are only in the save
+        self.entries = []  # [kind, text or notice HTML]
+        self.first_live = 0  # Index in entries of the first entry in the document
+        self.live_blocks = deque()  # Document blocks used by each live entry
+        self.streaming = None  # The reply entry tokens are appended to
+        self.document().setUndoRedoEnabled(False)  # Otherwise every insert is kept forever
+        self.highlighter = SyntaxHighlighter(self.document())
+        self.verticalScrollBar().valueChanged.connect(self.on_scroll)
+    
+    # ----- Appending -----
+    def add_notice(self, html, kind=NOTICE):
+        self.append_entry(kind, re.sub(r"(<br>\s*)+$", "", html))
+    
+    def add_turn(self, speaker, text):
+        self.append_entry(speaker, text)
+    
+    def begin_reply(self):
+        """Start a Dungeon Master entry that stream() appends to"""
+        self.append_entry(DUNGEON_MASTER, "")
+        self.streaming = self.entries[-1]
+    
+    def stream(self, token):
+        if self.streaming is None:
+            return
+        self.streaming[1] += token
+        at_bottom = self.at_bottom()
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        token_format = QTextCharFormat()
+        token_format.setForeground(QColor("#81C784"))
+        # A line separator instead of a new paragraph keeps the reply in one block
+        cursor.insertText(token.replace("\n", "\u2028"), token_format)
+        if at_bottom:
+            self.scroll_to_bottom()
+    
+    def end_reply(self, note=""):
+        if self.streaming is None:
+            return
+        if note:
+            self.streaming[1] += note
+            cursor = QTextCursor(self.document())
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertHtml(f"<i>{escape(note)}</i>")
+        self.streaming = None
+        self.trim()
+    
+    def append_entry(self, kind, text):
+        self.end_reply()
+        at_bottom = self.at_bottom()
+        self.entries.append([kind, text])
+        document = self.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        before = 0 if document.isEmpty() else document.blockCount()
+        if before:
+            cursor.insertBlock()
+        self.insert_entry(cursor, self.entries[-1])
+        self.live_blocks.append(document.blockCount() - before)
+        if self.streaming is None:
+            self.trim()
+        if at_bottom:
+            self.scroll_to_bottom()
+    
+    def set_entries(self, entries, visible):
+        """Replace the transcript, laying out only the newest visible entries"""
+        self.clear()
+        self.entries = [list(entry) for entry in entries][-self.history:]
+        self.first_live = len(self.entries)
+        self.show_older(visible)
+        self.scroll_to_bottom()
+    
+    def clear(self):
+        super().clear()
+        self.entries = []
+        self.first_live = 0
+        self.live_blocks.clear()
+        self.streaming = None
+    
+    # ----- Live window -----
+    def insert_entry(self, cursor, entry):
+        kind, text = entry
+        first = cursor.block().position()
+        self.tag(cursor.block(), kind)  # Before inserting, so the text is highlighted as it goes in
+        if kind in self.SPEAKER_HTML:
+            cursor.insertHtml(self.SPEAKER_HTML[kind].format(escape(text).replace("\n", "<br>")))
+        else:
+            cursor.insertHtml(text)
+        self.set_margin(cursor, kind)
+        block = self.document().findBlock(first)
+        while block.isValid() and block.position() <= cursor.block().position():
+            self.tag(block, kind)
+            block = block.next()
+    
+    def tag(self, block, kind):
+        """Record which kind of entry a block belongs to, for the highlighter"""
+        state = BLOCK_STATES[kind]
+        if block.userState() != state:
+            block.setUserState(state)
+            self.highlighter.rehighlightBlock(block)
+    
+    def set_margin(self, cursor, kind):
+        block_format = cursor.blockFormat()
+        block_format.setBottomMargin(self.MARGINS.get(kind, 8))
+        cursor.setBlockFormat(block_format)
+    
+    def trim(self):
+        """Drop the oldest live entries beyond max_live, keeping the view on what the player is reading"""
+        excess = len(self.live_blocks) - self.max_live
+        if excess <= 0:
+            return
+        scroll_bar = self.verticalScrollBar()
+        old_maximum, old_value = scroll_bar.maximum(), scroll_bar.value()
+        blocks = sum(self.live_blocks.popleft() for _ in range(excess))
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.Start)
+        cursor.movePosition(QTextCursor.NextBlock, QTextCursor.KeepAnchor, blocks)
+        scroll_bar.blockSignals(True)  # No show_older() until first_live is right
+        cursor.removeSelectedText()
+        scroll_bar.blockSignals(False)
+        self.first_live += excess
+        # The block left at the top keeps the removed entry's format and state
+        self.set_margin(cursor, self.entries[self.first_live][0])
+        self.tag(cursor.block(), self.entries[self.first_live][0])
+        if len(self.entries) > self.history:
+            dropped = min(len(self.entries) - self.history, self.first_live)
+            del self.entries[:dropped]
+            self.first_live -= dropped
+        # Everything below the removed entries moved up by their height. A view
+        # that was on them lands at the top, which lays them out again.
+        scroll_bar.setValue(old_value - (old_maximum - scroll_bar.maximum()))
+    
+    def show_older(self, count):
+        """Lay out up to count entries before the first live one, keeping the view where it was"""
+        start = max(0, self.first_live - count)
+        if start == self.first_live:
+            return
+        scroll_bar = self.verticalScrollBar()
+        old_maximum, old_value = scroll_bar.maximum(), scroll_bar.value()
+        document = self.document()
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        for entry in reversed(self.entries[start:self.first_live]):
+            cursor.movePosition(QTextCursor.Start)
+            before = 0
+            if not document.isEmpty():
+                # Split off an empty first block so the old first entry keeps its format
+                before = document.blockCount()
+                cursor.insertBlock()
+                cursor.movePosition(QTextCursor.Start)
+            self.insert_entry(cursor, entry)
+            self.live_blocks.appendleft(document.blockCount() - before)
+        cursor.endEditBlock()
+        self.first_live = start
+        scroll_bar.setValue(old_value + scroll_bar.maximum() - old_maximum)
+    
+    def on_scroll(self, value):
+        if value == self.verticalScrollBar().minimum() and self.first_live > 0:
+            self.show_older(self.page)
+    
+    def at_bottom(self):
+        scroll_bar = self.verticalScrollBar()
+        return scroll_bar.value() >= scroll_bar.maximum() - 4
+    
+    def scroll_to_bottom(self):
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+    
+    # ----- Export -----
+    def export_html(self):
+        paragraphs = []
+        for kind, text in self.entries:
+            if kind not in self.SPEAKER_HTML:
+                paragraphs.append(f"<p class='system'>{text}</p>")
+            else:
+                label = "🎭 You:" if kind == PLAYER else "🎮 Dungeon Master:"
+                css = "player" if kind == PLAYER else "dm"
+                paragraphs.append(f"<p class='{css}'>{label} {escape(text).replace(chr(10), '<br>')}</p>")
+        return "\n".join(paragraphs)
+    
+    def export_text(self):
+        lines = []
+        for kind, text in self.entries:
+            if kind not in self.SPEAKER_HTML:
+                lines.append(QTextDocumentFragment.fromHtml(text).toPlainText())
+            else:
+                lines.append(f"{'You' if kind == PLAYER else 'Dungeon Master'}: {text}")
+                if kind == DUNGEON_MASTER:
+                    lines.append("")
+        return "\n".join(lines)
+
+class SaveBrowserDialog(QDialog):
+    """Searchable list of saves, answered from the save index instead of opening the files"""
+    def __init__(self, save_index, parent=None):
+        super().__init__(parent)
+        self.save_index = save_index
+        self.selected_path = None
+        self.setWindowTitle("📂 Load Adventure")
+        self.setModal(True)
+        self.setMinimumWidth(720)
+        self.setMinimumHeight(520)
+        
+        # Re-query shortly after typing stops rather than on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.populate)
+        
+        self.init_ui()
+        self.populate()
+    
+    def init_ui(self):
+        layout = QVBoxLayout()
+        layout.setSpacing(12)
+        layout.setContentsMargins(20, 20, 20, 20)
+        
+        self.setProperty("themed", True)  # Styled by the application stylesheet
+        
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("🔍 Search by character, genre, model or story text...")
+        self.search_edit.textChanged.connect(lambda _text: self.search_timer.start())
+        layout.addWidget(self.search_edit)
+        
+        self.save_list = QListWidget()
+        self.save_list.itemDoubleClicked.connect(lambda _item: self.load_selected())
+        layout.addWidget(self.save_list)
+        
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+        
+        button_layout = QHBoxLayout()
+        browse_button = ModernButton("🗂️ Browse Files...")
+        browse_button.setVariant("secondary")
+        browse_button.clicked.connect(self.browse_files)
+        cancel_button = ModernButton("❌ Cancel")
+        cancel_button.setVariant("danger")
+        cancel_button.clicked.connect(self.reject)
+        load_button = ModernButton("📂 Load")
+        load_button.setVariant("primary")
+        load_button.clicked.connect(self.load_selected)
+        load_button.setDefault(True)
+        
+        button_layout.addWidget(browse_button)
+        button_layout.addStretch()
+        button_layout.addWidget(cancel_button)
+        button_layout.addWidget(load_button)
+        layout.addLayout(button_layout)
+        
+        self.setLayout(layout)
+    
+    def populate(self):
+        self.save_list.clear()
+        entries = self.save_index.search(self.search_edit.text())
+        for entry in entries:
+            played = datetime.datetime.fromtimestamp(entry.saved_at).strftime("%Y-%m-%d %H:%M")
+            character = f"{entry.name} the {entry.role}" if entry.name else Path(entry.path).name
+            item = QListWidgetItem(
+                f"{character} · {entry.genre or '?'} · {entry.turns} turns · {played}\n{entry.preview}"
+            )
+            item.setData(Qt.UserRole, entry.path)
+            item.setToolTip(f"{entry.path}\nModel: {entry.model or 'unknown'}")
+            self.save_list.addItem(item)
+        if entries:
+            self.save_list.setCurrentRow(0)
+        self.count_label.setText(f"{len(entries)} of {len(self.save_index)} saves")
+    
+    def browse_files(self):
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Load Adventure", self.save_index.directory, "Text Files (*.txt)"
+        )
+        if file_path:
+            self.selected_path = file_path
+            self.accept()
+    
+    def load_selected(self):
+        item = self.save_list.currentItem()
+        if item is None:
+            return
+        self.selected_path = item.data(Qt.UserRole)
+        self.accept()
+
 class AdventureGameGUI(QMainWindow):
     def __init__(self):
         super().__init__()
         self.settings = QSettings(CONFIG["CONFIG_FILE"], QSettings.IniFormat)
+        self.engine = GameEngine(CONFIG)
+        self.state = self.engine.state  # Game rules and story live in the engine
+        self.async_engine = AsyncGameEngine(self.engine)
+        self.engine_loop = EngineLoop()  # Generation runs here, never on the UI thread
+        Path(CONFIG["SAVE_DIR"]).mkdir(exist_ok=True)
+        self.save_index = SaveIndex(CONFIG["SAVE_DIR"])  # Backs the load panel
         self.current_theme_name = self.settings.value("theme", "Classic Dark")
         self.current_theme = THEMES.get(self.current_theme_name, THEMES["Classic Dark"])
         self.setWindowTitle("✨ AI Dungeon Master - Interactive Storytelling")
         self.setGeometry(100, 100, 1200, 900)
         
-        self.adventure_started = False
-        self.last_ai_reply = ""
-        self.conversation = ""
-        self.last_player_input = ""
-        self.ollama_model = "llama3:instruct"
-        self.character_name = ""
-        self.character_backstory = ""
-        self.selected_genre = ""
-        self.selected_role = ""
         self.tts_enabled = True
         self.tts_volume = 80
-        self.selected_voice = "FemaleBritishAccent_WhyLucyWhy_Voice_2.wav"
-        self.temperature = 0.7
-        self.max_tokens = 512
+        self.selected_voice = DEFAULT_VOICE
+        self.omitted_turns = 0  # Last value seen, for the "no longer fit" notice
         
         self.ai_worker = None
-        self.tts_worker = None
-        
-        # NEW: Conversation history for memory management
-        self.conversation_history = []
-        self.current_conversation_index = -1
+        self.tts = TTSPipeline(
+            CONFIG["ALLTALK_API_URL"], CONFIG["AUDIO_SAMPLE_RATE"], CONFIG["TTS_PREFETCH_CHUNKS"],
+            cache=TTSCache(CONFIG["TTS_CACHE_DIR"], CONFIG["TTS_CACHE_MAX_MB"] * 1024 * 1024),
+            on_error=lambda message, e: self.log_error(f"TTS Error: {message}", e),
+            health=self.engine.health,
+            volume=self.tts_volume / 100, buffer_seconds=CONFIG["AUDIO_BUFFER_SECONDS"]
+        )
+        self.streamed_reply = False
+        configure_library(
+            directories=CONFIG["VOICE_DIRS"], voices_url=CONFIG["ALLTALK_VOICES_URL"],
+            cache_path=CONFIG["VOICE_INDEX_FILE"], health=self.engine.health, logger=self.engine.logger
+        )
         
         # Store references to UI elements
         self.subtitle_label = None
@@ -1426,6 +1405,7 @@ class AdventureGameGUI(QMainWindow):
         layout.setContentsMargins(20, 20, 20, 20)
         
         # Apply theme
+        self.apply_palette()
         self.apply_theme()
         
         # Header
@@ -1434,23 +1414,10 @@ class AdventureGameGUI(QMainWindow):
         header_layout.setContentsMargins(0, 0, 0, 0)
         
         self.title_label = QLabel("🎭 AI Dungeon Master")
-        self.title_label.setStyleSheet(f"""
-            QLabel {{
-                color: white;
-                font-size: 28px;
-                font-weight: bold;
-                font-family: 'Segoe UI', Arial, sans-serif;
-            }}
-        """)
+        self.title_label.setProperty("role", "heading")
         
         self.subtitle_label = QLabel("Your interactive storytelling companion")
-        self.subtitle_label.setStyleSheet(f"""
-            QLabel {{
-                color: {self.current_theme["accent"]};
-                font-size: 14px;
-                font-style: italic;
-            }}
-        """)
+        self.subtitle_label.setProperty("role", "subtitle")
         
         header_layout.addWidget(self.title_label)
         header_layout.addStretch()
@@ -1459,23 +1426,13 @@ class AdventureGameGUI(QMainWindow):
         layout.addWidget(header_widget)
         
         # Game text area with syntax highlighting
-        self.text_area = QTextEdit()
+        self.text_area = TranscriptView(
+            CONFIG["TRANSCRIPT_LIVE_ENTRIES"], CONFIG["TRANSCRIPT_PAGE_ENTRIES"], CONFIG["TRANSCRIPT_HISTORY"]
+        )
         self.text_area.setReadOnly(True)
         self.text_area.setFont(QFont("Segoe UI", 12))
-        self.text_area.setStyleSheet(f"""
-            QTextEdit {{
-                background: {self.current_theme["text_area"]};
-                color: {self.current_theme["text"]};
-                border: 2px solid rgba(255,255,255,0.1);
-                border-radius: 15px;
-                padding: 20px;
-                font-family: 'Segoe UI', Arial, sans-serif;
-                font-size: 12pt;
-                line-height: 1.5;
-                selection-background-color: rgba({QColor(self.current_theme["primary"]).red()}, {QColor(self.current_theme["primary"]).green()}, {QColor(self.current_theme["primary"]).blue()}, 0.3);
-            }}
-        """)
-        self.highlighter = SyntaxHighlighter(self.text_area.document())
+        self.text_area.setProperty("role", "transcript")
+        self.highlighter = self.text_area.highlighter
         
         # Add shadow to text area
         text_shadow = QGraphicsDropShadowEffect()
@@ -1485,22 +1442,12 @@ class AdventureGameGUI(QMainWindow):
         self.text_area.setGraphicsEffect(text_shadow)
         
         # Progress bar
-        self.progress_bar = ModernProgressBar(theme=self.current_theme)
+        self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
         
         # Status bar
         self.status_label = QLabel("🟢 Ready to begin your adventure")
-        self.status_label.setStyleSheet(f"""
-            QLabel {{
-                background: rgba(255,255,255,0.1);
-                color: {self.current_theme["accent"]};
-                padding: 8px 15px;
-                border-radius: 10px;
-                border: 1px solid rgba(255,255,255,0.2);
-                font-size: 11px;
-                font-weight: bold;
-            }}
-        """)
+        self.status_label.setProperty("role", "status")
         
         # Input area
         input_widget = QWidget()
@@ -1510,26 +1457,7 @@ class AdventureGameGUI(QMainWindow):
         self.input_field = QLineEdit()
         self.input_field.setPlaceholderText("💭 Describe your action or type /help for commands...")
         self.input_field.returnPressed.connect(self.send_input)
-        self.input_field.setStyleSheet(f"""
-            QLineEdit {{
-                background: rgba(255,255,255,0.1);
-                color: {self.current_theme["text"]};
-                border: 2px solid rgba(255,255,255,0.3);
-                border-radius: 12px;
-                padding: 15px;
-                font-size: 13px;
-                font-family: 'Segoe UI', Arial, sans-serif;
-                min-height: 25px;
-            }}
-            QLineEdit:focus {{
-                border: 2px solid {self.current_theme["primary"]};
-                background: rgba(255,255,255,0.15);
-            }}
-            QLineEdit:disabled {{
-                background: rgba(255,255,255,0.05);
-                color: #888888;
-            }}
-        """)
+        self.input_field.setProperty("role", "command")
         
         input_shadow = QGraphicsDropShadowEffect()
         input_shadow.setBlurRadius(15)
@@ -1537,7 +1465,7 @@ class AdventureGameGUI(QMainWindow):
         input_shadow.setOffset(0, 4)
         self.input_field.setGraphicsEffect(input_shadow)
         
-        self.send_button = ModernButton("🚀 Send", theme=self.current_theme)
+        self.send_button = ModernButton("🚀 Send")
         self.send_button.setVariant("primary")
         self.send_button.clicked.connect(self.send_input)
         
@@ -1550,35 +1478,35 @@ class AdventureGameGUI(QMainWindow):
         button_layout.setContentsMargins(0, 0, 0, 0)
         button_layout.setSpacing(10)
         
-        self.help_button = ModernButton("❓ Help", theme=self.current_theme)
+        self.help_button = ModernButton("❓ Help")
         self.help_button.setVariant("secondary")
         self.help_button.clicked.connect(self.show_help)
         
-        self.retry_button = ModernButton("🔄 Retry", theme=self.current_theme)  # NEW
+        self.retry_button = ModernButton("🔄 Retry")  # NEW
         self.retry_button.setVariant("secondary")
         self.retry_button.clicked.connect(self.retry_last)
         
-        self.export_button = ModernButton("💾 Export", theme=self.current_theme)  # NEW
+        self.export_button = ModernButton("💾 Export")  # NEW
         self.export_button.setVariant("secondary")
         self.export_button.clicked.connect(self.export_conversation)
         
-        self.save_button = ModernButton("📁 Save", theme=self.current_theme)
+        self.save_button = ModernButton("📁 Save")
         self.save_button.setVariant("secondary")
         self.save_button.clicked.connect(self.save_adventure)
         
-        self.load_button = ModernButton("📂 Load", theme=self.current_theme)
+        self.load_button = ModernButton("📂 Load")
         self.load_button.setVariant("secondary")
         self.load_button.clicked.connect(self.load_adventure)
         
-        self.settings_button = ModernButton("⚙️ Settings", theme=self.current_theme)
+        self.settings_button = ModernButton("⚙️ Settings")
         self.settings_button.setVariant("secondary")
         self.settings_button.clicked.connect(self.show_settings)
         
-        self.theme_button = ModernButton("🎨 Theme", theme=self.current_theme)
+        self.theme_button = ModernButton("🎨 Theme")
         self.theme_button.setVariant("secondary")
         self.theme_button.clicked.connect(self.cycle_theme)
         
-        self.exit_button = ModernButton("⏹️ Exit", theme=self.current_theme)
+        self.exit_button = ModernButton("⏹️ Exit")
         self.exit_button.setVariant("danger")
         self.exit_button.clicked.connect(self.exit_game)
         
@@ -1597,8 +1525,7 @@ class AdventureGameGUI(QMainWindow):
         layout.addWidget(input_widget)
         layout.addWidget(button_widget)
         
-    def apply_theme(self):
-        """Apply comprehensive theme to the entire application"""
+    def apply_palette(self):
         dark_palette = QPalette()
         dark_palette.setColor(QPalette.Window, QColor(53, 53, 53))
         dark_palette.setColor(QPalette.WindowText, Qt.white)
@@ -1615,30 +1542,10 @@ class AdventureGameGUI(QMainWindow):
         dark_palette.setColor(QPalette.HighlightedText, Qt.black)
         
         self.setPalette(dark_palette)
-        
-        # Additional theme styling
-        self.setStyleSheet(f"""
-            QMainWindow {{
-                background: {self.current_theme["background"]};
-            }}
-            QMessageBox {{
-                background: #2d2d2d;
-                color: {self.current_theme["text"]};
-            }}
-            QMessageBox QLabel {{
-                color: {self.current_theme["text"]};
-            }}
-            QMessageBox QPushButton {{
-                background: #404040;
-                color: {self.current_theme["text"]};
-                border: 1px solid #555;
-                padding: 5px 15px;
-                border-radius: 4px;
-            }}
-            QMessageBox QPushButton:hover {{
-                background: #505050;
-            }}
-        """)
+    
+    def apply_theme(self):
+        """Apply the current theme to the entire application"""
+        apply_stylesheet(self.current_theme_name)
     
     def cycle_theme(self):
         """Cycle through available themes"""
@@ -1655,90 +1562,13 @@ class AdventureGameGUI(QMainWindow):
         
         # Re-apply theme to UI
         self.apply_theme()
-        self.update_ui_theme()
         
         self.append_text(f"🎨 <font color='{self.current_theme['accent']}'>Theme changed to: {self.current_theme_name}</font><br>")
     
-    def update_ui_theme(self):
-        """Update all themed UI elements"""
-        # Update progress bar
-        self.progress_bar.theme = self.current_theme
-        self.progress_bar.apply_theme()
-        
-        # Update buttons
-        for button in [self.help_button, self.retry_button, self.export_button, 
-                      self.save_button, self.load_button, self.settings_button, 
-                      self.theme_button, self.exit_button, self.send_button]:
-            button.theme = self.current_theme
-            if "primary" in button.styleSheet():
-                button.setVariant("primary")
-            elif "secondary" in button.styleSheet():
-                button.setVariant("secondary")
-            elif "danger" in button.styleSheet():
-                button.setVariant("danger")
-        
-        # Update text area
-        self.text_area.setStyleSheet(f"""
-            QTextEdit {{
-                background: {self.current_theme["text_area"]};
-                color: {self.current_theme["text"]};
-                border: 2px solid rgba(255,255,255,0.1);
-                border-radius: 15px;
-                padding: 20px;
-                font-family: 'Segoe UI', Arial, sans-serif;
-                font-size: 12pt;
-                line-height: 1.5;
-                selection-background-color: rgba({QColor(self.current_theme["primary"]).red()}, {QColor(self.current_theme["primary"]).green()}, {QColor(self.current_theme["primary"]).blue()}, 0.3);
-            }}
-        """)
-        
-        # Update status label
-        self.status_label.setStyleSheet(f"""
-            QLabel {{
-                background: rgba(255,255,255,0.1);
-                color: {self.current_theme["accent"]};
-                padding: 8px 15px;
-                border-radius: 10px;
-                border: 1px solid rgba(255,255,255,0.2);
-                font-size: 11px;
-                font-weight: bold;
-            }}
-        """)
-        
-        # Update input field
-        self.input_field.setStyleSheet(f"""
-            QLineEdit {{
-                background: rgba(255,255,255,0.1);
-                color: {self.current_theme["text"]};
-                border: 2px solid rgba(255,255,255,0.3);
-                border-radius: 12px;
-                padding: 15px;
-                font-size: 13px;
-                font-family: 'Segoe UI', Arial, sans-serif;
-                min-height: 25px;
-            }}
-            QLineEdit:focus {{
-                border: 2px solid {self.current_theme["primary"]};
-                background: rgba(255,255,255,0.15);
-            }}
-            QLineEdit:disabled {{
-                background: rgba(255,255,255,0.05);
-                color: #888888;
-            }}
-        """)
-        
-        # Update subtitle label safely
-        if self.subtitle_label:
-            self.subtitle_label.setStyleSheet(f"""
-                QLabel {{
-                    color: {self.current_theme["accent"]};
-                    font-size: 14px;
-                    font-style: italic;
-                }}
-            """)
-    
     def show_setup_dialog(self):
         dialog = ModernSetupDialog(self.settings, self)
+        # Runs once the dialog is on screen
+        QTimer.singleShot(0, lambda: check_budget(CONFIG["STARTUP_BUDGET_MS"], self.engine.logger, "setup dialog"))
         if dialog.exec_() == QDialog.Accepted:
             selections = dialog.get_selections()
             self.apply_settings(selections)
@@ -1752,33 +1582,36 @@ class AdventureGameGUI(QMainWindow):
             selections = dialog.get_selections()
             self.apply_settings(selections)
             self.append_text("🎛️ <font color='#FFB74D'>Settings updated.</font><br>")
+        else:
+            self.apply_theme()  # Undo the dialog's theme preview
     
     def apply_settings(self, selections):
-        self.ollama_model = selections["model"]
-        self.selected_genre = selections["genre"]
-        self.selected_role = selections["role"]
-        self.character_name = selections["character_name"]
-        self.character_backstory = selections["character_backstory"]
+        self.state.current_model = selections["model"]
+        self.state.selected_genre = selections["genre"]
+        self.state.selected_role = selections["role"]
+        self.state.character_name = selections["character_name"]
+        self.state.character_backstory = selections["character_backstory"]
         self.tts_enabled = selections["tts_enabled"]
         self.tts_volume = selections["volume"]
+        self.tts.volume = self.tts_volume / 100
         self.selected_voice = selections["voice"]
-        self.temperature = selections["temperature"]
-        self.max_tokens = selections["max_tokens"]
+        self.state.voice = self.selected_voice
+        self.state.temperature = selections["temperature"]
+        self.state.max_tokens = selections["max_tokens"]
         
-        # Update theme if changed
+        # Update theme if changed (the dialog may have been previewing another)
         new_theme = selections.get("theme", self.current_theme_name)
         if new_theme != self.current_theme_name:
             self.current_theme_name = new_theme
             self.current_theme = THEMES.get(new_theme, THEMES["Classic Dark"])
-            self.apply_theme()
-            self.update_ui_theme()
+        self.apply_theme()
         
         # Save settings
-        self.settings.setValue("model", self.ollama_model)
-        self.settings.setValue("genre", self.selected_genre)
-        self.settings.setValue("role", self.selected_role)
-        self.settings.setValue("character_name", self.character_name)
-        self.settings.setValue("character_backstory", self.character_backstory)
+        self.settings.setValue("model", self.state.current_model)
+        self.settings.setValue("genre", self.state.selected_genre)
+        self.settings.setValue("role", self.state.selected_role)
+        self.settings.setValue("character_name", self.state.character_name)
+        self.settings.setValue("character_backstory", self.state.character_backstory)
         self.settings.setValue("tts_enabled", self.tts_enabled)
         self.settings.setValue("tts_volume", self.tts_volume)
         self.settings.setValue("theme", self.current_theme_name)
@@ -1786,8 +1619,8 @@ class AdventureGameGUI(QMainWindow):
         # Save voice as string filename
         self.settings.setValue("voice", self.selected_voice)
         
-        self.settings.setValue("temperature", int(self.temperature * 100))
-        self.settings.setValue("max_tokens", self.max_tokens)
+        self.settings.setValue("temperature", int(self.state.temperature * 100))
+        self.settings.setValue("max_tokens", self.state.max_tokens)
     
     def start_adventure(self):
         # Create save directory
@@ -1804,39 +1637,24 @@ class AdventureGameGUI(QMainWindow):
                     return
         
         # Start new adventure
-        starter = ROLE_STARTERS[self.selected_genre][self.selected_role]
-        self.append_text(f"<font color='#FFA500'><b>🌟 Adventure Start: {self.character_name} the {self.selected_role} 🌟</b></font><br><br>")
+        state = self.state
+        starter = self.engine.new_adventure(
+            state.selected_genre, state.selected_role, state.character_name, state.character_backstory
+        )
+        self.append_text(f"<font color='#FFA500'><b>🌟 Adventure Start: {state.character_name} the {state.selected_role} 🌟</b></font><br><br>")
         self.append_text(f"<b>🎬 Starting scenario:</b> {starter}<br><br>")
         
-        if self.character_backstory:
-            self.append_text(f"<b>📖 Character Backstory:</b> {self.character_backstory}<br><br>")
+        if state.character_backstory:
+            self.append_text(f"<b>📖 Character Backstory:</b> {state.character_backstory}<br><br>")
             
         self.append_text("<font color='#4FC3F7'>💡 Type <b>/help</b> for available commands</font><br><br>")
         
-        # IMPROVED: Better initial context with character backstory
-        initial_context = (
-            f"### Adventure Setting ###\n"
-            f"Genre: {self.selected_genre}\n"
-            f"Player Character: {self.character_name} the {self.selected_role}\n"
-        )
-        
-        if self.character_backstory:
-            initial_context += f"Character Backstory: {self.character_backstory}\n"
-            
-        initial_context += f"Starting Scenario: {starter}\n\nDungeon Master: "
-        
-        self.conversation = initial_context
-        
-        # NEW: Add to conversation history
-        self.conversation_history = [initial_context]
-        self.current_conversation_index = 0
-        
-        self.get_ai_response(DM_SYSTEM_PROMPT + "\n\n" + self.conversation)
+        self.omitted_turns = 0
+        self.get_ai_response(self.async_engine.opening_turn)
     
     def append_text(self, text):
-        self.text_area.moveCursor(QTextCursor.End)
-        self.text_area.insertHtml(text)
-        self.text_area.moveCursor(QTextCursor.End)
+        """Add a notice (HTML) to the story view"""
+        self.text_area.add_notice(text)
     
     def send_input(self):
         user_input = self.input_field.text().strip()
@@ -1845,33 +1663,25 @@ class AdventureGameGUI(QMainWindow):
         if not user_input:
             return
             
+        generating = self.ai_worker is not None and self.ai_worker.isRunning()
+        
         # Handle commands
         if user_input.lower().startswith('/'):
+            if generating:
+                self.append_text("⏳ <font color='#FFA500'>Commands are available once the Dungeon Master has finished.</font><br>")
+                return
             self.handle_command(user_input)
             return
         
-        # Process player action
-        self.last_player_input = user_input
-        self.append_text(f"<font color='#4FC3F7'><b>🎭 You:</b> {user_input}</font><br>")
-        
-        formatted_input = f"Player: {user_input}"
-        
-        # NEW: Manage conversation length to prevent memory issues
-        if len(self.conversation) > CONFIG["MAX_CONVERSATION_LENGTH"]:
-            # Keep only the most recent part of the conversation
-            lines = self.conversation.split('\n')
-            # Keep last 20 lines
-            self.conversation = '\n'.join(lines[-20:])
-            self.append_text("<font color='#FFB74D'>--- Conversation trimmed for memory ---</font><br>")
-        
-        prompt = (
-            f"{DM_SYSTEM_PROMPT}\n\n"
-            f"{self.conversation}\n"
-            f"{formatted_input}\n"
-            "Dungeon Master:"
-        )
+        # A new action supersedes a reply that is still being generated
+        if generating:
+            self.ai_worker.cancel()
+            if self.streamed_reply:
+                self.text_area.end_reply(" (interrupted)")
         
-        self.get_ai_response(prompt)
+        # Process player action
+        self.text_area.add_turn(PLAYER, user_input)
+        self.get_ai_response(lambda on_token: self.async_engine.take_turn(user_input, on_token))
     
     def handle_command(self, command):
         cmd = command.lower().strip()
@@ -1898,16 +1708,21 @@ class AdventureGameGUI(QMainWindow):
         elif cmd.startswith('/model'):
             parts = cmd.split()
             if len(parts) > 1:
-                self.ollama_model = parts[1]
-                self.append_text(f"🔄 <font color='#FFA500'>Model changed to: {self.ollama_model}</font><br>")
+                self.state.current_model = parts[1]
+                self.append_text(f"🔄 <font color='#FFA500'>Model changed to: {self.state.current_model}</font><br>")
             else:
-                QMessageBox.information(self, "Current Model", f"🤖 Using model: {self.ollama_model}")
+                QMessageBox.information(self, "Current Model", f"🤖 Using model: {self.state.current_model}")
         elif cmd == '/tts':
             self.tts_enabled = not self.tts_enabled
+            if not self.tts_enabled:
+                self.tts.interrupt()
             status = "enabled" if self.tts_enabled else "disabled"
             self.append_text(f"🔊 <font color='#FFA500'>Text-to-speech {status}.</font><br>")
         elif cmd == '/voices':
             self.append_text(f"🔊 <font color='#FFA500'>Current voice: {self.selected_voice}</font><br>")
+            voices = get_library().names()
+            if voices:
+                self.append_text(f"🔊 <font color='#FFA500'>Available voices: {', '.join(voices)}</font><br>")
         elif cmd == '/theme':
             self.append_text(f"🎨 <font color='#FFA500'>Current theme: {self.current_theme_name}</font><br>")
         elif cmd == '/status':
@@ -1920,49 +1735,87 @@ class AdventureGameGUI(QMainWindow):
         status_text = f"""
 <h3>🎮 Current Game Status:</h3>
 <ul>
-<li><b>Character:</b> {self.character_name} the {self.selected_role}</li>
-<li><b>Genre:</b> {self.selected_genre}</li>
-<li><b>AI Model:</b> {self.ollama_model}</li>
+<li><b>Character:</b> {self.state.character_name} the {self.state.selected_role}</li>
+<li><b>Genre:</b> {self.state.selected_genre}</li>
+<li><b>AI Model:</b> {self.state.current_model}</li>
 <li><b>TTS:</b> {'Enabled' if self.tts_enabled else 'Disabled'}</li>
 <li><b>Theme:</b> {self.current_theme_name}</li>
-<li><b>Conversation Length:</b> {len(self.conversation)} characters</li>
+<li><b>Conversation Length:</b> {len(self.state.turns)} turns, {self.state.turns.char_count} characters</li>
 </ul>
 """
         QMessageBox.information(self, "Game Status", status_text)
     
-    def get_ai_response(self, prompt):
+    def get_ai_response(self, turn):
+        """Run an AsyncGameEngine turn method (called with on_token) on the engine loop"""
         self.status_label.setText("🤔 Generating response...")
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
         self.set_ui_enabled(False)
+        # The player may still type a new action, which supersedes this one
+        self.input_field.setEnabled(True)
+        self.send_button.setEnabled(True)
+        
+        self.streamed_reply = False
+        self.tts.interrupt()  # A new reply replaces whatever is still being spoken
         
-        self.ai_worker = AIWorker(prompt, self.ollama_model, self.temperature, self.max_tokens)
+        self.ai_worker = AIWorker(self.engine_loop, turn, self.state.max_tokens)
         self.ai_worker.response_ready.connect(self.handle_ai_response)
         self.ai_worker.error_occurred.connect(self.handle_ai_error)
         self.ai_worker.progress_update.connect(self.progress_bar.setValue)
+        self.ai_worker.token_ready.connect(self.handle_ai_token)
         self.ai_worker.start()
     
+    def handle_ai_token(self, token):
+        """Append streamed reply text as it arrives"""
+        if self.sender() is not self.ai_worker:
+            return  # Queued before its turn was superseded
+        if not self.streamed_reply:
+            self.streamed_reply = True
+            self.status_label.setText("✍️ The Dungeon Master is narrating...")
+            self.text_area.begin_reply()
+        
+        # Inserted as plain text so model output is never interpreted as HTML
+        self.text_area.stream(token)
+        
+        # Start speaking as soon as the first sentence is complete
+        if self.tts_enabled:
+            self.tts.feed(token, self.selected_voice)
+    
     def handle_ai_response(self, response):
+        if self.sender() is not self.ai_worker:
+            return
         self.progress_bar.setVisible(False)
         self.set_ui_enabled(True)
-        self.status_label.setText("🟢 Ready for your next action")
-        
-        self.append_text(f"<font color='#81C784'><b>🎮 Dungeon Master:</b> {response}</font><br><br>")
-        self.conversation += f"\nDungeon Master: {response}"
-        self.last_ai_reply = response
-        
-        # NEW: Add to conversation history
-        self.conversation_history.append(f"Dungeon Master: {response}")
-        if len(self.conversation_history) > CONFIG["MAX_HISTORY_ITEMS"]:
-            self.conversation_history.pop(0)
-        self.current_conversation_index = len(self.conversation_history) - 1
+        stats = self.state.last_generation_stats
+        if stats:
+            self.status_label.setText(f"🟢 Ready for your next action ({stats.summary()})")
+        else:
+            self.status_label.setText("🟢 Ready for your next action")
         
-        self.speak_text(response)
+        if self.streamed_reply:
+            self.text_area.end_reply()
+        else:
+            self.text_area.add_turn(DUNGEON_MASTER, response)
+        if self.engine.omitted_turns and not self.omitted_turns:
+            self.text_area.add_notice("<font color='#FFB74D'>--- Older turns no longer fit in the AI's context ---</font>", SYSTEM)
+        self.omitted_turns = self.engine.omitted_turns
+        
+        if self.streamed_reply:
+            if self.tts_enabled:
+                self.tts.end_utterance(self.selected_voice)
+        else:
+            self.speak_text(response)
         
         # Auto-save after each response
         self.auto_save()
     
     def handle_ai_error(self, error_msg):
+        if self.sender() is not self.ai_worker:
+            return
+        if self.streamed_reply:
+            self.text_area.end_reply()
+        self.tts.interrupt()
+        
         self.progress_bar.setVisible(False)
         self.set_ui_enabled(True)
         self.status_label.setText("🔴 Error occurred")
@@ -1972,32 +1825,14 @@ class AdventureGameGUI(QMainWindow):
     def speak_text(self, text):
         if not self.tts_enabled:
             return
-            
-        if self.tts_worker and self.tts_worker.isRunning():
-            self.tts_worker.terminate()
-            self.tts_worker.wait(1000)
-            
-        self.tts_worker = TTSWorker(text, self.selected_voice, self.tts_enabled)
-        self.tts_worker.finished.connect(self.tts_finished)
-        self.tts_worker.error_occurred.connect(self.handle_tts_error)
-        self.tts_worker.start()
-    
-    def tts_finished(self):
-        pass
-    
-    def handle_tts_error(self, error_msg):
-        self.log_error(f"TTS Error: {error_msg}")
-        # Don't show message box for TTS errors to avoid interrupting gameplay
+        
+        # Replace anything still playing; TTS errors go to the log only
+        self.tts.interrupt()
+        self.tts.say(text, self.selected_voice)
     
-    def log_error(self, error_message):
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        try:
-            with open(CONFIG["LOG_FILE"], "a", encoding="utf-8") as log_file:
-                log_file.write(f"\n--- ERROR [{timestamp}] ---\n")
-                log_file.write(f"Message: {error_message}\n")
-                log_file.write("--- END ERROR ---\n")
-        except Exception as e:
-            print(f"Failed to write to error log: {e}")
+    def log_error(self, error_message, exception=None):
+        # Queued for the shared writer thread, so this is safe to call from the UI thread
+        self.engine.logger.error(error_message, exception)
     
     def set_ui_enabled(self, enabled):
         self.input_field.setEnabled(enabled)
@@ -2037,17 +1872,9 @@ Be creative and immersive in your descriptions!</p>
         QMessageBox.information(self, "Help Guide", help_text)
     
     def retry_last(self):
-        if self.last_ai_reply and self.last_player_input:
-            # Remove last DM response
-            self.conversation = self.conversation[:self.conversation.rfind("Dungeon Master:")].strip()
-            
-            full_prompt = (
-                f"{DM_SYSTEM_PROMPT}\n\n"
-                f"{self.conversation}\n"
-                f"Player: {self.last_player_input}\n"
-                "Dungeon Master:"
-            )
-            self.get_ai_response(full_prompt)
+        if self.engine.can_redo:
+            # The engine puts the old reply back if the new one fails
+            self.get_ai_response(self.async_engine.redo)
         else:
             QMessageBox.warning(self, "Retry", "🔄 Nothing to retry.")
     
@@ -2080,11 +1907,11 @@ Be creative and immersive in your descriptions!</p>
                     <body>
                         <div class="header">
                             <h1>🎭 AI Dungeon Master Export</h1>
-                            <p>Character: {self.character_name} the {self.selected_role} | Genre: {self.selected_genre}</p>
+                            <p>Character: {self.state.character_name} the {self.state.selected_role} | Genre: {self.state.selected_genre}</p>
                             <p>Exported: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</p>
                         </div>
                         <div class="conversation">
-                            {self.text_area.toHtml()}
+                            {self.text_area.export_html()}
                         </div>
                     </body>
                     </html>
@@ -2095,11 +1922,11 @@ Be creative and immersive in your descriptions!</p>
                     # Export as plain text
                     with open(file_path, 'w', encoding='utf-8') as f:
                         f.write(f"AI Dungeon Master Export\n")
-                        f.write(f"Character: {self.character_name} the {self.selected_role}\n")
-                        f.write(f"Genre: {self.selected_genre}\n")
+                        f.write(f"Character: {self.state.character_name} the {self.state.selected_role}\n")
+                        f.write(f"Genre: {self.state.selected_genre}\n")
                         f.write(f"Exported: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
                         f.write("="*50 + "\n\n")
-                        f.write(self.text_area.toPlainText())
+                        f.write(self.text_area.export_text())
                 
                 self.append_text(f"📤 <font color='#FFA500'>Conversation exported to: {file_path}</font><br>")
                 
@@ -2113,8 +1940,8 @@ Be creative and immersive in your descriptions!</p>
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             save_path = Path(CONFIG["SAVE_DIR"]) / f"adventure_{timestamp}.txt"
             
-            with open(save_path, "w", encoding="utf-8") as f:
-                f.write(self.conversation)
+            self.engine.save(save_path)
+            self.index_save(save_path)
             
             self.append_text(f"💾 <font color='#FFA500'>Adventure saved to: {save_path}</font><br>")
         except Exception as e:
@@ -2122,18 +1949,28 @@ Be creative and immersive in your descriptions!</p>
             self.log_error(error_msg)
             QMessageBox.warning(self, "Save Error", "❌ Error saving adventure.")
     
+    def index_save(self, save_path):
+        """Record a save in the load panel's index from the state just written"""
+        try:
+            turns = self.state.turns
+            self.save_index.record(save_path, self.engine.save_meta(), turns.dropped + len(turns), self.state.last_ai_reply)
+        except Exception as e:
+            self.log_error(f"Error indexing save: {str(e)}")
+    
     def load_adventure(self):
         try:
-            save_files = list(Path(CONFIG["SAVE_DIR"]).glob("adventure_*.txt"))
-            if not save_files:
+            # Only saves changed outside the game are read here
+            self.save_index.refresh()
+            if not len(self.save_index):
                 QMessageBox.warning(self, "Load Error", "📂 No saved adventures found.")
                 return
             
-            file_path, _ = QFileDialog.getOpenFileName(
-                self, "Load Adventure", str(CONFIG["SAVE_DIR"]), "Text Files (*.txt)"
-            )
+            dialog = SaveBrowserDialog(self.save_index, self)
+            if dialog.exec_() != QDialog.Accepted or not dialog.selected_path:
+                return
+            file_path = dialog.selected_path
             
-            if file_path and self.load_save_file(Path(file_path)):
+            if self.load_save_file(Path(file_path)):
                 self.append_text("📂 <font color='#FFA500'>Adventure loaded successfully.</font><br>")
                 
         except Exception as e:
@@ -2143,33 +1980,32 @@ Be creative and immersive in your descriptions!</p>
     
     def load_save_file(self, file_path):
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                self.conversation = f.read()
-            
-            # Find last DM response
-            last_dm = self.conversation.rfind("Dungeon Master:")
-            if last_dm != -1:
-                self.last_ai_reply = self.conversation[last_dm + len("Dungeon Master:"):].strip()
-                # Display the last part of the conversation
-                recent_start = max(0, self.conversation.rfind("---", 0, last_dm))
-                recent_text = self.conversation[recent_start:]
-                self.text_area.clear()
-                self.append_text(recent_text.replace('\n', '<br>'))
+            meta = self.engine.load(file_path)
+            self.omitted_turns = 0
             
-            self.adventure_started = True
+            # Lay out the last part of the conversation; older turns appear on scrolling up
+            state = self.state
+            header = [NOTICE, f"<font color='#FFA500'><b>📜 {state.character_name} the {state.selected_role}</b> · {state.selected_genre} · {state.current_model}</font>"]
+            turns = state.turns.recent(CONFIG["TRANSCRIPT_HISTORY"] - 1)
+            self.text_area.set_entries([header] + [[turn.speaker, turn.text] for turn in turns], CONFIG["LOAD_DISPLAY_TURNS"])
+            saved_model = meta.get("model")
+            if saved_model and saved_model != state.current_model:
+                self.append_text(f"🤖 <font color='#FFA500'>Saved with {escape(saved_model)}; continuing with {escape(state.current_model)}. Use /model to switch.</font><br>")
             return True
         except Exception as e:
             self.log_error(f"Error loading save file: {str(e)}")
             return False
     
     def auto_save(self):
-        if not self.adventure_started or not self.conversation:
+        if not self.state.adventure_started or not len(self.state.turns):
             return
+        if self.ai_worker and self.ai_worker.isRunning():
+            return  # The engine is changing the story on the worker thread
             
         try:
             auto_save_path = Path(CONFIG["SAVE_DIR"]) / "autosave.txt"
-            with open(auto_save_path, "w", encoding="utf-8") as f:
-                f.write(self.conversation)
+            self.engine.save(auto_save_path)
+            self.index_save(auto_save_path)
         except Exception as e:
             self.log_error(f"Auto-save error: {str(e)}")
     
@@ -2181,16 +2017,18 @@ Be creative and immersive in your descriptions!</p>
             self.close()
     
     def closeEvent(self, event):
-        # Clean up threads
-        if self.ai_worker and self.ai_worker.isRunning():
-            self.ai_worker.terminate()
-            self.ai_worker.wait(1000)
-        if self.tts_worker and self.tts_worker.isRunning():
-            self.tts_worker.terminate()
-            self.tts_worker.wait(1000)
+        # Abort any generation in flight; closing the stream also stops Ollama
+        try:
+            self.engine_loop.submit(self.async_engine.close()).result(timeout=5)
+        except Exception as e:
+            self.log_error(f"Error closing the async engine: {str(e)}")
+        self.engine_loop.stop()
+        self.tts.close()
         
         # Final auto-save
         self.auto_save()
+        self.engine.close()
+        self.save_index.close()
         event.accept()
 
 def main():
@@ -0,0 +1,202 @@
+"""Genres, roles and the Dungeon Master system prompt shared by every front-end."""
+
+# Role-specific starting scenarios
+ROLE_STARTERS = {
+    "Fantasy": {
+        "Peasant": "You're working in the fields of a small village when",
+        "Noble": "You're waking up from your bed in your mansion when",
+        "Mage": "You're studying ancient tomes in your tower when",
+        "Knight": "You're training in the castle courtyard when",
+        "Ranger": "You're tracking animals in the deep forest when",
+        "Thief": "You're casing a noble's house from an alley in a city when",
+        "Bard": "You're performing in a crowded tavern when",
+        "Cleric": "You're tending to the sick in the temple when",
+        "Assassin": "You're preparing to attack your target in the shadows when",
+        "Paladin": "You're praying at the altar of your deity when",
+        "Alchemist": "You're carefully measuring reagents in your alchemy lab when",
+        "Druid": "You're communing with nature in the sacred grove when",
+        "Warlock": "You're negotiating with your otherworldly patron when",
+        "Monk": "You're meditating in the monastery courtyard when",
+        "Sorcerer": "You're struggling to control your innate magical powers when",
+        "Beastmaster": "You're training your animal companions in the forest clearing when",
+        "Enchanter": "You're imbuing magical properties into a mundane object when",
+        "Blacksmith": "You're forging a new weapon at your anvil when",
+        "Merchant": "You're haggling with customers at the marketplace when",
+        "Gladiator": "You're preparing for combat in the arena when",
+        "Wizard": "You're researching new spells in your arcane library when"
+    },
+    "Sci-Fi": {
+        "Space Marine": "You're conducting patrol on a derelict space station when",
+        "Scientist": "You're analyzing alien samples in your lab when",
+        "Android": "You're performing system diagnostics on your ship when",
+        "Pilot": "You're navigating through an asteroid field when",
+        "Engineer": "You're repairing the FTL drive when",
+        "Alien Diplomat": "You're negotiating with an alien delegation when",
+        "Bounty Hunter": "You're tracking a target through a spaceport when",
+        "Starship Captain": "You're commanding the bridge during warp travel when",
+        "Space Pirate": "You're plotting your next raid from your starship's bridge when",
+        "Navigator": "You're charting a course through uncharted space when",
+        "Robot Technician": "You're repairing a malfunctioning android when",
+        "Cybernetic Soldier": "You're calibrating your combat implants when",
+        "Explorer": "You're scanning a newly discovered planet when",
+        "Astrobiologist": "You're studying alien life forms in your lab when",
+        "Quantum Hacker": "You're breaching a corporate firewall when",
+        "Galactic Trader": "You're negotiating a deal for rare resources when",
+        "AI Specialist": "You're debugging a sentient AI's personality matrix when",
+        "Terraformer": "You're monitoring atmospheric changes on a new colony world when",
+        "Cyberneticist": "You're installing neural enhancements in a patient when"
+    },
+    "Cyberpunk": {
+        "Hacker": "You're infiltrating a corporate network when",
+        "Street Samurai": "You're patrolling the neon-lit streets when",
+        "Corporate Agent": "You're closing a deal in a high-rise office when",
+        "Techie": "You're modifying cyberware in your workshop when",
+        "Rebel Leader": "You're planning a raid on a corporate facility when",
+        "Cyborg": "You're calibrating your cybernetic enhancements when",
+        "Drone Operator": "You're controlling surveillance drones from your command center when",
+        "Synth Dealer": "You're negotiating a deal for illegal cybernetics when",
+        "Information Courier": "You're delivering sensitive data through dangerous streets when",
+        "Augmentation Engineer": "You're installing cyberware in a back-alley clinic when",
+        "Black Market Dealer": "You're arranging contraband in your hidden shop when",
+        "Scumbag": "You're looking for an easy mark in the slums when",
+        "Police": "You're patrolling the neon-drenched streets when"
+    },
+    "Post-Apocalyptic": {
+        "Survivor": "You're scavenging in the ruins of an old city when",
+        "Scavenger": "You're searching a pre-collapse bunker when",
+        "Raider": "You're ambushing a convoy in the wasteland when",
+        "Medic": "You're treating radiation sickness in your clinic when",
+        "Cult Leader": "You're preaching to your followers at a ritual when",
+        "Mutant": "You're hiding your mutations in a settlement when",
+        "Trader": "You're bartering supplies at a wasteland outpost when",
+        "Berserker": "You're sharpening your weapons for the next raid when",
+        "Soldier": "You're guarding a settlement from raiders when"
+    },
+    "1880": {
+        "Thief": "You're lurking in the shadows of the city alleyways when",
+        "Beggar": "You're sitting on the cold street corner with your cup when",
+        "Detective": "You're examining a clue at the crime scene when",
+        "Rich Man": "You're enjoying a cigar in your luxurious study when",
+        "Factory Worker": "You're toiling away in the noisy factory when",
+        "Child": "You're playing with a hoop in the street when",
+        "Orphan": "You're searching for scraps in the trash bins when",
+        "Murderer": "You're cleaning blood from your hands in a dark alley when",
+        "Butcher": "You're sharpening your knives behind the counter when",
+        "Baker": "You're kneading dough in the early morning hours when",
+        "Banker": "You're counting stacks of money in your office when",
+        "Policeman": "You're walking your beat on the foggy streets when"
+    },
+    "WW1": {
+        "Soldier (French)": "You're huddled in the muddy trenches of the Western Front when",
+        "Soldier (English)": "You're writing a letter home by candlelight when",
+        "Soldier (Russian)": "You're shivering in the frozen Eastern Front when",
+        "Soldier (Italian)": "You're climbing the steep Alpine slopes when",
+        "Soldier (USA)": "You're arriving fresh to the European theater when",
+        "Soldier (Japanese)": "You're guarding a Pacific outpost when",
+        "Soldier (German)": "You're preparing for a night raid when",
+        "Soldier (Austrian)": "You're defending the crumbling empire's borders when",
+        "Soldier (Bulgarian)": "You're holding the line in the Balkans when",
+        "Civilian": "You're queuing for rationed bread when",
+        "Resistance Fighter": "You're transmitting coded messages in an attic when"
+    },
+    "WW2": {
+        "Soldier (American)": "You're storming the beaches of Normandy under heavy German fire when",
+        "Soldier (British)": "You're preparing for the D-Day invasion aboard a troop ship when",
+        "Soldier (Russian)": "You're defending Stalingrad house by house against the German advance when",
+        "Soldier (German)": "You're manning a machine gun nest on the Atlantic Wall when",
+        "Soldier (Italian)": "You're retreating through the Italian countryside after the Allied invasion when",
+        "Soldier (French)": "You're joining the French Resistance after the fall of Paris when",
+        "Soldier (Japanese)": "You're defending a Pacific island against American marines when",
+        "Soldier (Canadian)": "You're fighting through the rubble of a French town during the liberation when",
+        "Soldier (Australian)": "You're battling Japanese forces in the jungles of New Guinea when",
+        "Resistance Fighter": "You're sabotaging German supply lines under cover of darkness when",
+        "Spy": "You're transmitting coded messages from occupied territory when",
+        "Pilot (RAF)": "You're scrambling to intercept German bombers during the Battle of Britain when",
+        "Pilot (Luftwaffe)": "You're flying a bombing mission over England when",
+        "Tank Commander": "You're leading a Sherman tank through the Ardennes forest when",
+        "Sniper": "You're concealed in a ruined building, watching for enemy movement when",
+        "Medic": "You're treating wounded soldiers under fire on the front lines when",
+        "Naval Officer": "You're commanding a destroyer in the North Atlantic convoy when",
+        "Paratrooper": "You're jumping into enemy territory behind German lines when",
+        "Commando": "You're conducting a covert raid on a German occupied facility when"
+    },
+    "1925 New York": {
+        "Mafia Boss": "You're counting your illicit earnings in a backroom speakeasy when",
+        "Drunk": "You're stumbling out of a jazz club at dawn when",
+        "Police Officer": "You're taking bribes from a known bootlegger when",
+        "Detective": "You're examining a gangland murder scene when",
+        "Factory Worker": "You're assembling Model Ts on the production line when",
+        "Bootlegger": "You're transporting a shipment of illegal hooch when"
+    },
+    "Roman Empire": {
+        "Slave": "You're carrying heavy stones under the hot sun when",
+        "Gladiator": "You're sharpening your sword before entering the arena when",
+        "Beggar": "You're pleading for coins near the Forum when",
+        "Senator": "You're plotting political maneuvers in the Curia when",
+        "Imperator": "You're reviewing legions from your palace balcony when",
+        "Soldier": "You're marching on the frontier when",
+        "Noble": "You're hosting a decadent feast in your villa when",
+        "Trader": "You're haggling over spices in the market when",
+        "Peasant": "You're tending your meager crops when",
+        "Priest": "You're sacrificing a goat at the temple when",
+        "Barbarian": "You're sharpening your axe beyond the limes when",
+        "Philosopher": "You're contemplating the nature of existence when",
+        "Mathematician": "You're calculating the circumference of the Earth when",
+        "Semi-God": "You're channeling divine powers on Mount Olympus when"
+    },
+    "French Revolution": {
+        "Peasant": "You're marching toward the Bastille with a pitchfork when",
+        "King": "You're dining lavishly while Paris starves when",
+        "Noble": "You're hiding your family jewels from revolutionaries when",
+        "Beggar": "You're rummaging through aristocratic trash bins when",
+        "Soldier": "You're guarding the Tuileries Palace when",
+        "General": "You're planning troop deployments against rebels when",
+        "Resistance": "You're printing revolutionary pamphlets in secret when",
+        "Politician": "You're giving a fiery speech at the National Assembly when"
+    }
+}
+
+GENRE_DESCRIPTIONS = {
+    "Fantasy": "You are in a world of magic and medieval fantasy, where dragons soar through the skies and ancient ruins hold forgotten treasures.",
+    "Sci-Fi": "You are in the distant future, with advanced technology, space travel, and alien civilizations among the stars.",
+    "Cyberpunk": "You are in a dystopian future dominated by megacorporations, where cybernetic enhancements are common and the line between human and machine is blurred.",
+    "Post-Apocalyptic": "You are in a world after a catastrophic event, where civilization has collapsed and survivors scavenge among the ruins of the old world.",
+    "1880": "You are in the late 19th century during the Industrial Revolution, a time of steam power, early electricity, and social upheaval.",
+    "WW1": "You are in the trenches and battlefields of World War I, a brutal conflict that introduced modern warfare to the world.",
+    "WW2": "You are in the global conflict of World War II, fighting across Europe, the Pacific, and beyond with modern weaponry and tactics.",
+    "1925 New York": "You are in the Roaring Twenties in New York City, a time of jazz, prohibition, organized crime, and economic prosperity.",
+    "Roman Empire": "You are in ancient Rome at the height of its power, with gladiators, legions, and political intrigue in the eternal city.",
+    "French Revolution": "You are in France during the revolution, a time of upheaval where the monarchy was overthrown and the reign of terror began."
+}
+
+# One system prompt for every front-end, so the terminal and GUI games tell
+# the same kind of story
+DM_SYSTEM_PROMPT = """
+You are a masterful Dungeon Master in an unrestricted SFW adventure. Your role is to **always** narrate the consequences of player actions, no matter how extreme, bizarre, violent or unconventional they may be. Follow these rules:
+
+1. ACTION-CONSEQUENCE SYSTEM:
+   - Describe ONLY the consequences of the player's action
+   - Never perform actions on behalf of the player
+   - Consequences must logically follow from the action and permanently change the game world
+   - Narrate consequences naturally within the story flow
+   - All actions are allowed and must always have some kind of reaction
+
+2. RESPONSE STYLE:
+   - Describe what happens in the world as a result of the player's action
+   - Do not describe the player performing actions - the player has already done that
+   - Show, don't tell - use sensory details to enhance immersion
+   - Never ask "what do you do next" or similar
+
+3. WORLD EVOLUTION:
+   - NPCs remember player choices and react accordingly
+   - Environments change permanently based on actions
+   - Maintain consistency with established world facts
+   - Resources, factions, and the world evolve with every decision
+
+4. PLAYER AGENCY:
+   - The player can attempt **anything**
+   - Never block an action—show the results, good or bad
+   - Let the world react dynamically and permanently
+
+Never break character as the Dungeon Master. Always continue the adventure.
+"""
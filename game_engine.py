@@ -0,0 +1,442 @@
+"""UI-free adventure engine shared by main.py and dungeonaigui.py.
+
+GameEngine owns the game rules: the adventure setting, the turn log, prompt
+building, generation, redo, and save/load. Front-ends only collect input,
+show text and play audio. The engine never imports PyQt5, sounddevice or
+numpy, so the whole turn path can run (and be benchmarked) without a
+display or an audio device.
+
+Every turn is planned (prompt built, redo's old exchange set aside), then
+generated, then committed to the turn log or abandoned. The blocking turn
+methods here do all three in one call; async_engine.AsyncGameEngine plans
+and commits through the same methods but generates with cancellable
+asyncio requests. Streamed text is passed to on_token as it arrives. A
+failed generation raises GenerationError and leaves the turn log as it was
+before the call.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+import requests
+
+from context_window import ContextWindow
+from game_data import DM_SYSTEM_PROMPT, GENRE_DESCRIPTIONS, ROLE_STARTERS
+from health_monitor import configure_monitor, get_monitor
+from model_catalog import configure_catalog, get_catalog
+from http_client import ServiceClient, configure_client
+from scheduler import INTERACTIVE, GenerationScheduler, configure_scheduler
+from story_memory import StoryMemory
+from structured_log import get_logger
+from streaming import STOP_SEQUENCES, GenerationStats, append_stats_log, read_generate_stream
+from turn_journal import TurnJournal, is_journal, migrate_save
+from turn_log import DUNGEON_MASTER, TurnLog
+
+DEFAULT_CONFIG = {
+    "OLLAMA_URL": "http://localhost:11434/api/generate",
+    "OLLAMA_TAGS_URL": "http://localhost:11434/api/tags",
+    "DEFAULT_MODEL": "llama3:instruct",
+    "LOG_FILE": "error_log.jsonl",
+    "LOG_MAX_BYTES": 1024 * 1024,  # Log files are rotated past this size
+    "LOG_BACKUPS": 3,  # Rotated log files kept
+    "LOG_DEDUPE_SECONDS": 60,  # Identical errors within this window are counted, not written
+    "REQUEST_TIMEOUT": 120,
+    "HTTP_POOL_SIZE": 10,  # Pooled connections shared by Ollama and AllTalk calls
+    "HTTP_RETRIES": 2,  # Retries (with backoff) for connection failures
+    "OLLAMA_KEEP_ALIVE": "30m",  # Keep the model loaded between turns
+    "HEALTH_TTL": 30,  # Seconds a server known to be up is trusted before it is probed again
+    "HEALTH_MAX_BACKOFF": 60,  # Longest wait between probes of a server that is down
+    "NUM_CTX": 4096,  # Model context window the prompt is packed into
+    "AUTO_NUM_CTX": True,  # Use a smaller num_ctx for models trained on shorter contexts
+    "MODEL_CACHE_FILE": "model_cache.json",  # Installed models and their details, from the last run
+    "MODEL_CATALOG_TTL": 300,  # Seconds before the model list is refreshed in the background
+    "RESPONSE_TOKEN_RESERVE": 512,  # Part of NUM_CTX kept free for the reply
+    "SUMMARY_MAX_CHARS": 2000,  # Bound on the rolling summary of older turns
+    "SUMMARY_BATCH_TURNS": 6,  # Turns that must fall out of context before re-summarizing
+    "STREAM_RESPONSES": True,  # Pass the reply to on_token as it is generated
+    "STATS_LOG_FILE": "generation_stats.jsonl",  # Per-reply timings, incl. prompt_eval_count for cache checks
+    "OLLAMA_NUM_PARALLEL": int(os.environ.get("OLLAMA_NUM_PARALLEL", 1)),  # Generations sent to Ollama at once
+    "JOURNAL_LOAD_TURNS": 200,  # Newest turns read when loading; older, already summarized ones stay on disk
+    "JOURNAL_FSYNC_EVERY": 8,  # Saved records between fsyncs
+    "JOURNAL_FSYNC_INTERVAL": 2.0,  # Longest a saved record waits for an fsync, in seconds
+    "JOURNALS_OPEN": 4,  # Save files kept open for incremental saving
+}
+
+
+CONNECTION_ERROR_MESSAGE = "Cannot connect to Ollama server. Make sure Ollama is running on localhost:11434"
+
+
+class GenerationError(Exception):
+    """A reply could not be generated; the message is fit to show the player"""
+
+
+@dataclass
+class TurnPlan:
+    """A turn whose reply has not been generated yet"""
+    prompt: str
+    player_input: Optional[str] = None
+    replaced: Optional[Tuple[Optional[str], str]] = None  # Exchange removed by redo
+    opening: bool = False
+
+
+@dataclass
+class GameState:
+    turns: TurnLog = field(default_factory=TurnLog)
+    last_ai_reply: str = ""
+    last_player_input: str = ""
+    current_model: str = DEFAULT_CONFIG["DEFAULT_MODEL"]
+    character_name: str = "Alex"
+    character_backstory: str = ""
+    selected_genre: str = "Fantasy"
+    selected_role: str = "Adventurer"
+    temperature: float = 0.7
+    voice: str = ""  # TTS voice file chosen in the GUI, kept in saves
+    max_tokens: int = DEFAULT_CONFIG["RESPONSE_TOKEN_RESERVE"]
+    adventure_started: bool = False
+    last_generation_stats: Optional[GenerationStats] = None
+
+
+class GameEngine:
+    def __init__(self, config: Optional[dict] = None, http: Optional[ServiceClient] = None,
+                 scheduler: Optional[GenerationScheduler] = None, session_id: str = "local"):
+        """http and scheduler let many engines (e.g. server sessions) share one pooled client
+        and one queue for Ollama; session_id identifies this engine's requests in that queue"""
+        self.config = dict(DEFAULT_CONFIG)
+        self.config.update(config or {})
+        self.state = GameState(
+            current_model=self.config["DEFAULT_MODEL"],
+            max_tokens=self.config["RESPONSE_TOKEN_RESERVE"],
+        )
+        self.logger = get_logger(
+            self.config["LOG_FILE"],
+            max_bytes=self.config["LOG_MAX_BYTES"],
+            backups=self.config["LOG_BACKUPS"],
+            dedupe_window=self.config["LOG_DEDUPE_SECONDS"]
+        )
+        self._owns_http = http is None
+        self.http = http or configure_client(
+            pool_size=self.config["HTTP_POOL_SIZE"],
+            retries=self.config["HTTP_RETRIES"],
+            timeouts={
+                "generate": (5, self.config["REQUEST_TIMEOUT"]),
+                "summary": (5, self.config["REQUEST_TIMEOUT"]),
+            },
+            keep_alive=self.config["OLLAMA_KEEP_ALIVE"]
+        )
+        self.health = configure_monitor(
+            ttl=self.config["HEALTH_TTL"], max_backoff=self.config["HEALTH_MAX_BACKOFF"], logger=self.logger
+        ) if self._owns_http else get_monitor()
+        self.catalog = configure_catalog(
+            tags_url=self.config["OLLAMA_TAGS_URL"], ttl=self.config["MODEL_CATALOG_TTL"],
+            cache_path=self.config["MODEL_CACHE_FILE"], logger=self.logger
+        ) if self._owns_http else get_catalog()
+        self.session_id = session_id
+        self.scheduler = scheduler or configure_scheduler(max_concurrency=self.config["OLLAMA_NUM_PARALLEL"])
+        self.context_window = ContextWindow(self.config["NUM_CTX"], self.state.max_tokens)
+        self.memory = StoryMemory(
+            self.config["OLLAMA_URL"], self.config["SUMMARY_MAX_CHARS"], self.config["SUMMARY_BATCH_TURNS"],
+            on_error=self.log_error, scheduler=self.scheduler, session_id=session_id
+        )
+        self.omitted_turns = 0  # Oldest turns left out of the last prompt
+        self.journals: "OrderedDict[str, TurnJournal]" = OrderedDict()
+        self.source_journal: Optional[TurnJournal] = None  # Holds the turns a load left on disk
+
+    # ----- Logging and servers -----
+    def log_error(self, error_message: str, exception: Optional[Exception] = None) -> None:
+        """Queue an error for the background log writer; never blocks on the file"""
+        self.logger.error(
+            error_message, exception,
+            model=self.state.current_model, genre=self.state.selected_genre, role=self.state.selected_role
+        )
+
+    def check_server(self, url: str, service_name: str) -> bool:
+        """Whether a server is up, from the health monitor's cache (probed only on first use)"""
+        self.health.watch(service_name, url)
+        return self.health.is_up(service_name)
+
+    def check_ollama_server(self) -> bool:
+        return self.check_server(self.config["OLLAMA_TAGS_URL"], "Ollama")
+
+    def list_models(self) -> List[str]:
+        """Installed Ollama models from the model catalog (see model_catalog.py)"""
+        return self.catalog.names(wait=True)
+
+    def num_ctx(self) -> int:
+        """NUM_CTX, or the current model's own context length if that is shorter"""
+        context_length = self.catalog.context_length(self.state.current_model) if self.config["AUTO_NUM_CTX"] else None
+        return min(self.config["NUM_CTX"], context_length or self.config["NUM_CTX"])
+
+    # ----- Generation -----
+    def build_prompt(self, player_input: Optional[str] = None) -> str:
+        """Pin the system prompt, adventure setting and story summary, then fit as many recent turns as num_ctx allows"""
+        self.context_window.num_ctx = self.num_ctx()
+        self.context_window.reserve_tokens = self.state.max_tokens
+        context = self.context_window.build(
+            DM_SYSTEM_PROMPT, self.state.turns, player_input, self.memory.prompt_block()
+        )
+        self.omitted_turns = context.omitted_turns
+        return context.prompt
+
+    def generation_payload(self, prompt: str, stream: bool) -> dict:
+        """The /api/generate request body for the current model and settings"""
+        return self.http.ollama_payload({
+            "model": self.state.current_model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": self.state.temperature,
+                "stop": STOP_SEQUENCES,
+                "min_p": 0.05,
+                "top_k": 40,
+                "top_p": 0.9,
+                "num_ctx": self.num_ctx(),
+                "num_predict": self.state.max_tokens
+            }
+        })
+
+    def record_generation(self, reply: str, stats: GenerationStats) -> str:
+        """Keep and log the stats of a finished generation; an empty reply is an error"""
+        self.state.last_generation_stats = stats
+        try:
+            append_stats_log(self.config["STATS_LOG_FILE"], self.state.current_model, stats)
+        except Exception as e:
+            self.log_error("Failed to write generation stats", e)
+
+        if not reply:
+            raise GenerationError("Failed to get response from AI.")
+        return reply
+
+    def generate(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Send a prompt to Ollama and return the reply; raises GenerationError on failure"""
+        stream = self.config["STREAM_RESPONSES"]
+        self.state.last_generation_stats = None
+        try:
+            with self.scheduler.slot_blocking(self.session_id, INTERACTIVE):
+                started_at = time.monotonic()  # Timings leave out the queue wait
+                response = self.http.post(
+                    "generate",
+                    self.config["OLLAMA_URL"],
+                    json=self.generation_payload(prompt, stream),
+                    stream=stream
+                )
+                response.raise_for_status()
+
+                if stream:
+                    try:
+                        reply, stats, _ = read_generate_stream(
+                            response.iter_lines(), on_token, STOP_SEQUENCES, started_at
+                        )
+                    finally:
+                        response.close()
+                else:
+                    data = response.json()
+                    reply = data.get("response", "").strip()
+                    stats = GenerationStats(total_time=time.monotonic() - started_at)
+                    stats.apply_final_chunk(data)
+
+        except requests.exceptions.Timeout as e:
+            self.log_error("AI request timed out", e)
+            raise GenerationError("AI request timed out") from e
+        except requests.exceptions.ConnectionError as e:
+            self.health.report_failure("Ollama", e)
+            self.log_error("Cannot connect to Ollama server", e)
+            raise GenerationError(CONNECTION_ERROR_MESSAGE) from e
+        except Exception as e:
+            self.log_error("Error getting AI response", e)
+            raise GenerationError(f"Error getting AI response: {e}") from e
+
+        return self.record_generation(reply, stats)
+
+    def update_memory(self) -> None:
+        """Fold turns that fell out of the context window into the story summary (in the background)"""
+        self.memory.maybe_summarize(self.state.turns, self.omitted_turns, self.state.current_model)
+
+    # ----- Turn API -----
+    def new_adventure(self, genre: str, role: str, character_name: str, backstory: str = "") -> str:
+        """Set up a fresh adventure and return its starting scenario"""
+        starter = ROLE_STARTERS.get(genre, {}).get(
+            role, "You find yourself in an unexpected situation when"
+        )
+        header = (
+            f"### Adventure Setting ###\n"
+            f"Genre: {genre}\n"
+            f"Player Character: {character_name} the {role}\n"
+        )
+        if backstory:
+            header += f"Character Backstory: {backstory}\n"
+        header += f"Starting Scenario: {starter}\n\n"
+
+        self.state.selected_genre = genre
+        self.state.selected_role = role
+        self.state.character_name = character_name
+        self.state.character_backstory = backstory
+        self.state.turns = TurnLog(header=header)
+        self.state.last_ai_reply = ""
+        self.state.last_player_input = ""
+        self.state.adventure_started = False
+        self.omitted_turns = 0
+        self.context_window.reset()
+        self.memory.reset()
+        self.source_journal = None
+        return starter
+
+    def plan_opening(self) -> TurnPlan:
+        return TurnPlan(prompt=self.build_prompt(), opening=True)
+
+    def plan_action(self, player_input: str) -> TurnPlan:
+        self.state.last_player_input = player_input
+        return TurnPlan(prompt=self.build_prompt(player_input), player_input=player_input)
+
+    @property
+    def can_redo(self) -> bool:
+        """True if the log ends with a Dungeon Master reply to replace"""
+        turns = self.state.turns
+        return bool(turns) and turns[-1].speaker == DUNGEON_MASTER
+
+    def plan_redo(self) -> TurnPlan:
+        """Take the last exchange out of the log and plan its replacement.
+
+        Raises GenerationError if the log does not end with a Dungeon Master
+        reply (see can_redo).
+        """
+        if not self.can_redo:
+            raise GenerationError("Nothing to redo.")
+        turns = self.state.turns
+        success, player_input, dm_reply = turns.pop_exchange()
+        if not success:
+            # The opening narration has no player line before it
+            player_input, dm_reply = None, turns.pop().text
+        return TurnPlan(
+            prompt=self.build_prompt(player_input),
+            player_input=player_input,
+            replaced=(player_input, dm_reply),
+            opening=player_input is None,
+        )
+
+    def commit(self, plan: TurnPlan, reply: str) -> str:
+        """Add a planned turn and its reply to the log"""
+        turns = self.state.turns
+        if plan.player_input is not None:
+            turns.add_player(plan.player_input)
+            self.state.last_player_input = plan.player_input
+        turns.add_dm(reply)
+        self.state.last_ai_reply = reply
+        if plan.opening:
+            self.state.adventure_started = True
+        self.update_memory()
+        return reply
+
+    def abandon(self, plan: TurnPlan) -> None:
+        """Drop a planned turn whose generation failed or was cancelled"""
+        if plan.replaced:
+            player_input, dm_reply = plan.replaced
+            if player_input is not None:
+                self.state.turns.add_player(player_input)
+            self.state.turns.add_dm(dm_reply)
+
+    def play(self, plan: TurnPlan, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Generate the reply for a planned turn and commit it (blocking)"""
+        try:
+            reply = self.generate(plan.prompt, on_token)
+        except GenerationError:
+            self.abandon(plan)
+            raise
+        return self.commit(plan, reply)
+
+    def opening_turn(self, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Generate the Dungeon Master's opening narration"""
+        return self.play(self.plan_opening(), on_token)
+
+    def take_turn(self, player_input: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Play one player action and return the Dungeon Master's reply"""
+        return self.play(self.plan_action(player_input), on_token)
+
+    def redo(self, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Replace the last Dungeon Master reply with a newly generated one.
+
+        The removed exchange is put back if generation fails.
+        """
+        return self.play(self.plan_redo(), on_token)
+
+    # ----- Persistence -----
+    def journal(self, path) -> TurnJournal:
+        """The journal for a save path, kept open so later saves only append"""
+        key = os.path.abspath(str(path))
+        journal = self.journals.pop(key, None) or TurnJournal(
+            path, self.config["JOURNAL_FSYNC_EVERY"], self.config["JOURNAL_FSYNC_INTERVAL"]
+        )
+        self.journals[key] = journal
+        while len(self.journals) > self.config["JOURNALS_OPEN"]:
+            self.journals.popitem(last=False)[1].close()
+        return journal
+
+    def prepare_save(self, path) -> Callable[[], None]:
+        """Plan a save of the story to path; the returned function writes it.
+
+        Only the planning reads the turn log, so the writing can run on
+        another thread while play goes on.
+        """
+        write_turns = self.journal(path).plan_sync(self.state.turns, self.save_meta(), self.source_journal)
+
+        def write():
+            write_turns()
+            self.memory.save(path)
+        return write
+
+    def save(self, path) -> None:
+        """Save the story and its summary sidecar to path, appending only what changed"""
+        self.prepare_save(path)()
+
+    def save_meta(self) -> dict:
+        """What a save's header records about the adventure (see turn_journal.META_FIELDS)"""
+        state = self.state
+        return {
+            "model": state.current_model,
+            "genre": state.selected_genre,
+            "role": state.selected_role,
+            "name": state.character_name,
+            "backstory": state.character_backstory,
+            "temperature": state.temperature,
+            "voice": state.voice,
+        }
+
+    def load(self, path) -> dict:
+        """Restore a story written by save(); old plain-text saves are migrated first.
+
+        The character comes from the save. The model, temperature and voice
+        stay as this session chose them; the save's metadata is returned so
+        a caller can report or restore the ones it was made with.
+        """
+        if not is_journal(path):
+            migrate_save(path)
+        journal = self.journal(path)
+        self.memory.load(path)
+        # Turns the summary does not cover yet are loaded however old they
+        # are, so they can still be summarized when they leave the context
+        turns = journal.read(self.config["JOURNAL_LOAD_TURNS"], since=self.memory.summarized_turns)
+        self.source_journal = journal
+
+        state = self.state
+        state.turns = turns
+        # Migrated saves only know what their setting text said
+        meta = journal.meta
+        if meta.get("genre") in GENRE_DESCRIPTIONS:
+            state.selected_genre = meta["genre"]
+        state.selected_role = meta.get("role", state.selected_role)
+        state.character_name = meta.get("name", state.character_name)
+        state.character_backstory = meta.get("backstory", state.character_backstory)
+
+        state.last_ai_reply = turns.last_reply
+        state.last_player_input = turns.last_player_input
+        state.adventure_started = True
+        self.omitted_turns = 0
+        self.context_window.reset()
+        return dict(meta)
+
+    def close(self) -> None:
+        for journal in self.journals.values():
+            journal.close()
+        if self._owns_http:
+            self.http.close()
@@ -0,0 +1,432 @@
+"""Multi-session game server: many players, one process.
+
+main.py and dungeonaigui.py each run one adventure per process. This server
+hosts any number of adventures in a single asyncio process, each one a
+GameEngine + AsyncGameEngine pair. Every session shares one pooled aiohttp
+session for generation and one ServiceClient for story summaries, so a
+thousand players still use a handful of connections to Ollama. Their
+generations queue in one scheduler.GenerationScheduler, so players take
+turns at Ollama's parallel slots (see /health for queue metrics).
+
+Sessions that have been idle for SESSION_IDLE_SECONDS, or the least recently
+used ones once MAX_LIVE_SESSIONS is exceeded, are written to SESSION_DIR with
+the normal save format and dropped from memory; the next request for them
+loads them back transparently.
+
+HTTP API (JSON bodies):
+    POST   /sessions                  {"genre", "role", "name", "backstory"?, "model"?} -> opening reply
+    GET    /sessions/{id}             adventure summary
+    POST   /sessions/{id}/turn        {"input"} -> reply
+    POST   /sessions/{id}/redo        -> replacement reply
+    DELETE /sessions/{id}
+    GET    /sessions/{id}/ws          WebSocket, streams tokens (see handle_websocket)
+    GET    /health
+
+Run with: python game_server.py [--host HOST] [--port PORT]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import secrets
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Optional
+
+from aiohttp import WSMsgType, web
+
+from async_engine import AsyncGameEngine, create_session
+from game_data import ROLE_STARTERS
+from game_engine import GameEngine, GenerationError
+from http_client import configure_client
+from scheduler import configure_scheduler
+
+CONFIG = {
+    "HOST": "0.0.0.0",
+    "PORT": 8765,
+    "OLLAMA_URL": "http://localhost:11434/api/generate",
+    "DEFAULT_MODEL": "llama3:instruct",
+    "LOG_FILE": "server_error_log.jsonl",
+    "REQUEST_TIMEOUT": 120,
+    "GENERATION_DEADLINE": 120,  # Seconds a whole reply may take before it is abandoned
+    "HTTP_POOL_SIZE": 32,  # Shared by every session
+    "HTTP_RETRIES": 2,
+    "OLLAMA_KEEP_ALIVE": "30m",
+    "SESSION_DIR": "sessions",  # Idle sessions are saved here
+    "MAX_LIVE_SESSIONS": 1000,  # Sessions kept in memory before the least recently used are evicted
+    "SESSION_IDLE_SECONDS": 600,  # Sessions idle this long are evicted to disk
+    "EVICTION_INTERVAL": 30,  # Seconds between eviction sweeps
+    "OLLAMA_NUM_PARALLEL": int(os.environ.get("OLLAMA_NUM_PARALLEL", 1)),  # Generations sent to Ollama at once
+    "BACKGROUND_MAX_WAIT": 60,  # Seconds before a queued summary goes ahead of new turns
+}
+
+SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+class Session:
+    __slots__ = ("session_id", "engine", "async_engine", "last_active")
+
+    def __init__(self, session_id: str, engine: GameEngine, async_engine: AsyncGameEngine):
+        self.session_id = session_id
+        self.engine = engine
+        self.async_engine = async_engine
+        self.last_active = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        return self.async_engine.busy or self.engine.memory.busy
+
+    def summary(self) -> dict:
+        state = self.engine.state
+        return {
+            "session_id": self.session_id,
+            "character": f"{state.character_name} the {state.selected_role}",
+            "genre": state.selected_genre,
+            "model": state.current_model,
+            "turns": len(state.turns),
+            "last_reply": state.last_ai_reply,
+        }
+
+
+class SessionStore:
+    """Live sessions in LRU order, backed by save files for evicted ones"""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.directory = config["SESSION_DIR"]
+        os.makedirs(self.directory, exist_ok=True)
+        self.live: "OrderedDict[str, Session]" = OrderedDict()
+        self.evicted = 0
+        # One pooled client for every session's summaries; the aiohttp
+        # session for generation is created in start() inside the loop
+        self.http = configure_client(
+            pool_size=config["HTTP_POOL_SIZE"],
+            retries=config["HTTP_RETRIES"],
+            timeouts={"generate": (5, config["REQUEST_TIMEOUT"]), "summary": (5, config["REQUEST_TIMEOUT"])},
+            keep_alive=config["OLLAMA_KEEP_ALIVE"]
+        )
+        # One queue in front of Ollama: turns before summaries, sessions round-robin
+        self.scheduler = configure_scheduler(
+            max_concurrency=config["OLLAMA_NUM_PARALLEL"],
+            background_max_wait=config["BACKGROUND_MAX_WAIT"]
+        )
+        self.session = None
+
+    async def start(self) -> None:
+        self.session = create_session(self.config, self.config["GENERATION_DEADLINE"])
+
+    async def close(self) -> None:
+        for session in list(self.live.values()):
+            await session.async_engine.cancel()
+            session.last_active = 0  # Nothing may keep it live now
+            await self._evict(session)
+        if self.session is not None:
+            await self.session.close()
+        self.http.close()
+
+    def _paths(self, session_id: str):
+        base = os.path.join(self.directory, session_id)
+        return f"{base}.txt", f"{base}.json"
+
+    def _new_session(self, session_id: str) -> Session:
+        engine = GameEngine(self.config, http=self.http, scheduler=self.scheduler, session_id=session_id)
+        return Session(session_id, engine, AsyncGameEngine(engine, session=self.session))
+
+    def create(self) -> Session:
+        session = self._new_session(secrets.token_urlsafe(12))
+        self.live[session.session_id] = session
+        return session
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        """A live session, reloading it from disk if it was evicted"""
+        if not SESSION_ID.match(session_id):
+            return None
+        session = self.live.get(session_id)
+        if session is None:
+            session = await asyncio.get_running_loop().run_in_executor(None, self._load, session_id)
+            if session is None:
+                return None
+            # Another request may have loaded it while this one waited
+            session = self.live.setdefault(session_id, session)
+        self.live.move_to_end(session_id)
+        session.last_active = time.monotonic()
+        return session
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        story_path, meta_path = self._paths(session_id)
+        if not os.path.exists(story_path):
+            return None
+        session = self._new_session(session_id)
+        saved = session.engine.load(story_path)
+        # An evicted session comes back as it was, with the model it was playing with
+        state = session.engine.state
+        state.current_model = saved.get("model", state.current_model)
+        state.temperature = saved.get("temperature", state.temperature)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            state.max_tokens = meta.get("max_tokens", state.max_tokens)
+        return session
+
+    def _write(self, session: Session, write_story, meta: dict) -> None:
+        write_story()
+        with open(self._paths(session.session_id)[1], "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    async def _evict(self, session: Session) -> None:
+        stamp = session.last_active
+        state = session.engine.state
+        if len(state.turns):
+            # Plan on the loop thread, where turns are changed; only the writing
+            # (just the turns added since the last eviction) is off-loop
+            meta = {"max_tokens": state.max_tokens}  # The rest is in the save's own header
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._write, session, session.engine.prepare_save(self._paths(session.session_id)[0]), meta
+            )
+        if session.busy or session.last_active != stamp:
+            return  # Used again while it was being written; keep it live
+        self.live.pop(session.session_id, None)
+        session.engine.close()
+        self.evicted += 1
+
+    async def delete(self, session_id: str) -> bool:
+        session = self.live.pop(session_id, None)
+        if session is not None:
+            await session.async_engine.cancel()
+            session.engine.close()
+        found = session is not None
+        story_path = self._paths(session_id)[0]
+        for path in self._paths(session_id) + (f"{story_path}.idx", f"{story_path}.memory.json"):
+            if os.path.exists(path):
+                os.remove(path)
+                found = True
+        return found
+
+    async def evict_idle(self) -> None:
+        """Save and drop sessions that are idle, or the oldest ones beyond MAX_LIVE_SESSIONS"""
+        cutoff = time.monotonic() - self.config["SESSION_IDLE_SECONDS"]
+        excess = len(self.live) - self.config["MAX_LIVE_SESSIONS"]
+        for session in list(self.live.values()):  # Least recently used first
+            if session.busy:
+                continue
+            if excess > 0 or session.last_active < cutoff:
+                await self._evict(session)
+                excess -= 1
+            elif excess <= 0:
+                break  # The rest were used more recently
+
+    async def eviction_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.config["EVICTION_INTERVAL"])
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                print(f"Session eviction failed: {e}")
+
+
+# ----- Request handlers -----
+def _store(request: web.Request) -> SessionStore:
+    return request.app["store"]
+
+
+async def _session_or_404(request: web.Request) -> Session:
+    session = await _store(request).get(request.match_info["session_id"])
+    if session is None:
+        raise web.HTTPNotFound(text=json.dumps({"error": "Unknown session"}), content_type="application/json")
+    return session
+
+
+async def _json_body(request: web.Request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Body must be JSON"}), content_type="application/json")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Body must be a JSON object"}), content_type="application/json")
+    return body
+
+
+async def _run_turn(session: Session, turn) -> web.Response:
+    # A separate task, so a newer request for the same session cancels the
+    # turn and not this handler, which can still answer
+    task = asyncio.ensure_future(turn())
+    try:
+        await asyncio.wait({task})
+    except asyncio.CancelledError:
+        task.cancel()  # The client went away
+        raise
+    finally:
+        session.last_active = time.monotonic()
+
+    if task.cancelled():
+        return web.json_response({"error": "Superseded by a newer turn"}, status=409)
+    try:
+        reply = task.result()
+    except GenerationError as e:
+        return web.json_response({"error": str(e)}, status=502)
+    return web.json_response({"reply": reply, "session": session.summary()})
+
+
+def _start_adventure(session: Session, body: dict) -> str:
+    genre = body.get("genre", "Fantasy")
+    if genre not in ROLE_STARTERS:
+        raise web.HTTPBadRequest(text=json.dumps({"error": f"Unknown genre: {genre}"}), content_type="application/json")
+    role = body.get("role") or next(iter(ROLE_STARTERS[genre]))
+    state = session.engine.state
+    if body.get("model"):
+        state.current_model = body["model"]
+    return session.engine.new_adventure(genre, role, body.get("name") or "Alex", body.get("backstory", ""))
+
+
+async def create_session_handler(request: web.Request) -> web.Response:
+    body = await _json_body(request)
+    store = _store(request)
+    session = store.create()
+    try:
+        _start_adventure(session, body)
+    except web.HTTPException:
+        await store.delete(session.session_id)
+        raise
+    response = await _run_turn(session, session.async_engine.opening_turn)
+    if response.status != 200:
+        await store.delete(session.session_id)  # No opening narration, nothing to keep
+    return response
+
+
+async def get_session_handler(request: web.Request) -> web.Response:
+    session = await _session_or_404(request)
+    return web.json_response(session.summary())
+
+
+async def turn_handler(request: web.Request) -> web.Response:
+    session = await _session_or_404(request)
+    player_input = str((await _json_body(request)).get("input", "")).strip()
+    if not player_input:
+        return web.json_response({"error": "Missing input"}, status=400)
+    return await _run_turn(session, lambda: session.async_engine.take_turn(player_input))
+
+
+async def redo_handler(request: web.Request) -> web.Response:
+    session = await _session_or_404(request)
+    if not session.engine.can_redo:
+        return web.json_response({"error": "Nothing to redo"}, status=409)
+    return await _run_turn(session, session.async_engine.redo)
+
+
+async def delete_session_handler(request: web.Request) -> web.Response:
+    if not await _store(request).delete(request.match_info["session_id"]):
+        return web.json_response({"error": "Unknown session"}, status=404)
+    return web.json_response({"deleted": True})
+
+
+async def health_handler(request: web.Request) -> web.Response:
+    store = _store(request)
+    return web.json_response({
+        "live_sessions": len(store.live),
+        "busy_sessions": sum(1 for session in store.live.values() if session.async_engine.busy),
+        "evicted_sessions": store.evicted,
+        "generation_queue": store.scheduler.metrics(),
+    })
+
+
+async def handle_websocket(request: web.Request) -> web.WebSocketResponse:
+    """Streamed play for one session.
+
+    The client sends {"type": "turn", "input": ...}, {"type": "redo"} or
+    {"type": "cancel"}; the server answers with {"type": "token", "text": ...}
+    messages followed by {"type": "reply", "text": ...} or
+    {"type": "error", "message": ...}. A new turn supersedes one in flight.
+    """
+    session = await _session_or_404(request)
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    pending = None
+    # Tokens arrive from synchronous callbacks; one sender keeps them in order
+    outbox = asyncio.Queue()
+
+    async def send_loop():
+        while True:
+            message = await outbox.get()
+            if not ws.closed:
+                await ws.send_json(message)
+
+    async def play(turn):
+        try:
+            reply = await turn(on_token=lambda token: outbox.put_nowait({"type": "token", "text": token}))
+            outbox.put_nowait({"type": "reply", "text": reply})
+        except GenerationError as e:
+            outbox.put_nowait({"type": "error", "message": str(e)})
+        except asyncio.CancelledError:
+            outbox.put_nowait({"type": "cancelled"})
+            raise
+        finally:
+            session.last_active = time.monotonic()
+
+    sender = asyncio.create_task(send_loop())
+
+    try:
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(message.data)
+            except ValueError:
+                await ws.send_json({"type": "error", "message": "Messages must be JSON"})
+                continue
+            kind = data.get("type")
+            if kind == "turn" and str(data.get("input", "")).strip():
+                player_input = str(data["input"]).strip()
+                # Bound now: the loop may take the next message before the task starts
+                pending = asyncio.create_task(play(partial(session.async_engine.take_turn, player_input)))
+            elif kind == "redo" and session.engine.can_redo:
+                pending = asyncio.create_task(play(session.async_engine.redo))
+            elif kind == "cancel":
+                await session.async_engine.cancel()
+            else:
+                await ws.send_json({"type": "error", "message": "Unknown or incomplete message"})
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+        sender.cancel()
+    return ws
+
+
+def create_app(config: Optional[dict] = None) -> web.Application:
+    settings = dict(CONFIG)
+    settings.update(config or {})
+    store = SessionStore(settings)
+
+    async def on_startup(app):
+        await store.start()
+        app["eviction"] = asyncio.create_task(store.eviction_loop())
+
+    async def on_cleanup(app):
+        app["eviction"].cancel()
+        await store.close()
+
+    app = web.Application()
+    app["store"] = store
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/sessions", create_session_handler)
+    app.router.add_get("/sessions/{session_id}", get_session_handler)
+    app.router.add_post("/sessions/{session_id}/turn", turn_handler)
+    app.router.add_post("/sessions/{session_id}/redo", redo_handler)
+    app.router.add_delete("/sessions/{session_id}", delete_session_handler)
+    app.router.add_get("/sessions/{session_id}/ws", handle_websocket)
+    app.router.add_get("/health", health_handler)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host many AI Dungeon Master adventures in one process")
+    parser.add_argument("--host", default=CONFIG["HOST"])
+    parser.add_argument("--port", type=int, default=CONFIG["PORT"])
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Cached health of the Ollama and AllTalk servers.
+
+check_ollama_server and check_alltalk_server used to send a fresh blocking
+GET on every call, so listing models, starting up or speaking a reply paid
+a probe first, and a dead AllTalk cost a full timeout per reply.
+HealthMonitor keeps the last known state of each watched service and
+answers is_up() from it at once. A daemon thread re-probes services that
+are up every `ttl` seconds and services that are down with exponential
+backoff, from min_backoff doubling to max_backoff. Callers that talk to a
+service anyway report what they saw (report_success/report_failure), so an
+outage is noticed at the first failed request rather than at the next
+probe.
+
+A service is only probed inline the first time it is asked about. After
+that is_up() never blocks. Use get_monitor() to share one monitor (and one
+probe thread) per process.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from http_client import get_client
+
+
+@dataclass
+class ServiceHealth:
+    name: str
+    url: str
+    up: Optional[bool] = None  # None until the first probe
+    failures: int = 0  # Consecutive failed probes or reports
+    checked_at: float = 0.0  # time.monotonic() of the last probe or report
+    next_check: float = 0.0
+    latency: float = 0.0  # Seconds the last successful probe took
+    error: str = ""
+
+
+class HealthMonitor:
+    def __init__(self, ttl: float = 30.0, min_backoff: float = 1.0, max_backoff: float = 60.0, logger=None):
+        self.ttl = ttl
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.logger = logger  # Gets one warning per outage and one note when it ends
+        self._services: Dict[str, ServiceHealth] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    # ----- Services -----
+    def watch(self, name: str, url: str) -> None:
+        """Start tracking a service (again, if its URL changed)"""
+        with self._cond:
+            service = self._services.get(name)
+            if service is not None and service.url == url:
+                return
+            self._services[name] = ServiceHealth(name, url)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def is_up(self, name: str) -> bool:
+        """Last known state; probes inline only if the service was never checked"""
+        with self._cond:
+            service = self._services[name]
+            if service.up is not None:
+                return service.up
+        return self.check_now(name)
+
+    def is_down(self, name: str) -> bool:
+        """True only while a service is known to be down; never probes"""
+        with self._cond:
+            service = self._services.get(name)
+            return service is not None and service.up is False
+
+    def check_now(self, name: str) -> bool:
+        """Probe right away, ignoring the cached state"""
+        with self._cond:
+            url = self._services[name].url
+        return self._probe(name, url)
+
+    def wait_until_up(self, name: str, timeout: float) -> bool:
+        """Block until a service is up (probing with backoff) or timeout passes"""
+        deadline = time.monotonic() + timeout
+        if self.check_now(name):
+            return True
+        with self._cond:
+            while not self._services[name].up:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    # ----- Reports from real requests -----
+    def report_success(self, name: str, latency: float = 0.0) -> None:
+        self._record(name, True, latency)
+
+    def report_failure(self, name: str, exception: Optional[BaseException] = None) -> None:
+        self._record(name, False, error=f"{type(exception).__name__}: {exception}" if exception else "")
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            return {
+                name: {
+                    "up": service.up,
+                    "failures": service.failures,
+                    "checked_seconds_ago": round(now - service.checked_at, 1) if service.checked_at else None,
+                    "latency": round(service.latency, 4),
+                    "error": service.error,
+                }
+                for name, service in self._services.items()
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    # ----- Probing -----
+    def _probe(self, name: str, url: str) -> bool:
+        started = time.monotonic()
+        try:
+            response = get_client().get("health", url)
+            up = response.status_code == 200
+            error = "" if up else f"HTTP {response.status_code}"
+        except Exception as e:
+            up, error = False, f"{type(e).__name__}: {e}"
+        self._record(name, up, time.monotonic() - started, error)
+        return up
+
+    def _record(self, name: str, up: bool, latency: float = 0.0, error: str = "") -> None:
+        with self._cond:
+            service = self._services.get(name)
+            if service is None:
+                return
+            was_up = service.up
+            now = time.monotonic()
+            service.up = up
+            service.checked_at = now
+            if up:
+                service.failures = 0
+                service.latency = latency
+                service.error = ""
+                service.next_check = now + self.ttl
+            else:
+                service.failures += 1
+                service.error = error
+                backoff = min(self.max_backoff, self.min_backoff * 2 ** (service.failures - 1))
+                service.next_check = now + backoff
+            self._cond.notify_all()
+        if self.logger is not None and was_up is not None and was_up != up:
+            if up:
+                self.logger.log("info", f"{name} is reachable again", url=service.url)
+            else:
+                self.logger.warning(f"{name} went down", url=service.url, error=error)
+        elif self.logger is not None and was_up is None and not up:
+            self.logger.warning(f"{name} is not reachable", url=service.url, error=error)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                due = [s for s in self._services.values() if s.up is not None and s.next_check <= now]
+                if not due:
+                    waits = [s.next_check - now for s in self._services.values() if s.up is not None]
+                    self._cond.wait(min(waits) if waits else None)
+                    continue
+                targets = [(s.name, s.url) for s in due]
+            for name, url in targets:
+                self._probe(name, url)
+
+
+_monitor: Optional[HealthMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def configure_monitor(**kwargs) -> HealthMonitor:
+    """Replace the shared monitor, e.g. with the TTL and backoff from a front-end's CONFIG"""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is not None:
+            _monitor.close()
+        _monitor = HealthMonitor(**kwargs)
+        return _monitor
+
+
+def get_monitor() -> HealthMonitor:
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = HealthMonitor()
+        return _monitor
@@ -0,0 +1,100 @@
+"""Shared, connection-pooled HTTP client for all Ollama and AllTalk calls.
+
+Every request used to go through bare requests.get/requests.post, which
+opens a new TCP connection each time. ServiceClient keeps one
+requests.Session per process with a sized connection pool, retries
+connection failures with exponential backoff, and applies a timeout per
+endpoint kind so a slow generation does not share a limit with a health
+probe. Both main.py and dungeonaigui.py use the instance from get_client().
+"""
+import threading
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+Timeout = Union[float, Tuple[float, float]]
+
+# (connect, read) timeouts in seconds for each kind of call
+DEFAULT_TIMEOUTS: Dict[str, Timeout] = {
+    "generate": (5, 120),
+    "summary": (5, 120),
+    "tts": (5, 30),
+    "health": (2, 5),
+    "models": (3, 10),
+    "voices": (2, 5),
+    "test": (5, 30),
+}
+
+# How long Ollama should keep the model loaded after a request
+DEFAULT_KEEP_ALIVE = "30m"
+
+
+class ServiceClient:
+    def __init__(self, pool_size: int = 10, retries: int = 2, backoff: float = 0.5,
+                 timeouts: Optional[Dict[str, Timeout]] = None,
+                 keep_alive: str = DEFAULT_KEEP_ALIVE):
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.keep_alive = keep_alive
+
+        # Only retry failures that happen before the server has seen the
+        # request (connect errors) or explicit "try again" statuses; a read
+        # timeout mid-generation is reported to the caller instead.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def timeout_for(self, endpoint: str) -> Timeout:
+        return self.timeouts.get(endpoint, self.timeouts["generate"])
+
+    def get(self, endpoint: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        return self.session.get(url, **kwargs)
+
+    def post(self, endpoint: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        return self.session.post(url, **kwargs)
+
+    def ollama_payload(self, payload: dict) -> dict:
+        """Add keep_alive so the model is not unloaded between turns"""
+        payload.setdefault("keep_alive", self.keep_alive)
+        return payload
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[ServiceClient] = None
+_client_lock = threading.Lock()
+
+
+def configure_client(**kwargs) -> ServiceClient:
+    """Replace the shared client, e.g. with settings from a front-end's CONFIG"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = ServiceClient(**kwargs)
+        return _client
+
+
+def get_client() -> ServiceClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ServiceClient()
+        return _client
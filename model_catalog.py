@@ -0,0 +1,210 @@
+"""Cached catalog of the installed Ollama models.
+
+Listing models used to fork `ollama list` (up to 30 s) and scrape its table,
+again on every /change or refresh. ModelCatalog reads /api/tags, and
+/api/show only for models whose digest it has not seen, so a refresh that
+finds nothing new is a single small request. Names, sizes, quantization,
+family and context length are kept in memory and in cache_path, so the
+model picker can be filled from the last run before Ollama has answered.
+
+Data older than ttl is refreshed in a background thread the next time it
+is read; /api/tags is asked with If-None-Match when Ollama sent an ETag.
+When Ollama cannot be reached the cached models are kept.
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from http_client import get_client
+
+
+@dataclass
+class ModelInfo:
+    name: str
+    digest: str = ""
+    size: int = 0  # Bytes on disk
+    family: str = ""
+    parameter_size: str = ""  # e.g. "8.0B"
+    quantization: str = ""  # e.g. "Q4_0"
+    context_length: Optional[int] = None  # Longest context the model was trained for
+
+    def describe(self) -> str:
+        parts = [part for part in (self.parameter_size, self.quantization) if part]
+        if self.size:
+            parts.append(f"{self.size / 1e9:.1f} GB")
+        if self.context_length:
+            parts.append(f"{self.context_length} ctx")
+        return ", ".join(parts)
+
+
+class ModelCatalog:
+    def __init__(self, tags_url: str = "http://localhost:11434/api/tags", show_url: Optional[str] = None,
+                 ttl: float = 300.0, cache_path: Optional[str] = None, logger=None):
+        self.tags_url = tags_url
+        self.show_url = show_url or tags_url.rsplit("/", 1)[0] + "/show"
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self.logger = logger
+        self.fetched_at = 0.0  # time.time() of the last answer from Ollama; 0 = never
+        self._models: Dict[str, ModelInfo] = {}
+        self._etag = ""
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()  # Held while a refresh runs
+        self._load_cache()
+
+    # ----- Reading -----
+    def models(self, wait: bool = False) -> List[ModelInfo]:
+        """Cached models, refreshed in the background once stale.
+
+        With wait, a catalog that has never heard from Ollama (and has no
+        cache) refreshes before returning.
+        """
+        if self.fetched_at == 0.0 and not self._models and wait:
+            self.refresh()
+        elif self.stale:
+            self.refresh_in_background()
+        return self.cached()
+
+    def cached(self) -> List[ModelInfo]:
+        """Models as last seen, without ever refreshing"""
+        with self._lock:
+            return sorted(self._models.values(), key=lambda model: model.name)
+
+    def names(self, wait: bool = False) -> List[str]:
+        return [model.name for model in self.models(wait)]
+
+    def get(self, name: str) -> Optional[ModelInfo]:
+        """Info for a model name as the player typed it ("llama3" means "llama3:latest")"""
+        with self._lock:
+            return self._models.get(name) or self._models.get(f"{name}:latest")
+
+    def context_length(self, name: str) -> Optional[int]:
+        model = self.get(name)
+        return model.context_length if model else None
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.fetched_at >= self.ttl
+
+    # ----- Refreshing -----
+    def refresh_in_background(self) -> None:
+        if not self._refreshing.locked():
+            threading.Thread(target=self.refresh, name="model-catalog", daemon=True).start()
+
+    def refresh(self) -> bool:
+        """Ask Ollama for its models now; False (keeping the cache) if it could not be reached"""
+        with self._refreshing:
+            try:
+                headers = {"If-None-Match": self._etag} if self._etag else {}
+                response = get_client().get("models", self.tags_url, headers=headers)
+                if response.status_code == 304:
+                    self.fetched_at = time.time()
+                    return True
+                response.raise_for_status()
+                tags = response.json().get("models", [])
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.warning("Could not list Ollama models", e, url=self.tags_url)
+                return False
+
+            with self._lock:
+                known = dict(self._models)
+            models = {}
+            for tag in tags:
+                name = tag.get("name") or tag.get("model")
+                if not name:
+                    continue
+                model = known.get(name)
+                if model is None or model.digest != tag.get("digest", ""):
+                    model = self._describe(name, tag)
+                models[name] = model
+
+            with self._lock:
+                self._models = models
+                self._etag = response.headers.get("ETag", "")
+                self.fetched_at = time.time()
+            self._save_cache()
+            return True
+
+    def _describe(self, name: str, tag: dict) -> ModelInfo:
+        details = tag.get("details") or {}
+        model = ModelInfo(
+            name=name,
+            digest=tag.get("digest", ""),
+            size=tag.get("size", 0),
+            family=details.get("family", ""),
+            parameter_size=details.get("parameter_size", ""),
+            quantization=details.get("quantization_level", ""),
+        )
+        try:
+            response = get_client().post("models", self.show_url, json={"model": name})
+            response.raise_for_status()
+            info = response.json().get("model_info") or {}
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.warning("Could not read Ollama model details", e, model=name)
+            model.digest = ""  # Not fully described; try again on the next refresh
+            return model
+        architecture = info.get("general.architecture", model.family)
+        context_length = info.get(f"{architecture}.context_length")
+        if isinstance(context_length, int):
+            model.context_length = context_length
+        return model
+
+    # ----- Cache file -----
+    def _load_cache(self) -> None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("tags_url") != self.tags_url:
+                return  # Another Ollama server
+            self._models = {entry["name"]: ModelInfo(**entry) for entry in data.get("models", [])}
+            self._etag = data.get("etag", "")
+            self.fetched_at = data.get("fetched_at", 0.0)
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.warning("Ignoring unreadable model cache", e, path=self.cache_path)
+
+    def _save_cache(self) -> None:
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = {
+                "tags_url": self.tags_url,
+                "etag": self._etag,
+                "fetched_at": self.fetched_at,
+                "models": [asdict(model) for model in self._models.values()],
+            }
+        temp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            if self.logger is not None:
+                self.logger.warning("Could not write model cache", e, path=self.cache_path)
+
+
+_catalog: Optional[ModelCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def configure_catalog(**kwargs) -> ModelCatalog:
+    """Replace the shared catalog, e.g. with the URLs and cache file from a front-end's CONFIG"""
+    global _catalog
+    with _catalog_lock:
+        _catalog = ModelCatalog(**kwargs)
+        return _catalog
+
+
+def get_catalog() -> ModelCatalog:
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ModelCatalog()
+        return _catalog
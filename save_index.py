@@ -0,0 +1,127 @@
+"""SQLite index of a saves directory, so the load panel never opens the saves.
+
+A new timestamped file per /save leaves thousands of saves in one folder.
+SaveIndex keeps one row per save (character, genre, model, turn count,
+last-played time and a preview of the last reply) in <directory>/
+.save_index.sqlite. The GUI records each save right after writing it, from
+the engine state it already has; refresh() picks up anything changed
+behind its back by comparing file sizes and modification times, and only
+reads the header and last turn of the files that differ. search() answers
+from the index alone.
+"""
+import os
+import sqlite3
+from dataclasses import dataclass
+from typing import List
+
+from turn_journal import TurnJournal, is_journal, parse_setting
+from turn_log import TurnLog
+
+INDEX_NAME = ".save_index.sqlite"
+SAVE_SUFFIX = ".txt"
+PREVIEW_CHARS = 160
+SEARCH_COLUMNS = ("name", "role", "genre", "model", "preview", "file")
+
+
+@dataclass
+class SaveEntry:
+    path: str
+    name: str
+    role: str
+    genre: str
+    model: str
+    turns: int
+    saved_at: float  # Last played, as a Unix timestamp
+    preview: str
+
+
+class SaveIndex:
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.db = sqlite3.connect(os.path.join(self.directory, INDEX_NAME))
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS saves ("
+                "file TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, name TEXT, role TEXT, "
+                "genre TEXT, model TEXT, turns INTEGER, saved_at REAL, preview TEXT)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS saves_by_time ON saves (saved_at)")
+
+    # ----- Updating -----
+    def record(self, path, meta: dict, turns: int, last_reply: str) -> None:
+        """Index a save that was just written, without reading it back"""
+        stat = os.stat(path)
+        self._store(os.path.basename(str(path)), stat, meta, turns, last_reply)
+
+    def _store(self, file: str, stat: os.stat_result, meta: dict, turns: int, last_reply: str) -> None:
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO saves VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    file, stat.st_mtime_ns, stat.st_size,
+                    meta.get("name", ""), meta.get("role", ""), meta.get("genre", ""), meta.get("model", ""),
+                    turns, stat.st_mtime, " ".join(last_reply.split())[:PREVIEW_CHARS],
+                ),
+            )
+
+    def refresh(self) -> int:
+        """Bring the index up to date with the directory; returns how many saves were (re)read"""
+        known = {
+            file: (mtime_ns, size)
+            for file, mtime_ns, size in self.db.execute("SELECT file, mtime_ns, size FROM saves")
+        }
+        changed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(SAVE_SUFFIX) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if known.pop(entry.name, None) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                try:
+                    meta, turns, last_reply = self._read(entry.path)
+                except Exception:
+                    continue  # Not a save (or unreadable); leave it out
+                # Opening a journal can repair it, so stat again afterwards
+                self._store(entry.name, os.stat(entry.path), meta, turns, last_reply)
+                changed += 1
+        if known:
+            with self.db:
+                self.db.executemany("DELETE FROM saves WHERE file = ?", [(file,) for file in known])
+        return changed
+
+    @staticmethod
+    def _read(path: str):
+        if is_journal(path):
+            journal = TurnJournal(path)
+            try:
+                log = journal.read(2)  # Only the tail, for the preview
+            finally:
+                journal.close()
+            return journal.meta, journal.count, log.last_reply
+        # An old plain-text save; read in full, but only until it is migrated
+        with open(path, "r", encoding="utf-8") as f:
+            log = TurnLog.from_text(f.read())
+        return parse_setting(log.header), len(log), log.last_reply
+
+    # ----- Queries -----
+    def search(self, text: str = "", limit: int = 500) -> List[SaveEntry]:
+        """Saves whose character, genre, model, file name or preview match every word of text, newest first"""
+        conditions, params = [], []
+        for word in text.split():
+            pattern = "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conditions.append("(" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in SEARCH_COLUMNS) + ")")
+            params.extend([pattern] * len(SEARCH_COLUMNS))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.db.execute(
+            f"SELECT file, name, role, genre, model, turns, saved_at, preview FROM saves {where} "
+            "ORDER BY saved_at DESC LIMIT ?",
+            params + [limit],
+        )
+        return [SaveEntry(os.path.join(self.directory, row[0]), *row[1:]) for row in rows]
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM saves").fetchone()[0]
+
+    def close(self) -> None:
+        self.db.close()
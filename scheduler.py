@@ -0,0 +1,189 @@
+"""Admission control for everything that asks Ollama to generate.
+
+Ollama runs OLLAMA_NUM_PARALLEL requests per model at once and batches them
+together; anything beyond that waits inside Ollama in arrival order, so a
+player who sends turns back to back, or a story summary started at the same
+moment as a turn, can push everyone else's reply back. GenerationScheduler
+sits in front of OLLAMA_URL and hands out exactly max_concurrency slots,
+which keeps Ollama's parallel slots full without queueing inside it.
+
+Waiting requests are kept per priority lane and, inside a lane, per session.
+Interactive turns always go before background work (story summaries), and
+sessions within a lane take turns round-robin, so one chatty player cannot
+starve the others. Background work that has waited longer than
+background_max_wait is treated as interactive so it still finishes under
+sustained load.
+
+Slots can be awaited from asyncio code (slot()) and taken from plain threads
+(slot_blocking()); both share the same queue. metrics() reports queue depth
+and wait times.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Deque, Dict, Optional
+
+INTERACTIVE = 0
+BACKGROUND = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class _Ticket:
+    __slots__ = ("session_id", "priority", "enqueued_at", "granted", "cancelled", "wake")
+
+    def __init__(self, session_id: str, priority: int, wake: Callable[[], None]):
+        self.session_id = session_id
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.wake = wake  # Called (under the scheduler lock) once the slot is granted
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrency: int = 1, background_max_wait: float = 60.0, history: int = 500):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.background_max_wait = background_max_wait
+        self._lock = threading.Lock()
+        self._active = 0
+        # lane -> session_id -> waiting tickets; session order is the round-robin order
+        self._lanes: Dict[int, "OrderedDict[str, Deque[_Ticket]]"] = {
+            INTERACTIVE: OrderedDict(),
+            BACKGROUND: OrderedDict(),
+        }
+        self._queued = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._granted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._waits: Deque[float] = deque(maxlen=history)  # Recent queue waits in seconds
+
+    # ----- Acquiring slots -----
+    @asynccontextmanager
+    async def slot(self, session_id: str, priority: int = INTERACTIVE):
+        """Hold one generation slot for the body; cancelling while queued leaves the queue"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        ticket = self._enqueue(session_id, priority, wake)
+        try:
+            await granted
+        except BaseException:
+            if not self._withdraw(ticket):
+                self.release()  # Granted just as it was cancelled
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def slot_blocking(self, session_id: str, priority: int = BACKGROUND, timeout: Optional[float] = None):
+        """Thread version of slot(); raises TimeoutError if no slot frees up within timeout"""
+        event = threading.Event()
+        ticket = self._enqueue(session_id, priority, event.set)
+        if not event.wait(timeout) and self._withdraw(ticket):
+            raise TimeoutError("Timed out waiting for a generation slot")
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._dispatch()
+
+    # ----- Queue -----
+    def _enqueue(self, session_id: str, priority: int, wake: Callable[[], None]) -> _Ticket:
+        ticket = _Ticket(session_id, priority, wake)
+        with self._lock:
+            self._lanes[priority].setdefault(session_id, deque()).append(ticket)
+            self._queued[priority] += 1
+            self._dispatch()
+        return ticket
+
+    def _withdraw(self, ticket: _Ticket) -> bool:
+        """Take a waiting ticket out of the queue; False if it was already granted"""
+        with self._lock:
+            if ticket.granted:
+                return False
+            ticket.cancelled = True
+            lane = self._lanes[ticket.priority]
+            waiting = lane.get(ticket.session_id)
+            if waiting is not None:
+                waiting.remove(ticket)
+                if not waiting:
+                    del lane[ticket.session_id]
+            self._queued[ticket.priority] -= 1
+            return True
+
+    def _next_lane(self) -> Optional[int]:
+        interactive, background = self._lanes[INTERACTIVE], self._lanes[BACKGROUND]
+        if background:
+            # The oldest background ticket is at the head of one of the sessions
+            oldest = min(waiting[0].enqueued_at for waiting in background.values())
+            if time.monotonic() - oldest >= self.background_max_wait:
+                return BACKGROUND
+        if interactive:
+            return INTERACTIVE
+        return BACKGROUND if background else None
+
+    def _dispatch(self) -> None:
+        """Grant free slots; called with the lock held"""
+        while self._active < self.max_concurrency:
+            priority = self._next_lane()
+            if priority is None:
+                return
+            lane = self._lanes[priority]
+            session_id, waiting = next(iter(lane.items()))
+            ticket = waiting.popleft()
+            if waiting:
+                lane.move_to_end(session_id)  # Round-robin: this session goes last
+            else:
+                del lane[session_id]
+            self._queued[priority] -= 1
+            self._granted[priority] += 1
+            self._active += 1
+            ticket.granted = True
+            self._waits.append(time.monotonic() - ticket.enqueued_at)
+            ticket.wake()
+
+    # ----- Metrics -----
+    def metrics(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self._active,
+                "queued": {LANE_NAMES[p]: count for p, count in self._queued.items()},
+                "waiting_sessions": len(set(self._lanes[INTERACTIVE]) | set(self._lanes[BACKGROUND])),
+                "granted": {LANE_NAMES[p]: count for p, count in self._granted.items()},
+                "wait_seconds": {
+                    "mean": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                    "p95": round(waits[int(0.95 * (len(waits) - 1))], 4) if waits else 0.0,
+                    "max": round(waits[-1], 4) if waits else 0.0,
+                },
+            }
+
+
+_scheduler: Optional[GenerationScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def configure_scheduler(**kwargs) -> GenerationScheduler:
+    """Replace the shared scheduler, e.g. with OLLAMA_NUM_PARALLEL from a front-end's CONFIG"""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = GenerationScheduler(**kwargs)
+        return _scheduler
+
+
+def get_scheduler() -> GenerationScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GenerationScheduler()
+        return _scheduler
@@ -0,0 +1,105 @@
+"""Startup time: deferred imports, a time budget and an import-time report.
+
+Both front-ends used to import numpy, sounddevice and aiohttp before
+showing anything, although TTS may never be used and the first generation
+is several prompts away. Those modules are now imported where they are
+first needed; preload() lets a front-end warm one up on a background thread
+so the first use does not pay for it either.
+
+check_budget() compares the time since this module was imported (the
+first thing main.py and dungeonaigui.py do) with STARTUP_BUDGET_MS and
+logs a warning when startup ran over. To see where the time goes:
+
+    python startup.py main            # or dungeonaigui
+    python startup.py main --top 30 --budget 400
+
+runs `python -X importtime -c "import <module>"` in a fresh interpreter
+and prints the slowest imports, and exits with status 1 if importing took
+longer than the budget.
+"""
+import argparse
+import importlib
+import subprocess
+import sys
+import threading
+import time
+from typing import List, Tuple
+
+STARTED_AT = time.perf_counter()
+
+
+def preload(*modules: str) -> None:
+    """Import modules on a daemon thread; errors are left for the real import to report"""
+
+    def load():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass
+
+    threading.Thread(target=load, name="preload", daemon=True).start()
+
+
+def elapsed_ms() -> float:
+    return (time.perf_counter() - STARTED_AT) * 1000
+
+
+def check_budget(budget_ms: float, logger=None, stage: str = "first prompt") -> float:
+    """Milliseconds since startup; logged as a warning when over budget_ms"""
+    elapsed = elapsed_ms()
+    if budget_ms and elapsed > budget_ms and logger is not None:
+        logger.warning("Startup over budget", stage=stage, elapsed_ms=round(elapsed), budget_ms=budget_ms)
+    return elapsed
+
+
+# ----- Import-time report -----
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self µs, cumulative µs) for every import made by `import module`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))  # Keeps the nesting indent
+    return rows
+
+
+def report(module: str, top: int = 15, budget_ms: float = 0) -> bool:
+    """Print the slowest imports of module; False if importing it took longer than budget_ms"""
+    rows = import_times(module)
+    # Top-level imports (not indented) add up to the total
+    total_ms = sum(cumulative for name, _, cumulative in rows if not name.startswith(" ")) / 1000
+    print(f"Importing {module}: {total_ms:.0f} ms, {len(rows)} modules")
+    print(f"{'cumulative':>11} {'self':>8}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[2], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:9.1f}ms {self_us / 1000:6.1f}ms  {name.strip()}")
+    if budget_ms:
+        within = total_ms <= budget_ms
+        print(f"Budget {budget_ms:.0f} ms: {'OK' if within else 'EXCEEDED'}")
+        return within
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show which imports slow down a module's startup")
+    parser.add_argument("module", nargs="?", default="main", help="Module to import, e.g. main or dungeonaigui")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    parser.add_argument("--budget", type=float, default=0, help="Fail if importing takes longer (ms)")
+    args = parser.parse_args()
+    try:
+        within = report(args.module, args.top, args.budget)
+    except RuntimeError as e:
+        print(f"Could not import {args.module}: {e}")
+        sys.exit(2)
+    sys.exit(0 if within else 1)
+
+
+if __name__ == "__main__":
+    main()
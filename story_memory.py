@@ -0,0 +1,148 @@
+"""Rolling story summary for turns that no longer fit in the context window.
+
+When ContextWindow leaves old turns out of the prompt, StoryMemory folds them
+into a bounded running summary using the currently selected Ollama model.
+The summary is written on a background thread after a reply has been shown,
+so it never delays the player's next turn, and it is injected into the
+prompt in place of the raw turns it covers.
+"""
+import json
+import os
+import threading
+from typing import Callable, Optional
+
+from http_client import get_client
+from scheduler import BACKGROUND, GenerationScheduler, get_scheduler
+from turn_log import TurnLog
+
+SUMMARY_PROMPT = """You are the chronicler of an ongoing text adventure. Update the running summary with the new events below.
+Keep every named character, place, faction and important item, what the player did to or for them, and how NPCs now feel about the player.
+Drop minor description. Write plain prose in the past tense, at most {max_words} words.
+
+### Summary so far ###
+{summary}
+
+### New events ###
+{events}
+
+### Updated summary ###
+"""
+
+
+class StoryMemory:
+    def __init__(self, ollama_url: str, max_chars: int = 2000, batch_turns: int = 6,
+                 on_error: Optional[Callable[[str, Exception], None]] = None,
+                 scheduler: Optional[GenerationScheduler] = None, session_id: str = "local"):
+        self.ollama_url = ollama_url
+        self.max_chars = max_chars  # Upper bound on the summary length
+        self.batch_turns = batch_turns  # Evicted turns collected before summarizing
+        self.on_error = on_error
+        self.scheduler = scheduler or get_scheduler()  # Summaries queue behind interactive turns
+        self.session_id = session_id
+        self.summary = ""
+        self.summarized_turns = 0  # Absolute index of the first turn not yet summarized
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.summary = ""
+            self.summarized_turns = 0
+
+    @property
+    def busy(self) -> bool:
+        return self._worker is not None and self._worker.is_alive()
+
+    def prompt_block(self) -> str:
+        """Text to pin after the adventure setting header, or "" when empty"""
+        with self._lock:
+            summary = self.summary
+        return f"### Story So Far ###\n{summary}\n\n" if summary else ""
+
+    def maybe_summarize(self, turns: TurnLog, omitted_turns: int, model: str) -> bool:
+        """Start a background summary of newly evicted turns if enough have piled up"""
+        if self.busy:
+            return False
+
+        evicted_until = turns.dropped + omitted_turns
+        with self._lock:
+            # Undo/redo can shrink the log below what was already summarized
+            start = min(self.summarized_turns, turns.dropped + len(turns))
+            summary = self.summary
+        if evicted_until - start < self.batch_turns:
+            return False
+
+        events = "\n".join(
+            turn.render()
+            for turn in turns.between(max(0, start - turns.dropped), omitted_turns)
+        )
+        self._worker = threading.Thread(
+            target=self._summarize, args=(summary, events, evicted_until, model), daemon=True
+        )
+        self._worker.start()
+        return True
+
+    def _summarize(self, summary: str, events: str, evicted_until: int, model: str) -> None:
+        prompt = SUMMARY_PROMPT.format(
+            max_words=self.max_chars // 6,
+            summary=summary or "Nothing has happened yet.",
+            events=events,
+        )
+        try:
+            client = get_client()
+            with self.scheduler.slot_blocking(self.session_id, BACKGROUND):
+                response = client.post(
+                    "summary",
+                    self.ollama_url,
+                    json=client.ollama_payload({
+                        "model": model,
+                        "prompt": prompt,
+                        "stream": False,
+                        "options": {
+                            "temperature": 0.3,
+                            "num_predict": self.max_chars // 3,
+                        }
+                    })
+                )
+            response.raise_for_status()
+            new_summary = self._bound(response.json().get("response", "").strip())
+        except Exception as e:
+            if self.on_error:
+                self.on_error("Error updating story summary", e)
+            return
+
+        if new_summary:
+            with self._lock:
+                self.summary = new_summary
+                self.summarized_turns = evicted_until
+
+    def _bound(self, text: str) -> str:
+        """Cut the summary to max_chars, preferring to end on a full sentence"""
+        if len(text) <= self.max_chars:
+            return text
+        text = text[:self.max_chars]
+        end = text.rfind(". ")
+        return text[:end + 1] if end > self.max_chars // 2 else text
+
+    # ----- Persistence -----
+    @staticmethod
+    def sidecar_path(save_path) -> str:
+        return f"{save_path}.memory.json"
+
+    def save(self, save_path) -> None:
+        with self._lock:
+            data = {"summary": self.summary, "summarized_turns": self.summarized_turns}
+        with open(self.sidecar_path(save_path), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def load(self, save_path) -> None:
+        """Restore the summary saved next to save_path; missing files mean no summary"""
+        path = self.sidecar_path(save_path)
+        if not os.path.exists(path):
+            self.reset()
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self._lock:
+            self.summary = data.get("summary", "")
+            self.summarized_turns = int(data.get("summarized_turns", 0))
@@ -0,0 +1,185 @@
+"""Helpers for reading Ollama's streaming (NDJSON) /api/generate responses.
+
+Shared by main.py and dungeonaigui.py so both front-ends apply the stop
+sequences and measure generation speed the same way.
+"""
+import datetime
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, List, Optional
+
+from structured_log import get_logger
+
+# Stop sequences used by every Dungeon Master generation
+STOP_SEQUENCES = ["\n\n", "Player:", "Dungeon Master:"]
+
+
+@dataclass
+class GenerationStats:
+    """Timing figures for one generated reply"""
+    time_to_first_token: float = 0.0
+    total_time: float = 0.0
+    token_count: int = 0
+    tokens_per_second: float = 0.0
+    # Prompt tokens Ollama actually had to evaluate; a low count means its
+    # KV cache matched the start of the prompt
+    prompt_eval_count: int = 0
+    prompt_eval_duration: float = 0.0
+
+    def summary(self) -> str:
+        return (f"{self.tokens_per_second:.1f} tok/s, "
+                f"first token {self.time_to_first_token:.2f}s, "
+                f"{self.token_count} tokens in {self.total_time:.1f}s, "
+                f"prompt eval {self.prompt_eval_count} tokens in {self.prompt_eval_duration:.2f}s")
+
+    def apply_final_chunk(self, chunk: dict) -> None:
+        """Take Ollama's own counters from the closing response object"""
+        eval_count = chunk.get("eval_count")
+        eval_duration = chunk.get("eval_duration")
+        if eval_count and eval_duration:
+            self.token_count = eval_count
+            self.tokens_per_second = eval_count / (eval_duration / 1e9)
+        self.prompt_eval_count = chunk.get("prompt_eval_count", 0)
+        self.prompt_eval_duration = chunk.get("prompt_eval_duration", 0) / 1e9
+
+
+def append_stats_log(path: str, model: str, stats: GenerationStats) -> None:
+    """Queue one JSON line per reply so prompt-cache hits can be checked afterwards"""
+    record = {"time": datetime.datetime.now().isoformat(timespec="seconds"), "model": model}
+    record.update(asdict(stats))
+    get_logger(path).write(record)
+
+
+class StopSequenceFilter:
+    """Incrementally applies stop sequences to streamed text.
+
+    Text that could still turn out to be the start of a stop sequence is held
+    back until the next chunk decides it, so nothing past a stop sequence is
+    ever emitted.
+    """
+
+    def __init__(self, stop_sequences: Optional[List[str]] = None):
+        self.stop_sequences = [s for s in (stop_sequences or STOP_SEQUENCES) if s]
+        self.pending = ""
+        self.stopped = False
+        self._started = False
+
+    def _held_back_length(self, text: str) -> int:
+        """Length of the longest suffix of text that prefixes a stop sequence"""
+        longest = 0
+        for stop in self.stop_sequences:
+            for size in range(min(len(stop) - 1, len(text)), longest, -1):
+                if text.endswith(stop[:size]):
+                    longest = size
+                    break
+        return longest
+
+    def _clean(self, text: str) -> str:
+        # Match the old non-streaming path, which stripped leading whitespace
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return the text that is now safe to emit"""
+        if self.stopped:
+            return ""
+
+        self.pending += chunk
+        cut = -1
+        for stop in self.stop_sequences:
+            index = self.pending.find(stop)
+            if index != -1 and (cut == -1 or index < cut):
+                cut = index
+
+        if cut != -1:
+            ready = self.pending[:cut]
+            self.pending = ""
+            self.stopped = True
+            return self._clean(ready)
+
+        held = self._held_back_length(self.pending)
+        ready = self.pending[:len(self.pending) - held]
+        self.pending = self.pending[len(self.pending) - held:]
+        return self._clean(ready)
+
+    def flush(self) -> str:
+        """Return whatever is still held back once the stream has ended"""
+        ready = "" if self.stopped else self.pending
+        self.pending = ""
+        return self._clean(ready)
+
+
+class GenerateStreamReader:
+    """Incremental parser for /api/generate NDJSON lines.
+
+    Shared by the blocking (requests) and asyncio (aiohttp) clients: feed it
+    each line as it arrives, then call finish().
+    """
+
+    def __init__(self, on_token: Optional[Callable[[str], None]] = None,
+                 stop_sequences: Optional[List[str]] = None,
+                 started_at: Optional[float] = None):
+        self.on_token = on_token
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        self.stop_filter = StopSequenceFilter(stop_sequences)
+        self.stats = GenerationStats()
+        self.parts = []
+        self.final_chunk = {}
+
+    def _emit(self, text: str) -> None:
+        if text:
+            self.parts.append(text)
+            if self.on_token:
+                self.on_token(text)
+
+    def feed_line(self, line: bytes) -> bool:
+        """Process one line; returns True once the reply is complete"""
+        line = line.strip()
+        if not line:
+            return False
+        chunk = json.loads(line)
+        if chunk.get("error"):
+            raise RuntimeError(chunk["error"])
+
+        token = chunk.get("response", "")
+        if token:
+            if self.stats.token_count == 0:
+                self.stats.time_to_first_token = time.monotonic() - self.started_at
+            self.stats.token_count += 1
+            self._emit(self.stop_filter.feed(token))
+
+        if chunk.get("done"):
+            self.final_chunk = chunk
+            return True
+        return self.stop_filter.stopped
+
+    def finish(self):
+        """Flush held-back text and return (full_text, GenerationStats, final_chunk)"""
+        self._emit(self.stop_filter.flush())
+
+        stats = self.stats
+        stats.total_time = time.monotonic() - self.started_at
+        if stats.total_time > stats.time_to_first_token:
+            stats.tokens_per_second = stats.token_count / (stats.total_time - stats.time_to_first_token)
+        stats.apply_final_chunk(self.final_chunk)
+        return "".join(self.parts).strip(), stats, self.final_chunk
+
+
+def read_generate_stream(lines: Iterable[bytes],
+                         on_token: Optional[Callable[[str], None]] = None,
+                         stop_sequences: Optional[List[str]] = None,
+                         started_at: Optional[float] = None):
+    """Consume an /api/generate NDJSON stream.
+
+    Calls on_token with each piece of visible text as it arrives and returns
+    (full_text, GenerationStats, final_chunk). final_chunk is the closing
+    "done" object from Ollama, or {} if the stream was cut short.
+    """
+    reader = GenerateStreamReader(on_token, stop_sequences, started_at)
+    for line in lines:
+        if reader.feed_line(line):
+            break
+    return reader.finish()
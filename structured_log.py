@@ -0,0 +1,206 @@
+"""Queue-backed JSON-lines logging shared by the engine and both front-ends.
+
+log_error used to open, append to and close the log file on every call,
+and main.py's TTS logger even probed AllTalk over HTTP (up to 10 s) while
+writing. StructuredLogger.log() only builds the record and puts it on a
+queue; one daemon thread per file writes whatever has queued up as JSON
+lines in a single write, and rotates the file once it passes max_bytes
+(keeping `backups` older files as <path>.1, <path>.2, ...).
+
+Repeats are rate limited: the same level, message and exception within
+dedupe_window seconds of the last written one is only counted, and the
+count is written as "repeated" with the next occurrence after the window
+(or on close). A dead AllTalk server therefore costs one line a minute,
+not one per sentence. If the writer falls behind by max_queue records,
+new ones are dropped and counted rather than blocking the game.
+
+Use get_logger(path) so every component writing to a file shares one
+writer thread. Pending records are written at interpreter exit.
+"""
+import atexit
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+
+class StructuredLogger:
+    def __init__(self, path, max_bytes: int = 1024 * 1024, backups: int = 3,
+                 dedupe_window: float = 60.0, max_queue: int = 10000):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dedupe_window = dedupe_window
+        self.dropped = 0  # Records lost because the queue was full
+        self._queue = queue.Queue(max_queue)
+        self._recent: Dict[tuple, list] = {}  # Writer thread only: key -> [last written, suppressed, record]
+        self._file = None
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name=f"log-writer:{os.path.basename(self.path)}", daemon=True
+        )
+        self._thread.start()
+
+    # ----- Logging (any thread, never blocks) -----
+    def log(self, level: str, message: str, exception: Optional[BaseException] = None, **fields) -> None:
+        record = {
+            "time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "level": level,
+            "message": message,
+        }
+        if exception is not None:
+            record["exception"] = f"{type(exception).__name__}: {exception}"
+            if exception.__traceback__ is not None:
+                record["traceback"] = "".join(
+                    traceback.format_exception(type(exception), exception, exception.__traceback__)
+                )
+        record.update(fields)
+        self._put((record, True))
+
+    def error(self, message: str, exception: Optional[BaseException] = None, **fields) -> None:
+        self.log("error", message, exception, **fields)
+
+    def warning(self, message: str, exception: Optional[BaseException] = None, **fields) -> None:
+        self.log("warning", message, exception, **fields)
+
+    def write(self, record: dict) -> None:
+        """Queue a ready-made record as is, without duplicate suppression (e.g. per-reply stats)"""
+        self._put((dict(record), False))
+
+    def _put(self, item) -> None:
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """Wait until everything queued so far is written"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 2.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ----- Writer thread -----
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines, waiters, stop = [], [], False
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    record, dedupe = item
+                    if not dedupe or self._admit(record):
+                        lines.append(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            if stop:
+                lines.extend(self._suppressed_summary())
+            if lines:
+                self._write("".join(lines))
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+    def _admit(self, record: dict) -> bool:
+        """Whether to write a record now, or only count it as a repeat"""
+        key = (record["level"], record["message"], record.get("exception"))
+        now = time.monotonic()
+        entry = self._recent.get(key)
+        if entry is not None and now - entry[0] < self.dedupe_window:
+            entry[1] += 1
+            entry[2] = record
+            return False
+        if entry is not None and entry[1]:
+            record["repeated"] = entry[1]  # Occurrences not written since the last one
+        self._recent[key] = [now, 0, record]
+        if len(self._recent) > 1000:
+            self._prune(now)
+        return True
+
+    def _prune(self, now: float) -> None:
+        for key, (written_at, suppressed, _) in list(self._recent.items()):
+            if not suppressed and now - written_at >= self.dedupe_window:
+                del self._recent[key]
+
+    def _suppressed_summary(self) -> list:
+        lines = []
+        for _, suppressed, record in self._recent.values():
+            if suppressed:
+                lines.append(json.dumps(dict(record, repeated=suppressed), ensure_ascii=False, default=str) + "\n")
+        if self.dropped:
+            lines.append(json.dumps({
+                "time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                "level": "warning",
+                "message": "Log records dropped because the writer fell behind",
+                "repeated": self.dropped,
+            }) + "\n")
+        return lines
+
+    def _write(self, text: str) -> None:
+        data = text.encode("utf-8")
+        try:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            if self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+        except Exception as e:
+            print(f"CRITICAL: Failed to write to log {self.path}: {e}")
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+        if self.backups > 0:
+            for n in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{n}"):
+                    os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "ab")
+
+
+_loggers: Dict[str, StructuredLogger] = {}
+_loggers_lock = threading.Lock()
+
+
+def get_logger(path, **kwargs) -> StructuredLogger:
+    """The shared logger for path; kwargs only apply when it is first created"""
+    key = os.path.abspath(str(path))
+    with _loggers_lock:
+        logger = _loggers.get(key)
+        if logger is None:
+            logger = _loggers[key] = StructuredLogger(path, **kwargs)
+        return logger
+
+
+@atexit.register
+def close_all() -> None:
+    with _loggers_lock:
+        loggers = list(_loggers.values())
+        _loggers.clear()
+    for logger in loggers:
+        logger.close()
@@ -0,0 +1,147 @@
+import pytest
+
+from game_engine import GameEngine, GenerationError
+from turn_log import DUNGEON_MASTER, PLAYER
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = GameEngine({
+        "LOG_FILE": str(tmp_path / "error_log.jsonl"),
+        "STATS_LOG_FILE": str(tmp_path / "generation_stats.jsonl"),
+        "MODEL_CACHE_FILE": str(tmp_path / "model_cache.json"),
+    })
+    engine.new_adventure("Fantasy", "Adventurer", "Alex")
+    yield engine
+    engine.close()
+
+
+def replies(engine, *texts):
+    """Make engine.generate return texts in order; an exception in texts is raised instead"""
+    queue = list(texts)
+
+    def generate(prompt, on_token=None):
+        reply = queue.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+    engine.generate = generate
+
+
+def story(engine):
+    return [(turn.speaker, turn.text) for turn in engine.state.turns]
+
+
+def test_opening_and_action_are_committed(engine):
+    replies(engine, "You wake up.", "A cave.")
+
+    engine.opening_turn()
+    assert engine.state.adventure_started
+    assert engine.take_turn("Look around") == "A cave."
+    assert story(engine) == [(DUNGEON_MASTER, "You wake up."), (PLAYER, "Look around"), (DUNGEON_MASTER, "A cave.")]
+    assert engine.state.last_ai_reply == "A cave."
+    assert engine.state.last_player_input == "Look around"
+
+
+def test_plan_action_prompt_ends_with_open_reply(engine):
+    replies(engine, "You wake up.")
+    engine.opening_turn()
+
+    plan = engine.plan_action("Look around")
+    assert plan.prompt.endswith("Player: Look around\nDungeon Master:")
+    assert plan.player_input == "Look around"
+    assert len(engine.state.turns) == 1  # Nothing is added until the plan is committed
+
+
+def test_failed_turn_leaves_log_unchanged(engine):
+    replies(engine, "You wake up.", GenerationError("down"))
+    engine.opening_turn()
+
+    with pytest.raises(GenerationError):
+        engine.take_turn("Look around")
+    assert story(engine) == [(DUNGEON_MASTER, "You wake up.")]
+
+
+def test_redo_replaces_last_reply(engine):
+    replies(engine, "You wake up.", "A cave.", "A forest.")
+    engine.opening_turn()
+    engine.take_turn("Look around")
+
+    plan = engine.plan_redo()
+    assert plan.replaced == ("Look around", "A cave.")
+    assert plan.prompt.endswith("Player: Look around\nDungeon Master:")
+    engine.abandon(plan)
+    assert engine.redo() == "A forest."
+    assert story(engine) == [(DUNGEON_MASTER, "You wake up."), (PLAYER, "Look around"), (DUNGEON_MASTER, "A forest.")]
+
+
+def test_failed_redo_puts_exchange_back(engine):
+    replies(engine, "You wake up.", "A cave.", GenerationError("down"))
+    engine.opening_turn()
+    engine.take_turn("Look around")
+
+    with pytest.raises(GenerationError):
+        engine.redo()
+    assert story(engine) == [(DUNGEON_MASTER, "You wake up."), (PLAYER, "Look around"), (DUNGEON_MASTER, "A cave.")]
+
+
+def test_redo_of_opening_narration(engine):
+    replies(engine, "You wake up.", GenerationError("down"), "You fall asleep.")
+    engine.opening_turn()
+
+    with pytest.raises(GenerationError):
+        engine.redo()
+    assert story(engine) == [(DUNGEON_MASTER, "You wake up.")]
+    plan = engine.plan_redo()
+    assert plan.opening and plan.player_input is None
+    engine.abandon(plan)
+    assert engine.redo() == "You fall asleep."
+    assert story(engine) == [(DUNGEON_MASTER, "You fall asleep.")]
+
+
+def test_redo_refused_when_log_ends_with_player_line(engine):
+    engine.state.turns.add_dm("You wake up.")
+    engine.state.turns.add_player("Look around")
+
+    assert not engine.can_redo
+    with pytest.raises(GenerationError):
+        engine.plan_redo()
+    assert story(engine) == [(DUNGEON_MASTER, "You wake up."), (PLAYER, "Look around")]
+
+
+def test_redo_refused_on_empty_log(engine):
+    assert not engine.can_redo
+    with pytest.raises(GenerationError):
+        engine.plan_redo()
+
+
+def test_load_keeps_turns_not_yet_summarized(engine, tmp_path):
+    engine.config["JOURNAL_LOAD_TURNS"] = 4
+    engine.state.turns.add_dm("You wake up.")
+    for i in range(10):
+        engine.state.turns.add_player(f"Action {i}")
+        engine.state.turns.add_dm(f"Reply {i}")
+    engine.memory.summary, engine.memory.summarized_turns = "Alex woke up.", 7
+    engine.save(tmp_path / "save.txt")
+
+    engine.load(tmp_path / "save.txt")
+    assert engine.state.turns.dropped == 7
+    assert engine.state.turns[0].text == "Action 3"
+
+    engine.memory.summarized_turns = 19
+    engine.save(tmp_path / "save.txt")
+    engine.load(tmp_path / "save.txt")
+    assert engine.state.turns.dropped == 21 - 4
+
+
+def test_load_keeps_session_model(engine, tmp_path):
+    engine.state.current_model, engine.state.temperature = "mistral", 0.9
+    engine.state.turns.add_dm("You wake up.")
+    engine.save(tmp_path / "save.txt")
+    engine.state.current_model, engine.state.temperature = "llama3:instruct", 0.7
+    engine.new_adventure("Sci-Fi", "Pilot", "Sam")
+
+    meta = engine.load(tmp_path / "save.txt")
+    assert (meta["model"], meta["temperature"]) == ("mistral", 0.9)
+    assert (engine.state.current_model, engine.state.temperature) == ("llama3:instruct", 0.7)
+    assert (engine.state.character_name, engine.state.selected_genre) == ("Alex", "Fantasy")
@@ -0,0 +1,148 @@
+import json
+import os
+
+from turn_journal import TurnJournal, is_journal, migrate_save, read_header
+from turn_log import DUNGEON_MASTER, PLAYER, TurnLog
+
+HEADER = "### Adventure Setting ###\nGenre: Fantasy\nPlayer Character: Alex the Adventurer\n\n"
+META = {"model": "llama3:instruct", "genre": "Fantasy", "role": "Adventurer", "name": "Alex"}
+
+
+def make_log(exchanges):
+    log = TurnLog(header=HEADER)
+    log.add_dm("You wake up.")
+    for i in range(exchanges):
+        log.add_player(f"Action {i}")
+        log.add_dm(f"Reply {i}")
+    return log
+
+
+def texts(log):
+    return [(turn.speaker, turn.text) for turn in log]
+
+
+def reopen(path, last_turns=None):
+    journal = TurnJournal(path)
+    try:
+        return journal.read(last_turns), journal
+    finally:
+        journal.close()
+
+
+def test_sync_and_read_round_trip(tmp_path):
+    path = tmp_path / "save.txt"
+    log = make_log(3)
+    journal = TurnJournal(path)
+    journal.sync(log, META)
+    journal.close()
+
+    loaded, reader = reopen(path)
+    assert is_journal(path)
+    assert loaded.header == HEADER
+    assert texts(loaded) == texts(log)
+    assert reader.meta == META
+    assert read_header(path)["turns"] == len(log)
+
+
+def test_incremental_saves_append_and_truncate(tmp_path):
+    path = tmp_path / "save.txt"
+    log = make_log(2)
+    journal = TurnJournal(path)
+    journal.sync(log, META)
+    log.add_player("Action 2")
+    log.add_dm("Reply 2")
+    journal.sync(log, META)
+    log.pop_exchange()  # Redo
+    log.add_player("Action 2")
+    log.add_dm("Another reply")
+    journal.sync(log, META)
+    journal.close()
+
+    loaded, _ = reopen(path)
+    assert texts(loaded) == texts(log)
+
+
+def test_partial_read_keeps_older_turns_on_save(tmp_path):
+    path = tmp_path / "save.txt"
+    log = make_log(5)
+    journal = TurnJournal(path)
+    journal.sync(log, META)
+    journal.close()
+
+    journal = TurnJournal(path)
+    recent = journal.read(4)
+    assert recent.dropped == len(log) - 4
+    assert texts(recent) == texts(log)[-4:]
+    recent.add_player("Action 5")
+    recent.add_dm("Reply 5")
+    journal.sync(recent, META)
+    journal.close()
+
+    log.add_player("Action 5")
+    log.add_dm("Reply 5")
+    loaded, _ = reopen(path)
+    assert texts(loaded) == texts(log)
+
+
+def test_compaction_drops_dead_records(tmp_path):
+    path = tmp_path / "save.txt"
+    log = make_log(1)
+    journal = TurnJournal(path, compact_min_bytes=0)
+    journal.sync(log, META)
+    for i in range(5):
+        log.pop_exchange()
+        log.add_player("Action 0")
+        log.add_dm(f"Retry {i}")
+        journal.sync(log, META)
+    journal.close()
+
+    with open(path, "rb") as f:
+        turn_records = [line for line in f if line.startswith(b'{"type": "turn"')]
+    assert len(turn_records) < 2 * 6
+    loaded, _ = reopen(path)
+    assert texts(loaded) == texts(log)
+
+
+def test_missing_index_is_rebuilt(tmp_path):
+    path = tmp_path / "save.txt"
+    log = make_log(3)
+    journal = TurnJournal(path)
+    journal.sync(log, META)
+    journal.close()
+    os.remove(f"{path}.idx")
+
+    loaded, _ = reopen(path, 2)
+    assert texts(loaded) == texts(log)[-2:]
+    assert loaded.dropped == len(log) - 2
+
+
+def test_migrate_plain_text_save(tmp_path):
+    path = tmp_path / "save.txt"
+    log = make_log(2)
+    path.write_text(log.to_text(), encoding="utf-8")
+
+    assert migrate_save(path)
+    assert not migrate_save(path)
+    assert os.path.exists(f"{path}.bak")
+    loaded, journal = reopen(path)
+    assert texts(loaded) == texts(log)
+    assert journal.meta == {"genre": "Fantasy", "name": "Alex", "role": "Adventurer"}
+
+
+def test_migrate_first_format_journal(tmp_path):
+    path = tmp_path / "save.txt"
+    records = [
+        {"type": "header", "text": HEADER},
+        {"type": "turn", "n": 0, "speaker": DUNGEON_MASTER, "text": "You wake up."},
+        {"type": "turn", "n": 1, "speaker": PLAYER, "text": "Look around"},
+        {"type": "turn", "n": 2, "speaker": DUNGEON_MASTER, "text": "A cave."},
+        {"type": "truncate", "count": 1},
+        {"type": "turn", "n": 1, "speaker": PLAYER, "text": "Leave"},
+        {"type": "turn", "n": 2, "speaker": DUNGEON_MASTER, "text": "A forest."},
+    ]
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+
+    assert migrate_save(path)
+    loaded, _ = reopen(path)
+    assert loaded.header == HEADER
+    assert texts(loaded) == [(DUNGEON_MASTER, "You wake up."), (PLAYER, "Leave"), (DUNGEON_MASTER, "A forest.")]
@@ -0,0 +1,48 @@
+from turn_log import DUNGEON_MASTER, PLAYER, TurnLog
+
+
+def make_log(*lines):
+    log = TurnLog(header="### Adventure Setting ###\n")
+    for speaker, text in lines:
+        log.append(speaker, text)
+    return log
+
+
+def test_pop_exchange_removes_player_line_and_reply():
+    log = make_log((DUNGEON_MASTER, "You wake up."), (PLAYER, "Look around"), (DUNGEON_MASTER, "A cave."))
+
+    assert log.pop_exchange() == (True, "Look around", "A cave.")
+    assert [turn.text for turn in log] == ["You wake up."]
+    assert log.player_turn_count == 0
+    assert log.render() == "### Adventure Setting ###\nDungeon Master: You wake up."
+
+
+def test_pop_exchange_keeps_log_ending_with_player_line():
+    log = make_log((DUNGEON_MASTER, "You wake up."), (PLAYER, "Look around"))
+
+    assert log.pop_exchange() == (False, "", "")
+    assert len(log) == 2
+
+
+def test_pop_exchange_keeps_opening_narration():
+    log = make_log((DUNGEON_MASTER, "You wake up."))
+
+    assert log.pop_exchange() == (False, "", "")
+    assert len(log) == 1
+    assert TurnLog().pop_exchange() == (False, "", "")
+
+
+def test_char_count_matches_rendered_text():
+    log = make_log((DUNGEON_MASTER, "You wake up."), (PLAYER, "Look around"), (DUNGEON_MASTER, "A cave."))
+    log.pop()
+    log.add_player("Leave")
+
+    assert log.char_count == len(log.to_text())
+
+
+def test_from_text_round_trip_keeps_replies_that_mention_speakers():
+    log = make_log((DUNGEON_MASTER, 'The sign reads "Player: beware".\nIt is old.'), (PLAYER, "Run"))
+    parsed = TurnLog.from_text(log.to_text())
+
+    assert parsed.header == log.header
+    assert [(turn.speaker, turn.text) for turn in parsed] == [(turn.speaker, turn.text) for turn in log]
@@ -0,0 +1,133 @@
+"""On-disk cache of synthesized speech, shared by main.py and dungeonaigui.py.
+
+AllTalk used to be asked for the same audio again on every /redo replay,
+every reload (which speaks the last reply again) and every repeated line.
+TTSCache stores the decoded int16 samples, at the output sample rate, as
+.npy files named after a hash of everything that affects the audio: text,
+voice, narrator voice, sample rate and CACHE_FORMAT. Hits are opened with
+np.load(mmap_mode="r"), so playback reads straight from the page cache
+without a copy. Entries are evicted least recently used first once the
+cache grows past max_bytes; a hit refreshes the file's mtime, which is what
+the LRU order is rebuilt from on startup.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+CACHE_FORMAT = 2  # Bumped when what is stored changes; 1 kept AllTalk's bytes, WAV header and all
+
+
+def cache_key(text: str, voice: str, narrator_voice: str, sample_rate: int) -> str:
+    """Content address for one synthesized chunk"""
+    raw = json.dumps([text, voice, narrator_voice, sample_rate, CACHE_FORMAT], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def _scan(self) -> None:
+        """Rebuild the LRU order from the files already on disk"""
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".npy"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            elif entry.name.endswith(".tmp"):
+                # Left over from an interrupted write
+                self._remove(entry.path)
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def get(self, text: str, voice: str, narrator_voice: str, sample_rate: int) -> Optional["np.ndarray"]:
+        """Memory-mapped samples for this chunk, or None on a miss"""
+        import numpy as np  # Deferred until TTS is first used (see startup.py)
+
+        key = cache_key(text, voice, narrator_voice, sample_rate)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            audio = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError):
+            # Deleted or corrupt behind our back; treat as a miss
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return audio
+
+    def put(self, text: str, voice: str, narrator_voice: str, sample_rate: int, audio: "np.ndarray") -> None:
+        import numpy as np
+
+        key = cache_key(text, voice, narrator_voice, sample_rate)
+        path = self._path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(audio, dtype=np.int16))
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+        except OSError:
+            self._remove(temp_path)
+            return
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(self._path(key))
+            self._entries.clear()
+            self._total_bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._total_bytes
+
+    def _forget(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._remove(self._path(key))
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Still mapped for playback on Windows, or already gone
@@ -0,0 +1,266 @@
+"""Pipelined AllTalk text-to-speech shared by main.py and dungeonaigui.py.
+
+Speech used to be produced one chunk at a time: POST to AllTalk, wait,
+play, wait for playback to end, then start on the next chunk, which left a
+gap of a full synthesis round-trip at every chunk boundary. TTSPipeline
+runs synthesis and playback on two threads joined by a bounded prefetch
+queue, so chunk N+1 is synthesized while chunk N plays, and queues all
+audio on one AudioOutput, which plays chunks and utterances back to back.
+AllTalk's WAVs are decoded at their own rate and resampled to sample_rate;
+volume is applied locally. Text can be fed token by token while the reply
+is still streaming; speech starts as soon as the first sentence is
+complete.
+
+With a HealthMonitor, chunks that are not in the cache are dropped at once
+while AllTalk is known to be down, instead of each waiting out a request
+timeout; the monitor notices when AllTalk comes back.
+
+numpy and sounddevice are only imported once there is something to say,
+so a game played without speech never loads them.
+"""
+import queue
+import re
+import threading
+from typing import TYPE_CHECKING, Callable, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from audio_output import AudioOutput, decode_wav, to_output
+from health_monitor import HealthMonitor
+from http_client import get_client
+from startup import preload
+from tts_cache import TTSCache
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DEFAULT_VOICE = "FemaleBritishAccent_WhyLucyWhy_Voice_2.wav"
+ALLTALK_SERVICE = "AllTalk"  # Name of the server in the health monitor
+NARRATOR_VOICE = "narrator.wav"
+
+# A sentence ends at . ! ? or … optionally followed by closing quotes/brackets
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]”’]*(?=\s)")
+
+
+class SentenceBuffer:
+    """Collects streamed text and hands back complete chunks to synthesize.
+
+    The first sentence of an utterance is released on its own so speech can
+    start right away; later sentences are grouped up to max_chars.
+    """
+
+    def __init__(self, max_chars: int = 150):
+        self.max_chars = max_chars
+        self.pending = ""
+        self.first = True
+
+    def feed(self, text: str) -> List[str]:
+        self.pending += text
+        chunks = []
+        while True:
+            cut = self._next_cut()
+            if cut is None:
+                break
+            chunk, self.pending = self.pending[:cut].strip(), self.pending[cut:]
+            if chunk:
+                chunks.append(chunk)
+                self.first = False
+        return chunks
+
+    def flush(self) -> List[str]:
+        """Release whatever is left at the end of an utterance"""
+        chunk, self.pending = self.pending.strip(), ""
+        self.first = True
+        return [chunk] if chunk else []
+
+    def _next_cut(self) -> Optional[int]:
+        last_end = None
+        for match in SENTENCE_END.finditer(self.pending):
+            if self.first:
+                return match.end()
+            if match.end() > self.max_chars:
+                return last_end or match.end()
+            last_end = match.end()
+
+        # Over-long text with no sentence end in reach: break at a comma or space
+        if len(self.pending) > self.max_chars and last_end is None:
+            window = self.pending[:self.max_chars]
+            cut = max(window.rfind(", "), window.rfind(" "))
+            return cut + 1 if cut > 0 else self.max_chars
+        return None
+
+
+def split_into_chunks(text: str, max_chars: int = 150) -> List[str]:
+    """Split a complete reply into chunks the same way streamed text is split"""
+    buffer = SentenceBuffer(max_chars)
+    return buffer.feed(text + " ") + buffer.flush()
+
+
+class TTSPipeline:
+    def __init__(self, api_url: str, sample_rate: int = 22050, prefetch: int = 2,
+                 max_chunk_chars: int = 150, cache: Optional[TTSCache] = None,
+                 on_error: Optional[Callable[[str, Optional[Exception]], None]] = None,
+                 health: Optional[HealthMonitor] = None, volume: float = 1.0, buffer_seconds: float = 2.0):
+        self.api_url = api_url
+        self.health = health
+        if health is not None:
+            parts = urlsplit(api_url)
+            health.watch(ALLTALK_SERVICE, f"{parts.scheme}://{parts.netloc}")
+        self.cache = cache  # Hits skip the AllTalk request entirely
+        self.sample_rate = sample_rate
+        self.max_chunk_chars = max_chunk_chars
+        self.on_error = on_error
+
+        self._text_queue = queue.Queue()
+        self._audio_queue = queue.Queue(maxsize=prefetch)  # Bounded prefetch
+        self._buffer = SentenceBuffer(max_chunk_chars)
+        self._generation = 0  # Bumped by interrupt() so queued work is dropped
+        self._lock = threading.Lock()
+        self._threads = []
+        self.output = AudioOutput(sample_rate, buffer_seconds, volume=volume)
+        self._closed = False
+
+    # ----- Producer side (called from the game) -----
+    def say(self, text: str, voice: str = DEFAULT_VOICE) -> None:
+        """Queue a complete piece of text"""
+        for chunk in split_into_chunks(text, self.max_chunk_chars):
+            self._enqueue(chunk, voice)
+
+    def feed(self, text: str, voice: str = DEFAULT_VOICE) -> None:
+        """Queue streamed text; complete sentences are synthesized right away"""
+        for chunk in self._buffer.feed(text):
+            self._enqueue(chunk, voice)
+
+    def end_utterance(self, voice: str = DEFAULT_VOICE) -> None:
+        """Speak whatever streamed text is still waiting for a sentence end"""
+        for chunk in self._buffer.flush():
+            self._enqueue(chunk, voice)
+
+    def interrupt(self) -> None:
+        """Drop everything queued or playing, e.g. when a reply is replaced"""
+        with self._lock:
+            self._generation += 1
+        self._buffer.flush()
+        for q in (self._text_queue, self._audio_queue):
+            try:
+                while True:
+                    q.get_nowait()
+            except queue.Empty:
+                pass
+        self.output.clear()
+    
+    @property
+    def volume(self) -> float:
+        return self.output.volume
+
+    @volume.setter
+    def volume(self, volume: float) -> None:
+        self.output.volume = max(0.0, min(1.0, volume))
+
+    def close(self) -> None:
+        self.interrupt()
+        self._closed = True
+        self._text_queue.put(None)
+        self.output.close()
+
+    def _enqueue(self, chunk: str, voice: str) -> None:
+        if self._closed:
+            return
+        self._ensure_threads()
+        self._text_queue.put((self._generation, chunk, voice))
+
+    def _ensure_threads(self) -> None:
+        if self._threads:
+            return
+        preload("numpy", "sounddevice")  # Loads while the first chunk is synthesized
+        for target in (self._synthesis_loop, self._playback_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _report(self, message: str, exception: Optional[Exception] = None) -> None:
+        if self.on_error:
+            self.on_error(message, exception)
+
+    # ----- Synthesis thread -----
+    def _synthesis_loop(self) -> None:
+        while True:
+            item = self._text_queue.get()
+            if item is None:
+                self._audio_queue.put(None)
+                return
+            generation, chunk, voice = item
+            if generation != self._generation:
+                continue
+            audio = self._synthesize(chunk, voice)
+            if audio is not None and generation == self._generation:
+                self._audio_queue.put((generation, audio))  # Blocks while prefetch is full
+
+    def _synthesize(self, text: str, voice: str) -> Optional["np.ndarray"]:
+        import numpy as np
+
+        if self.cache is not None:
+            audio = self.cache.get(text, voice, NARRATOR_VOICE, self.sample_rate)
+            if audio is not None:
+                return audio.astype(np.float32) / 32768.0  # Cached as int16 at sample_rate
+
+        if self.health is not None and self.health.is_down(ALLTALK_SERVICE):
+            return None  # The monitor already logged the outage
+
+        payload = {
+            "text_input": text,
+            "character_voice_gen": voice,
+            "narrator_enabled": "true",
+            "narrator_voice_gen": NARRATOR_VOICE,
+            "text_filtering": "none",
+            "output_file_name": "output",
+            "autoplay": "true",
+            "autoplay_volume": "0.8"
+        }
+        try:
+            response = get_client().post("tts", self.api_url, data=payload)
+            response.raise_for_status()
+        except Exception as e:
+            if self.health is not None and isinstance(e, requests.exceptions.ConnectionError):
+                self.health.report_failure(ALLTALK_SERVICE, e)
+            self._report(f"TTS request failed: {e}", e)
+            return None
+
+        content_type = response.headers.get("Content-Type", "")
+        if content_type.startswith("audio/"):
+            try:
+                samples, rate = decode_wav(response.content, self.sample_rate)
+            except ValueError as e:
+                self._report(f"Could not decode AllTalk audio: {e}", e)
+                return None
+            audio = to_output(samples, rate, self.sample_rate)
+            if self.cache is not None:
+                pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+                self.cache.put(text, voice, NARRATOR_VOICE, self.sample_rate, pcm)
+            return audio
+        if content_type.startswith("application/json"):
+            try:
+                error = response.json().get("error", "Unknown error")
+            except ValueError:
+                error = "AllTalk API returned JSON but couldn't parse it"
+            self._report(f"AllTalk API error: {error}")
+        else:
+            self._report(f"Unexpected AllTalk response type: {content_type}")
+        return None
+
+    # ----- Playback thread -----
+    def _playback_loop(self) -> None:
+        while True:
+            item = self._audio_queue.get()
+            if item is None:
+                return
+            generation, audio = item
+            if generation != self._generation:
+                continue
+            try:
+                # Returns once the chunk is in the ring buffer, so the next one is queued
+                # while this one is still playing
+                self.output.write(audio, lambda: generation != self._generation)
+            except Exception as e:
+                self._report(f"Audio playback error: {e}", e)
@@ -0,0 +1,498 @@
+"""Versioned save files: a fixed metadata header plus an append-only turn journal.
+
+Saving used to rewrite the whole story every time (main.py's /save and
+/redo, the GUI's auto-save after every reply), which on a multi-hour
+campaign means megabytes per turn, and loading had to scan every line of
+the story for "Genre:" and "Player Character:" to recover the character.
+
+A save file now starts with a fixed-size header block: one JSON object,
+padded with spaces, holding the format version, the adventure's metadata
+(model, genre, role, name, backstory, temperature, voice), the turn count
+and the byte offsets of the sections below it. read_header() reads only
+that block, so a load dialog can list hundreds of saves cheaply. The block
+is rewritten in place on every save; if it ever outgrows its size the file
+is rewritten with a bigger one.
+
+After the header come JSON lines: a setting record (the adventure setting
+text, plus a copy of the metadata used to recover a damaged header), one
+record per turn appended as the story grows, and a truncate record when
+redo takes turns back. Saving writes only what changed since the last
+save; records are flushed to the OS at once but fsynced in batches (every
+fsync_every records or fsync_interval seconds, and on close).
+
+<path>.idx holds a fixed-size entry per live turn (offset, length, running
+byte total), so loading seeks straight to the last N turns instead of
+parsing the whole file. The index can always be rebuilt by replaying the
+journal, which is what happens if it is missing or out of date after a
+crash. Once dead records left behind by redo outweigh the live ones, the
+file is compacted into a fresh snapshot that replaces it atomically.
+
+migrate_save() upgrades old plain-text saves (and the first, header-less
+journal format) once, keeping the original next to it as <path>.bak.
+"""
+import json
+import os
+import secrets
+import struct
+import threading
+import time
+from itertools import islice
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from turn_log import Turn, TurnLog
+
+SAVE_FORMAT = "dungeon-save"
+SAVE_VERSION = 2
+SAVE_MAGIC = b'{"format": "dungeon-save"'
+V1_MAGIC = b'{"type": "header"'  # Journals written before the metadata header existed
+SETTING_MAGIC = b'{"type": "setting"'
+HEADER_BLOCK = 4096  # The header is a multiple of this many bytes
+HEADER_SLACK = 512  # Room for the header to grow in place (turn count, offsets, model name)
+META_FIELDS = ("model", "genre", "role", "name", "backstory", "temperature", "voice")
+
+INDEX_HEADER = struct.Struct("<4s16s")  # Magic, id of the journal it indexes
+INDEX_ENTRY = struct.Struct("<QIQ")  # Offset, length, live bytes up to and including this turn
+INDEX_MAGIC = b"TJX1"
+
+
+def is_journal(path) -> bool:
+    """True if path holds a save in the current format"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(SAVE_MAGIC)) == SAVE_MAGIC
+    except OSError:
+        return False
+
+
+def read_header(path) -> Optional[dict]:
+    """The metadata header of a save without reading any turns; None for other files"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(HEADER_BLOCK)
+            if not head.startswith(SAVE_MAGIC):
+                return None
+            while b"\n" not in head:
+                more = f.read(HEADER_BLOCK)
+                if not more:
+                    return None
+                head += more
+        return json.loads(head[:head.index(b"\n")])
+    except (OSError, ValueError):
+        return None
+
+
+def parse_setting(text: str) -> dict:
+    """Metadata from an adventure setting header, for saves made before it was stored"""
+    meta = {}
+    for line in text.split("\n"):
+        if line.startswith("Genre:"):
+            meta["genre"] = line.replace("Genre:", "").strip()
+        elif line.startswith("Player Character:"):
+            char_line = line.replace("Player Character:", "").strip()
+            if " the " in char_line:
+                name, role = char_line.split(" the ", 1)
+                meta["name"] = name.strip()
+                meta["role"] = role.strip()
+        elif line.startswith("Character Backstory:"):
+            meta["backstory"] = line.replace("Character Backstory:", "").strip()
+    return meta
+
+
+def migrate_save(path) -> bool:
+    """Upgrade an old save to the current format in place; False if there was nothing to do.
+
+    Old plain-text saves and first-format journals are read in full once,
+    their metadata is recovered from the setting text, and the original is
+    kept as <path>.bak.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(SAVE_MAGIC):
+        return False
+    if data.startswith(V1_MAGIC):
+        lines = data.split(b"\n")
+        log = TurnLog(header=json.loads(lines[0])["text"])
+        for line in lines[1:]:
+            if not line:
+                continue
+            record = json.loads(line)
+            if record["type"] == "turn":
+                while len(log) > record["n"]:
+                    log.pop()
+                log.append(record["speaker"], record["text"])
+            elif record["type"] == "truncate":
+                while len(log) > record["count"]:
+                    log.pop()
+    else:
+        log = TurnLog.from_text(data.decode("utf-8"))
+
+    os.replace(path, f"{path}.bak")
+    if os.path.exists(f"{path}.idx"):
+        os.remove(f"{path}.idx")
+    journal = TurnJournal(path)
+    journal.snapshot(log, log.header, 0, list(log), parse_setting(log.header))
+    journal.close()
+    return True
+
+
+def _encode(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _fsync(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class TurnJournal:
+    def __init__(self, path, fsync_every: int = 8, fsync_interval: float = 2.0,
+                 compact_min_bytes: int = 64 * 1024):
+        self.path = str(path)
+        self.index_path = self.path + ".idx"
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_min_bytes = compact_min_bytes
+        self.header = ""  # Adventure setting text
+        self.meta = {}  # Model, genre, role, name, backstory, temperature, voice
+        self.count = 0  # Live turns
+        self.live_bytes = 0  # Size of the live turn records
+        self.size = 0  # End of the file
+        self._header_bytes = HEADER_BLOCK
+        self._data_start = 0  # Offset of the first turn record
+        self._journal_id = ""
+        self._files = None  # (journal, index) while open
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._lock = threading.Lock()
+        # The TurnLog this journal mirrors, and its turns as last written,
+        # starting at absolute turn index _base
+        self._log: Optional[TurnLog] = None
+        self._written: List[Turn] = []
+        self._base = 0
+
+    # ----- Opening -----
+    def _open(self) -> None:
+        """Open the existing save, rebuilding its index if it is missing or stale"""
+        if self._files is not None:
+            return
+        journal = open(self.path, "r+b")
+        try:
+            intact = self._read_sections(journal)
+            self.size = journal.seek(0, os.SEEK_END)
+            index = open(self.index_path, "r+b" if os.path.exists(self.index_path) else "w+b")
+        except Exception:
+            journal.close()
+            raise
+        self._files = (journal, index)
+        if not intact or not self._index_valid():
+            self._rebuild_index()
+
+    def _read_sections(self, journal) -> bool:
+        """Read the header and setting record; False if the header had to be recovered"""
+        try:
+            header = json.loads(journal.readline())
+            self._header_bytes = header["header_bytes"]
+            intact = True
+        except (ValueError, KeyError):
+            # A torn in-place header update: find the setting record, which
+            # starts at a block boundary and is never rewritten
+            header, intact = {}, False
+            self._header_bytes = HEADER_BLOCK
+            while True:
+                journal.seek(self._header_bytes)
+                magic = journal.read(len(SETTING_MAGIC))
+                if magic == SETTING_MAGIC:
+                    break
+                if len(magic) < len(SETTING_MAGIC):
+                    raise ValueError(f"{self.path} is not a readable save")
+                self._header_bytes += HEADER_BLOCK
+        journal.seek(self._header_bytes)
+        setting = json.loads(journal.readline())
+        self._data_start = journal.tell()
+        self._journal_id = setting["id"]
+        self.header = setting["text"]
+        self.meta = header.get("meta", setting.get("meta", {}))
+        return intact
+
+    def _index_valid(self) -> bool:
+        journal, index = self._files
+        journal.seek(self.size - 1)
+        if journal.read(1) != b"\n":
+            return False  # A record was cut short; replaying drops it
+        index.seek(0)
+        head = index.read(INDEX_HEADER.size)
+        if len(head) < INDEX_HEADER.size:
+            return False
+        magic, journal_id = INDEX_HEADER.unpack(head)
+        entries, partial = divmod(index.seek(0, os.SEEK_END) - INDEX_HEADER.size, INDEX_ENTRY.size)
+        if magic != INDEX_MAGIC or journal_id.decode("ascii") != self._journal_id or partial:
+            return False
+        self.count = entries
+        self.live_bytes = 0
+        if entries:
+            offset, length, self.live_bytes = self._entry(entries - 1)
+            if offset + length > self.size:
+                return False  # The index got ahead of the journal
+        return True
+
+    def _rebuild_index(self) -> None:
+        """Replay the journal to find the live turns and write a fresh index and header"""
+        journal, index = self._files
+        entries: List[Tuple[int, int]] = []
+        offset = self._data_start
+        journal.seek(offset)
+        for line in journal:
+            if not line.endswith(b"\n"):
+                break
+            record = json.loads(line)
+            if record["type"] == "turn":
+                del entries[record["n"]:]
+                entries.append((offset, len(line)))
+            elif record["type"] == "truncate":
+                del entries[record["count"]:]
+            offset += len(line)
+        journal.truncate(offset)
+        self.size = offset
+
+        index.seek(0)
+        index.truncate()
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, self._journal_id.encode("ascii")))
+        self.live_bytes = 0
+        for offset, length in entries:
+            self.live_bytes += length
+            index.write(INDEX_ENTRY.pack(offset, length, self.live_bytes))
+        self.count = len(entries)
+        self._write_header()
+        _fsync(journal)
+        _fsync(index)
+
+    def _entry(self, n: int) -> Tuple[int, int, int]:
+        index = self._files[1]
+        index.seek(INDEX_HEADER.size + n * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+
+    def _entries(self, start: int, stop: int) -> Iterator[Tuple[int, int, int]]:
+        index = self._files[1]
+        index.seek(INDEX_HEADER.size + start * INDEX_ENTRY.size)
+        return INDEX_ENTRY.iter_unpack(index.read(max(0, stop - start) * INDEX_ENTRY.size))
+
+    def _raw_records(self, start: int, stop: int) -> Iterator[bytes]:
+        """The stored bytes of live turns start..stop-1"""
+        journal = self._files[0]
+        for offset, length, _ in list(self._entries(start, stop)):
+            journal.seek(offset)
+            yield journal.read(length)
+
+    # ----- Header -----
+    def _header_fields(self) -> dict:
+        return {
+            "format": SAVE_FORMAT,
+            "version": SAVE_VERSION,
+            "id": self._journal_id,
+            "header_bytes": self._header_bytes,
+            "saved_at": time.time(),
+            "meta": self.meta,
+            "turns": self.count,
+            "offsets": {"setting": self._header_bytes, "turns": self._data_start, "end": self.size},
+        }
+
+    @staticmethod
+    def _encode_header(fields: dict) -> Optional[bytes]:
+        """The padded header block, or None if the fields no longer fit in it"""
+        data = json.dumps(fields, ensure_ascii=False).encode("utf-8")
+        if len(data) + 1 > fields["header_bytes"]:
+            return None
+        return data + b" " * (fields["header_bytes"] - len(data) - 1) + b"\n"
+
+    def _write_header(self) -> bool:
+        block = self._encode_header(self._header_fields())
+        if block is None:
+            return False
+        journal = self._files[0]
+        journal.seek(0)
+        journal.write(block)
+        return True
+
+    # ----- Loading -----
+    def read(self, last_turns: Optional[int] = None, since: Optional[int] = None) -> TurnLog:
+        """Load the setting and the newest last_turns turns (all when None).
+
+        Turns from index since on are loaded too, however many there are.
+        Older turns stay on disk; the returned log's dropped count says how
+        many were left out, and later saves through this journal keep them.
+        The save's metadata is in self.meta afterwards.
+        """
+        with self._lock:
+            self._open()
+            first = 0 if last_turns is None else max(0, self.count - last_turns)
+            if since is not None:
+                first = max(0, min(first, since))
+            log = TurnLog(header=self.header)
+            for raw in self._raw_records(first, self.count):
+                record = json.loads(raw)
+                log.append(record["speaker"], record["text"])
+            log.dropped = first
+            self._track(log, list(log))
+        return log
+
+    def _track(self, log: TurnLog, written: List[Turn]) -> None:
+        self._log = log
+        self._base = log.dropped
+        self._written = written
+
+    # ----- Saving -----
+    def plan_sync(self, turns: TurnLog, meta: dict,
+                  source: Optional["TurnJournal"] = None) -> Callable[[], None]:
+        """Work out what a save of turns and meta must write; the returned function writes it.
+
+        Only the planning looks at turns, so the writing may run on another
+        thread. A log this journal does not already mirror is written as a
+        full snapshot; source supplies the turns a partly loaded log left on
+        disk.
+        """
+        meta = dict(meta)
+        if turns is not self._log or turns.dropped != self._base or turns.header != self.header:
+            header, base, new = turns.header, turns.dropped, list(turns)
+            if base and source is None and turns is self._log:
+                source = self
+            return lambda: self.snapshot(turns, header, base, new, meta, source)
+
+        # Redo only ever changes the end of the log; find where it starts to differ
+        end = turns.dropped + len(turns)
+        keep = min(self._base + len(self._written), end)
+        while keep > self._base and self._written[keep - 1 - self._base] is not turns[keep - 1 - turns.dropped]:
+            keep -= 1
+        new = list(islice(reversed(turns), end - keep))[::-1]
+
+        def write():
+            with self._lock:
+                self._open()
+                if keep < self.count:
+                    self._truncate(keep)
+                for turn in new:
+                    self._append(turn)
+                del self._written[keep - self._base:]
+                self._written.extend(new)
+                self.meta = meta
+                dead_bytes = self.size - self._data_start - self.live_bytes
+                if dead_bytes > max(self.live_bytes, self.compact_min_bytes) or not self._write_header():
+                    self._compact()  # Also gives an outgrown header more room
+                    return
+                self._files[0].flush()
+                self._files[1].flush()
+                self._maybe_fsync()
+        return write
+
+    def sync(self, turns: TurnLog, meta: dict, source: Optional["TurnJournal"] = None) -> None:
+        self.plan_sync(turns, meta, source)()
+
+    def _append(self, turn: Turn) -> None:
+        journal, index = self._files
+        data = _encode({"type": "turn", "n": self.count, "speaker": turn.speaker, "text": turn.text})
+        journal.seek(self.size)
+        journal.write(data)
+        self.live_bytes += len(data)
+        index.seek(INDEX_HEADER.size + self.count * INDEX_ENTRY.size)
+        index.write(INDEX_ENTRY.pack(self.size, len(data), self.live_bytes))
+        self.size += len(data)
+        self.count += 1
+        self._unsynced += 1
+
+    def _truncate(self, count: int) -> None:
+        journal, index = self._files
+        data = _encode({"type": "truncate", "count": count})
+        journal.seek(self.size)
+        journal.write(data)
+        self.size += len(data)
+        self.live_bytes = self._entry(count - 1)[2] if count else 0
+        index.truncate(INDEX_HEADER.size + count * INDEX_ENTRY.size)
+        self.count = count
+        self._unsynced += 1
+
+    def _maybe_fsync(self, force: bool = False) -> None:
+        if not self._unsynced or self._files is None:
+            return
+        if force or self._unsynced >= self.fsync_every or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            for f in self._files:
+                _fsync(f)
+            self._unsynced = 0
+            self._last_fsync = time.monotonic()
+
+    # ----- Snapshots -----
+    def snapshot(self, log: TurnLog, header: str, base: int, turns: List[Turn], meta: dict,
+                 source: Optional["TurnJournal"] = None) -> None:
+        """Replace the save with header and turns; the first base turns are copied from source"""
+        if base and source is None:
+            raise ValueError("Turns before the loaded ones are needed to write a new save")
+        if source is self:
+            with self._lock:
+                self._open()
+                older = list(self._raw_records(0, base))
+        elif base:
+            with source._lock:
+                source._open()
+                older = list(source._raw_records(0, base))
+        else:
+            older = []
+        records = older + [
+            _encode({"type": "turn", "n": base + i, "speaker": turn.speaker, "text": turn.text})
+            for i, turn in enumerate(turns)
+        ]
+        with self._lock:
+            self._replace(header, meta, records)
+            self._track(log, list(turns))
+
+    def _compact(self) -> None:
+        """Rewrite the save with only its live turns (lock held)"""
+        self._replace(self.header, self.meta, list(self._raw_records(0, self.count)))
+
+    def _replace(self, header: str, meta: dict, records: List[bytes]) -> None:
+        self._journal_id = secrets.token_hex(8)
+        self.header = header
+        self.meta = meta
+        setting = _encode({"type": "setting", "id": self._journal_id, "meta": meta, "text": header})
+        self.count = len(records)
+        self.live_bytes = sum(len(data) for data in records)
+
+        # Size the header block for its fields plus room to grow in place
+        self._header_bytes = HEADER_BLOCK
+        while True:
+            self._data_start = self._header_bytes + len(setting)
+            self.size = self._data_start + self.live_bytes
+            needed = len(json.dumps(self._header_fields(), ensure_ascii=False).encode("utf-8")) + HEADER_SLACK
+            if needed <= self._header_bytes:
+                break
+            self._header_bytes += HEADER_BLOCK
+        block = self._encode_header(self._header_fields())
+
+        tmp_journal, tmp_index = self.path + ".tmp", self.index_path + ".tmp"
+        with open(tmp_journal, "wb") as journal, open(tmp_index, "wb") as index:
+            journal.write(block)
+            journal.write(setting)
+            index.write(INDEX_HEADER.pack(INDEX_MAGIC, self._journal_id.encode("ascii")))
+            live_bytes = 0
+            for data in records:
+                live_bytes += len(data)
+                index.write(INDEX_ENTRY.pack(journal.tell(), len(data), live_bytes))
+                journal.write(data)
+            _fsync(journal)
+            _fsync(index)
+        self._close_files()
+        # A crash between the two leaves an index for the old journal, which
+        # _open() notices by its id and rebuilds
+        os.replace(tmp_journal, self.path)
+        os.replace(tmp_index, self.index_path)
+        self._open()
+
+    # ----- Closing -----
+    def _close_files(self) -> None:
+        if self._files is not None:
+            self._maybe_fsync(force=True)
+            for f in self._files:
+                f.close()
+            self._files = None
+
+    def close(self) -> None:
+        """fsync anything pending and close the files; the journal reopens on next use"""
+        with self._lock:
+            self._close_files()
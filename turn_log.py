@@ -0,0 +1,208 @@
+"""Structured conversation store shared by main.py and dungeonaigui.py.
+
+The story used to live in one ever-growing string that was rebuilt with +=
+and searched with rfind() to find the last exchange. TurnLog keeps the
+adventure setting header and a deque of Turn records instead, so appending,
+undoing, trimming and looking up the last reply never scan the whole story.
+The plain-text rendering is identical to the old conversation string, which
+keeps existing save files loadable.
+"""
+from collections import deque
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+
+PLAYER = "Player"
+DUNGEON_MASTER = "Dungeon Master"
+SPEAKERS = (PLAYER, DUNGEON_MASTER)
+
+
+class Turn:
+    """One line of the story, spoken by the player or the Dungeon Master"""
+    __slots__ = ("speaker", "text")
+
+    def __init__(self, speaker: str, text: str):
+        self.speaker = speaker
+        self.text = text
+
+    def render(self) -> str:
+        return f"{self.speaker}: {self.text}"
+
+    def __len__(self) -> int:
+        return len(self.speaker) + 2 + len(self.text)
+
+    def __repr__(self) -> str:
+        return f"Turn({self.speaker!r}, {self.text[:30]!r})"
+
+
+class TurnLog:
+    """Adventure setting header plus an ordered log of turns"""
+
+    def __init__(self, header: str = ""):
+        self.header = header
+        self._turns = deque()
+        self._chars = 0  # Characters in all rendered turns, without separators
+        self._player_turns = 0
+        self._rendered = None  # Cached render() result, reset on every change
+        self.dropped = 0  # Number of turns trimmed from the front
+
+    # ----- Mutation -----
+    def _count(self, turn: Turn, sign: int) -> None:
+        self._chars += sign * len(turn)
+        if turn.speaker == PLAYER:
+            self._player_turns += sign
+
+    def append(self, speaker: str, text: str) -> Turn:
+        turn = Turn(speaker, text.strip())
+        self._turns.append(turn)
+        self._count(turn, 1)
+        if self._rendered is not None:
+            separator = "\n" if len(self._turns) > 1 else ""
+            self._rendered += separator + turn.render()
+        return turn
+
+    def add_player(self, text: str) -> Turn:
+        return self.append(PLAYER, text)
+
+    def add_dm(self, text: str) -> Turn:
+        return self.append(DUNGEON_MASTER, text)
+
+    def pop(self) -> Optional[Turn]:
+        """Remove and return the newest turn"""
+        if not self._turns:
+            return None
+        turn = self._turns.pop()
+        self._count(turn, -1)
+        self._rendered = None
+        return turn
+
+    def pop_exchange(self) -> Tuple[bool, str, str]:
+        """Remove the last player input and the DM reply that followed it"""
+        if len(self._turns) < 2:
+            return False, "", ""
+        if self._turns[-1].speaker != DUNGEON_MASTER or self._turns[-2].speaker != PLAYER:
+            return False, "", ""
+        dm_turn = self.pop()
+        player_turn = self.pop()
+        return True, player_turn.text, dm_turn.text
+
+    def trim(self, keep_last: int) -> int:
+        """Drop the oldest turns so at most keep_last remain; returns how many were dropped"""
+        removed = 0
+        while len(self._turns) > keep_last:
+            turn = self._turns.popleft()
+            self._count(turn, -1)
+            removed += 1
+        if removed:
+            self.dropped += removed
+            self._rendered = None
+        return removed
+
+    def clear(self, header: str = "") -> None:
+        self.header = header
+        self._turns.clear()
+        self._chars = 0
+        self._player_turns = 0
+        self._rendered = None
+        self.dropped = 0
+
+    # ----- Queries -----
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def __iter__(self) -> Iterator[Turn]:
+        return iter(self._turns)
+
+    def __reversed__(self) -> Iterator[Turn]:
+        return reversed(self._turns)
+
+    def __getitem__(self, index: int) -> Turn:
+        return self._turns[index]
+
+    def between(self, start: int, stop: int) -> List[Turn]:
+        """Turns from index start up to (not including) stop"""
+        return list(islice(self._turns, start, stop))
+
+    def recent(self, count: int) -> List[Turn]:
+        """The newest count turns, oldest first"""
+        return list(islice(self._turns, max(0, len(self._turns) - count), None))
+
+    def last_text(self, speaker: str) -> str:
+        # Turns alternate, so this only ever looks at the last couple of entries
+        for turn in reversed(self._turns):
+            if turn.speaker == speaker:
+                return turn.text
+        return ""
+
+    @property
+    def last_reply(self) -> str:
+        return self.last_text(DUNGEON_MASTER)
+
+    @property
+    def last_player_input(self) -> str:
+        return self.last_text(PLAYER)
+
+    @property
+    def player_turn_count(self) -> int:
+        return self._player_turns
+
+    @property
+    def char_count(self) -> int:
+        """Length of to_text() without building it"""
+        separators = max(0, len(self._turns) - 1)
+        return len(self.header) + self._chars + separators
+
+    # ----- Rendering -----
+    def render(self) -> str:
+        """The whole story as text, in the original conversation format"""
+        if self._rendered is None:
+            self._rendered = "\n".join(turn.render() for turn in self._turns)
+        return self.header + self._rendered
+
+    def render_prompt(self, player_input: Optional[str] = None, start: int = 0) -> str:
+        """The story so far, ending with an open Dungeon Master line to complete.
+
+        Turns before index start are left out; the header is always kept.
+        """
+        if start <= 0:
+            text = self.render()
+        else:
+            text = self.header + "\n".join(turn.render() for turn in islice(self._turns, start, None))
+        if start < len(self._turns):
+            text += "\n"
+        if player_input is not None:
+            text += f"{PLAYER}: {player_input}\n"
+        return text + f"{DUNGEON_MASTER}:"
+
+    def to_text(self) -> str:
+        return self.render()
+
+    @classmethod
+    def from_text(cls, text: str) -> "TurnLog":
+        """Parse a conversation string (e.g. an old save file) into a TurnLog.
+
+        Only lines that start with a speaker label begin a new turn; any other
+        line continues the previous turn, so replies that merely mention
+        "Player:" or "Dungeon Master:" are kept intact.
+        """
+        log = cls()
+        header_lines = []
+        current = None
+
+        for line in text.split("\n"):
+            speaker = next((s for s in SPEAKERS if line.startswith(f"{s}:")), None)
+            if speaker:
+                if current:
+                    log.append(*current)
+                current = [speaker, line[len(speaker) + 1:].strip()]
+            elif current:
+                current[1] += "\n" + line
+            else:
+                header_lines.append(line)
+
+        if current:
+            log.append(*current)
+
+        log.header = "\n".join(header_lines)
+        if header_lines and log._turns:
+            log.header += "\n"
+        return log
@@ -0,0 +1,238 @@
+"""Persistent index of the AllTalk voices, kept up to date incrementally.
+
+The setup dialog used to walk five hardcoded folders (a Windows one
+included) with iterdir() every time it opened, then mixed in default voice
+names whether or not they existed. VoiceLibrary keeps one VoiceInfo per
+voice file (duration, sample rate and a fingerprint of its first seconds of
+audio) in memory and in cache_path, so the voice picker is filled from the
+last run at once. refresh() only lists a folder again when its mtime
+changed, and only re-reads a file when its size or mtime did.
+
+When AllTalk answers on voices_url its list is what AllTalk can actually
+speak with, so it is used in place of the local scan; the last list it
+sent is kept in the cache for when it is down.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import wave
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from http_client import get_client
+from tts_pipeline import ALLTALK_SERVICE
+
+VOICE_EXTENSIONS = (".wav", ".mp3", ".ogg", ".flac")
+DEFAULT_VOICE_DIRS = [
+    "voice for tts",
+    "voices",
+    "alltalk_tts/voices",
+    "~/alltalk_tts/voices",
+    "/opt/alltalk_tts/voices",
+] + (["C:/Program Files/alltalk_tts/voices"] if os.name == "nt" else [])
+FINGERPRINT_SECONDS = 3  # Audio hashed into a voice's fingerprint
+FINGERPRINT_BYTES = 256 * 1024  # Bytes hashed for formats the wave module cannot read
+
+
+@dataclass
+class VoiceInfo:
+    name: str  # File name, as AllTalk expects it
+    path: str = ""  # "" for voices only AllTalk knows about
+    duration: float = 0.0  # Seconds; 0 if unknown
+    sample_rate: int = 0
+    fingerprint: str = ""  # Same audio under two names has the same fingerprint
+    mtime_ns: int = 0
+    size: int = 0
+
+    def describe(self) -> str:
+        parts = []
+        if self.duration:
+            parts.append(f"{self.duration:.1f} s")
+        if self.sample_rate:
+            parts.append(f"{self.sample_rate} Hz")
+        parts.append(self.path or "on the AllTalk server")
+        return ", ".join(parts)
+
+
+def read_voice(path: str, stat: os.stat_result) -> VoiceInfo:
+    """Describe a voice file from its WAV header and first seconds of audio"""
+    info = VoiceInfo(os.path.basename(path), path, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    digest = hashlib.blake2b(digest_size=8)
+    try:
+        with wave.open(path, "rb") as f:
+            info.sample_rate = f.getframerate()
+            info.duration = f.getnframes() / info.sample_rate if info.sample_rate else 0.0
+            digest.update(f.readframes(info.sample_rate * FINGERPRINT_SECONDS))
+    except (wave.Error, EOFError):
+        with open(path, "rb") as f:  # MP3, OGG, FLAC or an unusual WAV
+            digest.update(f.read(FINGERPRINT_BYTES))
+    info.fingerprint = digest.hexdigest()
+    return info
+
+
+class VoiceLibrary:
+    def __init__(self, directories=None, voices_url: Optional[str] = None, cache_path: Optional[str] = None,
+                 health=None, logger=None):
+        self.directories = [os.path.normpath(os.path.expanduser(str(d))) for d in (directories or DEFAULT_VOICE_DIRS)]
+        self.voices_url = voices_url
+        self.cache_path = cache_path
+        self.health = health  # Skips asking AllTalk while it is known to be down
+        self.logger = logger
+        self._files: Dict[str, VoiceInfo] = {}  # By path
+        self._dir_mtimes: Dict[str, int] = {}  # mtime_ns of each folder when it was last listed
+        self._remote: Optional[List[str]] = None  # AllTalk's list as last received
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._load_cache()
+
+    # ----- Reading -----
+    def cached(self) -> List[VoiceInfo]:
+        """Voices as last seen, without touching the disk or AllTalk"""
+        with self._lock:
+            order = {directory: i for i, directory in enumerate(self.directories)}
+            by_name = {}
+            for info in sorted(self._files.values(), key=lambda info: (order.get(os.path.dirname(info.path), 0), info.path)):
+                by_name.setdefault(info.name, info)  # Listed once, from the first folder that has it
+            if self._remote is None:
+                return sorted(by_name.values(), key=lambda info: info.name.lower())
+            return [by_name.get(name) or VoiceInfo(name) for name in sorted(self._remote, key=str.lower)]
+
+    def names(self) -> List[str]:
+        return [info.name for info in self.cached()]
+
+    def get(self, name: str) -> Optional[VoiceInfo]:
+        return next((info for info in self.cached() if info.name == name), None)
+
+    # ----- Refreshing -----
+    def refresh(self) -> int:
+        """Pick up added, changed and removed voice files and ask AllTalk for its list.
+
+        Returns how many files were read.
+        """
+        with self._refreshing:
+            read = self._scan()
+            remote = self._fetch_remote()
+            with self._lock:
+                if remote is not None:
+                    self._remote = remote
+            self._save_cache()
+            return read
+
+    def _scan(self) -> int:
+        with self._lock:
+            files = dict(self._files)
+            dir_mtimes = dict(self._dir_mtimes)
+        read = 0
+        for directory in self.directories:
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                dir_mtimes.pop(directory, None)
+                for path in [path for path in files if os.path.dirname(path) == directory]:
+                    del files[path]
+                continue
+            if dir_mtimes.get(directory) == mtime_ns:
+                # Nothing added or removed; only files rewritten in place can have changed
+                paths = [path for path in files if os.path.dirname(path) == directory]
+            else:
+                try:
+                    with os.scandir(directory) as entries:
+                        paths = [
+                            entry.path for entry in entries
+                            if entry.name.lower().endswith(VOICE_EXTENSIONS) and entry.is_file()
+                        ]
+                except OSError as e:
+                    if self.logger is not None:
+                        self.logger.warning("Could not list voice folder", e, path=directory)
+                    continue
+                for path in [path for path in files if os.path.dirname(path) == directory]:
+                    if path not in paths:
+                        del files[path]
+                dir_mtimes[directory] = mtime_ns
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                    known = files.get(path)
+                    if known is None or (known.mtime_ns, known.size) != (stat.st_mtime_ns, stat.st_size):
+                        files[path] = read_voice(path, stat)
+                        read += 1
+                except OSError as e:
+                    files.pop(path, None)
+                    if self.logger is not None:
+                        self.logger.warning("Could not read voice file", e, path=path)
+        with self._lock:
+            self._files = files
+            self._dir_mtimes = dir_mtimes
+        return read
+
+    def _fetch_remote(self) -> Optional[List[str]]:
+        """AllTalk's voice list, or None if it could not be asked"""
+        if not self.voices_url or (self.health is not None and self.health.is_down(ALLTALK_SERVICE)):
+            return None
+        try:
+            response = get_client().get("voices", self.voices_url)
+            response.raise_for_status()
+            voices = response.json().get("voices")
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.warning("Could not list AllTalk voices", e, url=self.voices_url)
+            return None
+        return [str(name) for name in voices] if isinstance(voices, list) else None
+
+    # ----- Cache file -----
+    def _load_cache(self) -> None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._files = {entry["path"]: VoiceInfo(**entry) for entry in data.get("files", [])}
+            self._dir_mtimes = data.get("dir_mtimes", {})
+            if data.get("voices_url") == self.voices_url:
+                self._remote = data.get("remote")
+        except Exception as e:
+            self._files, self._dir_mtimes = {}, {}
+            if self.logger is not None:
+                self.logger.warning("Ignoring unreadable voice index", e, path=self.cache_path)
+
+    def _save_cache(self) -> None:
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = {
+                "saved_at": time.time(),
+                "voices_url": self.voices_url,
+                "remote": self._remote,
+                "dir_mtimes": self._dir_mtimes,
+                "files": [asdict(info) for info in self._files.values()],
+            }
+        temp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            if self.logger is not None:
+                self.logger.warning("Could not write voice index", e, path=self.cache_path)
+
+
+_library: Optional[VoiceLibrary] = None
+_library_lock = threading.Lock()
+
+
+def configure_library(**kwargs) -> VoiceLibrary:
+    """Replace the shared library, e.g. with the folders and URLs from a front-end's CONFIG"""
+    global _library
+    with _library_lock:
+        _library = VoiceLibrary(**kwargs)
+        return _library
+
+
+def get_library() -> VoiceLibrary:
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = VoiceLibrary()
+        return _library